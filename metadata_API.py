@@ -4,13 +4,17 @@
 
 import pickle
 import metadata_pb2
-from datetime import datetime
-import pytz
 import json
 import pickle
 from operator import attrgetter
 from google.protobuf.json_format import MessageToDict
 from google.protobuf.json_format import ParseDict
+from metadata_cache import parse_serialized_cached, parse_json_cached
+from metadata_json_stream import parse_json_stream
+from metadata_time import local_now, session_epoch
+from metadata_proxy import MessageProxy
+from metadata_generated import (fill_acquisition, default_session, default_acquisition, default_neural_probe,
+                                default_sensor, default_stimulus)
 
 
 __author__ = "Pablo M. Tostado"
@@ -31,21 +35,28 @@ class ProtobufMetadata:
         
         # Create SESSION protobuff metadata
         self.sess = metadata_pb2.Session()
+        now = local_now()
         # string: e.g. 2021-03-10
-        self.sess.date = str(datetime.now(pytz.timezone('US/Pacific')).date())
+        self.sess.date = str(now.date())
         # string: e.g. 14:42:01.754603 (microseconds precision)
-        self.sess.time = str(datetime.now(pytz.timezone('US/Pacific')).time())
+        self.sess.time = str(now.time())
         self.default_bird_metadata()
         
     def update_date_and_time(self):
         """ Updates the date, time and sess_uid fields in the proto message """
         
-        self.sess.date = str(datetime.now(pytz.timezone('US/Pacific')).date())
-        self.sess.time = str(datetime.now(pytz.timezone('US/Pacific')).time())
+        now = local_now()   # a single clock reading, so date and time never straddle midnight
+        self.sess.date = str(now.date())
+        self.sess.time = str(now.time())
         self.sess.sess_uid = self.sess.Condition.keys()[
                                  self.sess.condition] + '-' + self.sess.bird_uid + '-' + self.sess.date + '-' + self.sess.time  # string: e.g. habituation_birdID_date_time
 
     
+    def epoch(self):
+        """ Canonical moment of the session: microseconds since 1970-01-01 UTC (see metadata_time) """
+
+        return session_epoch(self.sess)
+
     def delete_attribute(self, metadata_object, attribute):
         """ Deletes an attribute from the proto message
         
@@ -67,14 +78,13 @@ class ProtobufMetadata:
         
         Parameters
         ----------
-        bird_dict : dictionary
-            Dictionary from which to parse bird metadata
+        bird_dict : dictionary or metadata_pb2.Session
+            Dictionary (or session, read through a metadata_proxy.MessageProxy) from which to parse bird metadata
         """
         
-        # If input is a metadata object instead of a dictionary, 
+        # If input is a metadata object instead of a dictionary, read its fields through a lazy dictionary view
         if type(bird_dict) == metadata_pb2.Session:
-            bird_dict = MessageToDict(bird_dict, including_default_value_fields=True, preserving_proto_field_name=True, 
-                                 use_integers_for_enums=False, descriptor_pool=None, float_precision=None)
+            bird_dict = MessageProxy(bird_dict)
         
         if 'bird_type' in bird_dict:  # UNKNOWN_BIRDTYPE(0), ZEBRA(1), STARLING(2), BENGALESE(3)
             if bird_dict['bird_type'] == 'STARLING':
@@ -124,95 +134,17 @@ class ProtobufMetadata:
             'dummy_implant_date']  # string: e.g. 2021-03-10
         if 'box' in bird_dict: self.sess.box = bird_dict['box']  # string: e.g. passaro1, cuervecito3, shoox
         if 'details' in bird_dict:
-            for det in bird_dict['details']: self.sess.details.append(det)  # repeated string: (Any additional info)
+            # list(): with a proxy of self.sess, the loop would otherwise iterate over the field it extends
+            for det in list(bird_dict['details']): self.sess.details.append(det)  # repeated string: (Any additional info)
 
         self.sess.sess_uid = self.sess.Condition.keys()[
-                                 self.sess.condition] + '-' + self.sess.bird_uid + '-' + datetime.now(
-            pytz.timezone('US/Pacific')).strftime("%Y%m%d-%H:%M:%S")  # string: e.g. habituation_birdID_date_time
+                                 self.sess.condition] + '-' + self.sess.bird_uid + '-' + local_now().strftime("%Y%m%d-%H:%M:%S")  # string: e.g. habituation_birdID_date_time
 
     def __read_acquisition_metadata(self, acquisition_dict):
         """ Private method to iterate over acquisitions when parsing a dictionary"""
         
-        acquisition = self.sess.acquisitions.add()
-        if 'acquisition_hardware' in acquisition_dict: acquisition.acquisition_hardware = acquisition_dict[
-            'acquisition_hardware']  # openephys, intan, spikeglx, uma8, raspi, any custom amp
-        if 'acquisition_software' in acquisition_dict: acquisition.acquisition_software = acquisition_dict[
-            'acquisition_software']  # openephys, openephys++, spikeglx, alsa, vlc
-        # Iterate over Sensors
-        if 'sensors' in acquisition_dict:
-            for sensor_dict in acquisition_dict['sensors']:
-                sensor = acquisition.sensors.add()
-                if 'acquisition_signal' in sensor_dict: sensor.acquisition_signal = sensor_dict[
-                    'acquisition_signal']  # audio, audio, pressure, sync, emg, video
-                if 'manufacturer' in sensor_dict: sensor.manufacturer = sensor_dict[
-                    'manufacturer']  # miniDSP, earthworks, fujikura, inhouse, inhouse
-                if 'model' in sensor_dict: sensor.model = sensor_dict[
-                    'model']  # uma8, m30, fhm-20, uma8_sync, emg_amp_inhouse
-                if 'serial_number' in sensor_dict: sensor.serial_number = sensor_dict[
-                    'serial_number']  # '', '', '', uma_syn_001, emg_amp_001
-                if 'signal_name' in sensor_dict: sensor.signal_name = sensor_dict[
-                    'signal_name']  # uma_syn_001, pressure, syn_uma8, emg, syn_stim, stim, etc.
-                if 'headstage' in sensor_dict: sensor.headstage = sensor_dict[
-                    'headstage']  # '', '', intan32, ", intan32
-                if 'channel_group' in sensor_dict: sensor.channel_group = sensor_dict[
-                    'channel_group']  # '', AIN, port_0, DIN, port_1
-                if 'channels' in sensor_dict: sensor.channels = sensor_dict[
-                    'channels']  # '', [0], [aux_0], [0], [aux_0, aux_1]
-                if 'locations' in sensor_dict: sensor.locations = sensor_dict[
-                    'locations']  # left, right, tracheal rings, muscles...
-                if 'details' in sensor_dict:
-                    for det in sensor_dict['details']: sensor.details.append(det)  # repeated string
-
-        # Iterate over Neural probes
-        if 'neuralprobes' in acquisition_dict:
-            for neural_probe_dict in acquisition_dict['neuralprobes']:
-                neural_probe = acquisition.neuralprobes.add()
-                if 'acquisition_signal' in neural_probe_dict: neural_probe.acquisition_signal = neural_probe_dict[
-                    'acquisition_signal']  # string: e.g. neural
-                if 'manufacturer' in neural_probe_dict: neural_probe.manufacturer = neural_probe_dict[
-                    'manufacturer']  # string: neuronexus, neuropixel, masmanidis, inhouse
-                if 'model' in neural_probe_dict: neural_probe.model = neural_probe_dict[
-                    'model']  # string: buzsaki32, neuropixels_1
-                if 'serial_number' in neural_probe_dict: neural_probe.serial_number = neural_probe_dict[
-                    'serial_number']  # string: U656
-                if 'num_channels' in neural_probe_dict: neural_probe.num_channels = neural_probe_dict[
-                    'num_channels']  # int32: 16, 32, 64, 384
-                if 'tip_depth_microns' in neural_probe_dict: neural_probe.tip_depth_microns = neural_probe_dict[
-                    'tip_depth_microns']  # float: depth of the tip of the probe
-                if 'implant_coordinates_microns' in neural_probe_dict: neural_probe.implant_coordinates_microns = \
-                    neural_probe_dict['implant_coordinates_microns']  # string: A/P, M/L, D/V
-                if 'hemisphere' in neural_probe_dict: neural_probe.hemisphere = neural_probe_dict[
-                    'hemisphere']  # string: left, right
-                if 'brain_nucleus' in neural_probe_dict:
-                    for bn in neural_probe_dict['brain_nucleus']: neural_probe.brain_nucleus.append(
-                        bn)  # repeated string [hvc], [hvc,ra], area_X
-                if 'headstage' in neural_probe_dict: neural_probe.headstage = neural_probe_dict[
-                    'headstage']  # string: e.g. H32
-                if 'channel_group' in neural_probe_dict: neural_probe.channel_group = neural_probe_dict[
-                    'channel_group']  # string: port_0, imec_0
-                if 'channels' in neural_probe_dict: neural_probe.channels = neural_probe_dict[
-                    'channels']  # string: e.g. 1-64,
-                if 'details' in neural_probe_dict:
-                    for det in neural_probe_dict['details']: neural_probe.details.append(det)  # repeated string
-
-        # Iterate over Stimuli
-        if 'stimuli' in acquisition_dict:
-            for stimulus_dict in acquisition_dict['stimuli']:
-                stimulus = acquisition.stimuli.add()
-                if 'stimulus_signal' in stimulus_dict: stimulus.stimulus_signal = stimulus_dict[
-                    'stimulus_signal']  # string: female, video, song_replay, neural_stim
-                if 'manufacturer' in stimulus_dict: stimulus.manufacturer = stimulus_dict[
-                    'manufacturer']  # string: '', inhouse, inhouse, neuronexus
-                if 'model' in stimulus_dict: stimulus.model = stimulus_dict[
-                    'model']  # string: '', '', '3 females in cage, buzsaki32
-                if 'serial_number' in stimulus_dict: stimulus.serial_number = stimulus_dict['serial_number']  #
-                if 'signal_name' in stimulus_dict: stimulus.signal_name = stimulus_dict['signal_name']
-                if 'channel_gropup' in stimulus_dict: stimulus.channel_gropup = stimulus_dict[
-                    'channel_gropup']  # string: AIN, port_0, DIN, port_1
-                if 'channels' in stimulus_dict: stimulus.channels = stimulus_dict[
-                    'channels']  # string: [0], [aux_0], [0], [aux_0, aux_1]
-                if 'details' in stimulus_dict:
-                    for det in stimulus_dict['details']: stimulus.details.append(det)  # repeated string
+        # Field by field assignments generated from metadata.proto (python metadata_codegen.py)
+        fill_acquisition(acquisition_dict, self.sess.acquisitions.add())
                         
     def read_aquisitions_metadata(self, acquisitions_dict):
         """ Parses a protobuf message dictionary or python dictionary and fills out the metadata corresponding to the acquisitions
@@ -240,20 +172,8 @@ class ProtobufMetadata:
             The name of the file without the extension
         """
         
-        self.sess.bird_type = self.sess.BirdType.UNKNOWN_BIRDTYPE
-        self.sess.bird_sex = self.sess.BirdSex.MALE
-        self.sess.Condition.UNKNOWN_CONDITION
-        self.sess.bird_uid = 'x_x00x00_00'
-        self.sess.testosterone = False
-        self.sess.testosterone_date = 'YYYY-MM-DD'
-        self.sess.dummy_weight = False
-        self.sess.dummy_weight_grams = 0
-        self.sess.dummy_weight_date = 'YYYY-MM-DD'
-        self.sess.dummy_tether = False
-        self.sess.dummy_tether_date = 'YYYY-MM-DD'
-        self.sess.dummy_implant = False
-        self.sess.dummy_implant_date = 'YYYY-MM-DD'
-        self.sess.box = '_'
+        # Values of default_bird_metadata.json, generated into metadata_generated (python metadata_codegen.py)
+        default_session(self.sess)
         self.sess.sess_uid = self.sess.Condition.keys()[
                                  self.sess.condition] + '-' + self.sess.bird_uid + '-' + self.sess.date + '-' + self.sess.time  # string: e.g. habituation_birdID_date_time
         
@@ -266,8 +186,7 @@ class ProtobufMetadata:
             The protobuf Acquisition object for which to set default values
         """
         
-        metadata_object.acquisition_hardware = 'hardware'
-        metadata_object.acquisition_software = 'software'
+        default_acquisition(metadata_object)
         
         
     def default_neural_probe_metadata(self, metadata_object):
@@ -279,18 +198,7 @@ class ProtobufMetadata:
             The protobuf Neural Probe object for which to set default values
         """
         
-        metadata_object.acquisition_signal = 'neural'
-        metadata_object.manufacturer = 'neuropixel'
-        metadata_object.model = 'neuropixel_1'
-        metadata_object.serial_number = 'Uxxx'
-        metadata_object.num_channels = 384
-        metadata_object.tip_depth_microns = 0
-        metadata_object.implant_coordinates_microns = '00 A/P, 00 M/L, 00 D/V'
-        metadata_object.hemisphere = 'none'
-        metadata_object.brain_nucleus.append("append repeated strings")
-        metadata_object.headstage = '_'
-        metadata_object.channel_group = 'imec X'
-        metadata_object.channels = '00-00'
+        default_neural_probe(metadata_object)
         
         
     def default_sensor_metadata(self, metadata_object):
@@ -302,15 +210,7 @@ class ProtobufMetadata:
             The protobuf Sensor object for which to set default values 
         """
         
-        metadata_object.acquisition_signal = '_'
-        metadata_object.manufacturer = '_'
-        metadata_object.model = '_'
-        metadata_object.serial_number = '_'
-        metadata_object.signal_name = '_'
-        metadata_object.headstage = '_'
-        metadata_object.channel_group = '_'
-        metadata_object.channels = '_'
-        metadata_object.locations = '_'
+        default_sensor(metadata_object)
         
     def default_stimulus_metadata(self, metadata_object):
         """ Set default values for a Stimulus metadata object
@@ -321,13 +221,7 @@ class ProtobufMetadata:
             The protobuf Stimulus object for which to set default values
         """
             
-        metadata_object.stimulus_signal = '_'
-        metadata_object.manufacturer = '_'
-        metadata_object.model = '_'
-        metadata_object.serial_number = '_'
-        metadata_object.signal_name = '_'
-        metadata_object.channel_gropup = '_'
-        metadata_object.channels = '_'
+        default_stimulus(metadata_object)
     
     '''Exporting & Loading Functions'''
     
@@ -344,15 +238,20 @@ class ProtobufMetadata:
         f.write(self.sess.SerializeToString())
         f.close()
 
-    def parse_serialized_metadata(self, filename):
+    def parse_serialized_metadata(self, filename, cache=False):
         """ Load metadata from serialized, binary file (.pb)
         
         Parameters
         ----------
         file_name : str
             The name of the file without the extension
+        cache : bool
+            Serve the file from the process-level cache of parsed files (see metadata_cache)
         """
         
+        if cache:
+            parse_serialized_cached(filename, self.sess)
+            return
         f = open(filename, "rb")
         self.sess.ParseFromString(f.read())
         f.close()
@@ -366,21 +265,30 @@ class ProtobufMetadata:
             The name of the file without the extension
         """
         
-        json_obj = MessageToDict(self.sess, including_default_value_fields=True, preserving_proto_field_name=True, 
-                                 use_integers_for_enums=False, descriptor_pool=None, float_precision=None)
+        json_obj = session_to_dict(self.sess)
         with open(file_name + '.json', 'w') as fj:
             json.dump(json_obj, fj, indent=5)
         fj.close()
         
-    def parse_metadata_from_json(self, filename):
+    def parse_metadata_from_json(self, filename, cache=False, stream=False):
         """ Load metadata from JSON file (.json)
         
         Parameters
         ----------
         file_name : str
             The name of the file without the extension
+        cache : bool
+            Serve the file from the process-level cache of parsed files (see metadata_cache)
+        stream : bool
+            Parse the file incrementally instead of loading the whole document first (see metadata_json_stream)
         """
         
+        if cache:
+            parse_json_cached(filename, self.sess)
+            return
+        if stream:
+            parse_json_stream(filename, self.sess)
+            return
         f = open(filename)
         json_dict = json.load(f)
         f.close()
@@ -390,3 +298,43 @@ class ProtobufMetadata:
         
 
 
+def session_to_dict(sess):
+    """ Convert a session to the dictionary written to .json metadata files (all fields, enums as names)
+
+    Parameters
+    ----------
+    sess : metadata_pb2.Session
+        Session to convert
+
+    Returns
+    -------
+    dict
+        JSON-serializable dictionary keyed by proto field names
+    """
+
+    return MessageToDict(sess, including_default_value_fields=True, preserving_proto_field_name=True,
+                         use_integers_for_enums=False, descriptor_pool=None, float_precision=None)
+
+
+def load_session(filename):
+    """ Load a single session from a serialized (.pb) or JSON (.json) metadata file
+
+    Parameters
+    ----------
+    filename : str
+        Path to the metadata file, including the extension
+
+    Returns
+    -------
+    metadata_pb2.Session
+        The parsed session
+    """
+
+    sess = metadata_pb2.Session()
+    if filename.endswith('.json'):
+        with open(filename) as f:
+            ParseDict(json.load(f), sess, ignore_unknown_fields=False, descriptor_pool=None)
+    else:
+        with open(filename, 'rb') as f:
+            sess.ParseFromString(f.read())
+    return sess
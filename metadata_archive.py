@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+
+"""Multi-session archive files for Birdsong Project metadata
+
+An archive is a single binary file holding many serialized Session messages:
+
+    MAGIC | record | record | ...
+
+where every record is framed as
+
+    uint32 payload length (little endian) | uint32 crc32 of payload | payload
+
+so that records can be appended, located by byte offset and verified without
+parsing the protobuf payload.
+"""
+
+import os
+import mmap
+import struct
+import zlib
+import metadata_pb2
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+ARCHIVE_MAGIC = b'BSMARCH1'                 # Birdsong Metadata ARCHive, format version 1
+RECORD_HEADER = struct.Struct('<II')        # payload length, crc32(payload)
+MAX_RECORD_SIZE = 64 * 1024 * 1024          # Sanity bound used to reject garbage lengths
+
+
+class ArchiveError(Exception):
+
+    """ Raised when an archive is malformed (bad magic, truncated or corrupted record) """
+
+    def __init__(self, message, offset=None):
+        super().__init__(message if offset is None else '%s (offset %d)' % (message, offset))
+        self.offset = offset
+
+
+def _check_magic(f, filename):
+    """ Private helper: validates the archive header of an open file positioned at 0 """
+
+    magic = f.read(len(ARCHIVE_MAGIC))
+    if magic != ARCHIVE_MAGIC:
+        raise ArchiveError('%s is not a session archive' % filename, 0)
+
+
+def is_archive(filename):
+    """ Check whether a file starts with the session archive header
+
+    Parameters
+    ----------
+    filename : str
+        Path to the file
+
+    Returns
+    -------
+    bool
+        True if the file is a session archive
+    """
+
+    with open(filename, 'rb') as f:
+        return f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+
+
+def _plausible_header(data, offset, size, max_length):
+    """ Private helper: True if a record header at offset has a length within max_length that fits in size """
+
+    if offset + RECORD_HEADER.size > size:
+        return False
+    length, _ = RECORD_HEADER.unpack_from(data, offset)
+    return length <= max_length and offset + RECORD_HEADER.size + length <= size
+
+
+def find_record(data, start, size, max_length=MAX_RECORD_SIZE):
+    """ Offset of the first valid non-empty record at or after start (used to resynchronize after damage)
+
+    A candidate must have a length within max_length, a plausible next header (or end exactly at size) and
+    a matching crc32, checked last. Empty records are skipped: eight zero bytes are a valid empty record,
+    so zero-filled damage would otherwise resynchronize every eight bytes.
+
+    Parameters
+    ----------
+    data : bytes, mmap.mmap or memoryview
+        Contents of the archive
+    start : int
+        First candidate offset
+    size : int
+        End of the records (len(data) for a whole archive)
+    max_length : int
+        Largest payload length accepted for a candidate, e.g. the largest valid record seen so far
+
+    Returns
+    -------
+    int
+        Offset of the record, size if there is none
+    """
+
+    max_length = min(max_length, MAX_RECORD_SIZE)
+    header = RECORD_HEADER.size
+    for candidate in range(start, size - header):
+        length, crc = RECORD_HEADER.unpack_from(data, candidate)
+        end = candidate + header + length
+        if not 0 < length <= max_length or end > size:
+            continue
+        if end != size and not _plausible_header(data, end, size, MAX_RECORD_SIZE):
+            continue
+        if zlib.crc32(data[candidate + header:end]) == crc:
+            return candidate
+    return size
+
+
+def _valid_end(f, file_size):
+    """ Private helper: returns the offset right after the last complete record (headers only, no crc check)
+
+    A record cut short by the end of the file is a torn write. A damaged record followed by valid records
+    is not: it raises ArchiveError instead of letting the caller truncate the valid records away.
+    """
+
+    offset = len(ARCHIVE_MAGIC)
+    largest = 0
+    while offset + RECORD_HEADER.size <= file_size:
+        f.seek(offset)
+        length, _ = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        end = offset + RECORD_HEADER.size + length
+        if length > MAX_RECORD_SIZE or end > file_size:
+            break
+        largest = max(largest, length)
+        offset = end
+    if offset < file_size:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            found = find_record(mm, offset + 1, file_size, largest or MAX_RECORD_SIZE)
+        if found < file_size:
+            raise ArchiveError('Damaged record followed by valid records at offset %d: salvage them with '
+                               'metadata_verify.repair_archive' % found, offset)
+    return offset
+
+
+class SessionArchiveWriter:
+
+    """ Append Session messages to an archive file
+
+    Opening an existing archive appends to it. A torn record left at the end of the file by an
+    interrupted writer is truncated away before new records are written; an archive damaged before its
+    last record raises ArchiveError (see metadata_verify.repair_archive).
+    """
+
+    def __init__(self, filename, truncate=False):
+
+        self.filename = filename
+        mode = 'w+b' if truncate or not os.path.exists(filename) else 'r+b'
+        self._f = open(filename, mode)
+        size = os.fstat(self._f.fileno()).st_size
+        if size == 0:
+            self._f.write(ARCHIVE_MAGIC)
+            self.offset = len(ARCHIVE_MAGIC)
+        else:
+            try:
+                _check_magic(self._f, filename)
+                self.offset = _valid_end(self._f, size)
+            except ArchiveError:
+                self._f.close()
+                raise
+            if self.offset != size:
+                self._f.truncate(self.offset)
+        self._f.seek(self.offset)
+
+    def append(self, session):
+        """ Append one session to the archive
+
+        Parameters
+        ----------
+        session : metadata_pb2.Session or bytes
+            Session message, or its already serialized bytes
+
+        Returns
+        -------
+        int
+            Byte offset of the new record, usable with read_archive_session
+        """
+
+        payload = session if isinstance(session, (bytes, bytearray, memoryview)) else session.SerializeToString()
+        if len(payload) > MAX_RECORD_SIZE:
+            raise ValueError('Session of %d bytes exceeds MAX_RECORD_SIZE (%d)' % (len(payload), MAX_RECORD_SIZE))
+        offset = self.offset
+        self._f.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._f.write(payload)
+        self.offset += RECORD_HEADER.size + len(payload)
+        return offset
+
+    def truncate(self, offset):
+        """ Discard every record written at or after the given offset
+
+        Parameters
+        ----------
+        offset : int
+            Record boundary to truncate the archive to
+        """
+
+        self._f.flush()
+        self._f.truncate(offset)
+        self._f.seek(offset)
+        self.offset = offset
+
+    def flush(self, fsync=False):
+        """ Flush buffered records to disk
+
+        Parameters
+        ----------
+        fsync : bool
+            Also force the operating system to commit the data to the device
+        """
+
+        self._f.flush()
+        if fsync:
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        """ Flush and close the archive """
+
+        if not self._f.closed:
+            self._f.flush()
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_archive_records(filename, start=None, stop=None, verify=True):
+    """ Iterate over the raw records of an archive
+
+    Parameters
+    ----------
+    filename : str
+        Path to the archive
+    start : int
+        Offset of the first record to read (defaults to the first record in the file)
+    stop : int
+        Stop before the record at this offset (defaults to the end of the file)
+    verify : bool
+        Check the crc32 of every payload
+
+    Yields
+    ------
+    (int, bytes)
+        Offset of the record and its serialized Session payload
+    """
+
+    with open(filename, 'rb') as f:
+        _check_magic(f, filename)
+        size = os.fstat(f.fileno()).st_size if stop is None else stop
+        offset = len(ARCHIVE_MAGIC) if start is None else start
+        f.seek(offset)
+        while offset < size:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                raise ArchiveError('Truncated record header', offset)
+            length, crc = RECORD_HEADER.unpack(header)
+            if length > MAX_RECORD_SIZE:
+                raise ArchiveError('Invalid record length %d' % length, offset)
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ArchiveError('Truncated record payload', offset)
+            if verify and zlib.crc32(payload) != crc:
+                raise ArchiveError('Checksum mismatch', offset)
+            yield offset, payload
+            offset += RECORD_HEADER.size + length
+
+
+def iter_archive_sessions(filename):
+    """ Iterate over the sessions stored in an archive
+
+    Parameters
+    ----------
+    filename : str
+        Path to the archive
+
+    Yields
+    ------
+    metadata_pb2.Session
+        One parsed session per record
+    """
+
+    for _, payload in iter_archive_records(filename):
+        sess = metadata_pb2.Session()
+        sess.ParseFromString(payload)
+        yield sess
+
+
+def archive_record_offsets(filename):
+    """ List the offsets of every record in an archive by walking the record headers (payloads are skipped)
+
+    Parameters
+    ----------
+    filename : str
+        Path to the archive
+
+    Returns
+    -------
+    list of int
+        Record offsets in file order
+    """
+
+    offsets = []
+    with open(filename, 'rb') as f:
+        _check_magic(f, filename)
+        size = os.fstat(f.fileno()).st_size
+        offset = len(ARCHIVE_MAGIC)
+        while offset < size:
+            f.seek(offset)
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                raise ArchiveError('Truncated record header', offset)
+            length, _ = RECORD_HEADER.unpack(header)
+            if length > MAX_RECORD_SIZE or offset + RECORD_HEADER.size + length > size:
+                raise ArchiveError('Truncated record payload', offset)
+            offsets.append(offset)
+            offset += RECORD_HEADER.size + length
+    return offsets
+
+
+def read_archive_record(f, offset, verify=True):
+    """ Read the raw payload of the record at a given offset from an open archive file
+
+    Parameters
+    ----------
+    f : file object
+        Archive opened in binary mode
+    offset : int
+        Offset of the record
+    verify : bool
+        Check the crc32 of the payload
+
+    Returns
+    -------
+    bytes
+        Serialized Session payload
+    """
+
+    f.seek(offset)
+    header = f.read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        raise ArchiveError('Truncated record header', offset)
+    length, crc = RECORD_HEADER.unpack(header)
+    payload = f.read(length)
+    if len(payload) < length:
+        raise ArchiveError('Truncated record payload', offset)
+    if verify and zlib.crc32(payload) != crc:
+        raise ArchiveError('Checksum mismatch', offset)
+    return payload
+
+
+def read_archive_session(filename, offset):
+    """ Load the session stored at a given offset of an archive
+
+    Parameters
+    ----------
+    filename : str
+        Path to the archive
+    offset : int
+        Offset of the record, as returned by SessionArchiveWriter.append or archive_record_offsets
+
+    Returns
+    -------
+    metadata_pb2.Session
+        The parsed session
+    """
+
+    with open(filename, 'rb') as f:
+        payload = read_archive_record(f, offset)
+    sess = metadata_pb2.Session()
+    sess.ParseFromString(payload)
+    return sess
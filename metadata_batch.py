@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+
+"""Batch construction of Birdsong Project sessions from tabular experiment plans
+
+A cohort planned in a spreadsheet has one row per session and one column per field. Instead of turning
+every row into a dictionary for its own ProtobufMetadata / read_bird_metadata, a BatchPlan resolves the
+columns against metadata.proto once (field path, value conversion) and then fills a copy of one template
+session per row. Tables can be CSV files, pandas DataFrames or lists of dictionaries.
+
+Columns are named after Session fields (bird_uid, condition, ...) or, for nested fields, after their path
+as written by metadata_generated validators, e.g. acquisitions[0].neuralprobes[0].serial_number. Cells are
+converted from text as a spreadsheet writes them: enum names (any case) or numbers, true/false/yes/no/1/0
+for bools, and ';'-separated lists for repeated fields (details, brain_nucleus). Empty cells keep the
+template value.
+
+Usage:
+    python metadata_batch.py PLAN.csv ARCHIVE [--acquisitions FILE.json] [--map COLUMN=FIELD ...] [--workers N]
+"""
+
+import os
+import re
+import csv
+import sys
+import time
+import json
+import argparse
+from collections import deque
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+import metadata_pb2
+from google.protobuf.descriptor import FieldDescriptor
+from metadata_archive import SessionArchiveWriter
+from metadata_generated import default_session, fill_session
+from metadata_time import local_now
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+CHUNK_SIZE = 500
+LIST_SEPARATOR = ';'
+
+_PATH_STEP = re.compile(r'(\w+)(?:\[(\d+)\])?$')
+_TRUE = {'true', 't', 'yes', 'y', '1'}
+_FALSE = {'false', 'f', 'no', 'n', '0'}
+_INT_TYPES = (FieldDescriptor.CPPTYPE_INT32, FieldDescriptor.CPPTYPE_INT64,
+              FieldDescriptor.CPPTYPE_UINT32, FieldDescriptor.CPPTYPE_UINT64)
+
+
+def _is_missing(value):
+    """ Private helper: empty cell (None, blank string or a pandas NaN) """
+
+    return value is None or value != value or (isinstance(value, str) and not value.strip())
+
+
+def _scalar_converter(field):
+    """ Private helper: function converting one cell value to a value of a non-message field """
+
+    if field.enum_type is not None:
+        numbers = {v.name: v.number for v in field.enum_type.values}
+
+        def convert(value):
+            if isinstance(value, str):
+                value = value.strip()
+                if value.upper() in numbers:
+                    return numbers[value.upper()]
+                if not value.lstrip('-').isdigit():
+                    raise ValueError('%r is not a %s' % (value, field.enum_type.name))
+            return int(value)
+        return convert
+    if field.cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+
+        def convert(value):
+            if isinstance(value, str):
+                text = value.strip().lower()
+                if text in _TRUE:
+                    return True
+                if text not in _FALSE:
+                    raise ValueError('%r is not a bool' % value)
+                return False
+            return bool(value)
+        return convert
+    if field.cpp_type in _INT_TYPES:
+        return lambda value: int(value.strip()) if isinstance(value, str) else int(value)
+    if field.cpp_type in (FieldDescriptor.CPPTYPE_FLOAT, FieldDescriptor.CPPTYPE_DOUBLE):
+        return float
+    return lambda value: value if isinstance(value, str) else str(value)
+
+
+def _resolve(path):
+    """ Private helper: [(field, index)] steps of a field path such as acquisitions[0].sensors[1].model """
+
+    desc = metadata_pb2.Session.DESCRIPTOR
+    steps = []
+    for i, part in enumerate(path.split('.')):
+        match = _PATH_STEP.match(part.strip())
+        field = desc.fields_by_name.get(match.group(1)) if match else None
+        if field is None:
+            raise KeyError('%s is not a Session field path' % path)
+        index = match.group(2)
+        if field.message_type is not None:
+            if field.label == field.LABEL_REPEATED and index is None:
+                raise KeyError('%s: element index of %s missing, e.g. %s[0]' % (path, field.name, field.name))
+            desc = field.message_type
+        elif index is not None or i != len(path.split('.')) - 1:
+            raise KeyError('%s: %s is not a message field' % (path, field.name))
+        steps.append((field, None if index is None else int(index)))
+    if steps[-1][0].message_type is not None:
+        raise KeyError('%s is a message, not a field that a cell can fill' % path)
+    return steps
+
+
+def _setter(path):
+    """ Private helper: function (session, cell value) setting the field at path """
+
+    steps = _resolve(path)
+    field = steps[-1][0]
+    convert = _scalar_converter(field)
+    parents = [(f.name, i) for f, i in steps[:-1]]
+    name = field.name
+
+    def target(sess):
+        msg = sess
+        for parent, index in parents:
+            container = getattr(msg, parent)
+            if index is None:
+                msg = container
+                continue
+            while len(container) <= index:
+                container.add()
+            msg = container[index]
+        return msg
+
+    if field.label == field.LABEL_REPEATED:
+        def set_value(sess, value):
+            values = value.split(LIST_SEPARATOR) if isinstance(value, str) else value
+            container = getattr(target(sess), name)
+            del container[:]
+            container.extend([convert(v) for v in values if not _is_missing(v)])
+    else:
+        def set_value(sess, value):
+            setattr(target(sess), name, convert(value))
+    return set_value
+
+
+class BatchPlan:
+
+    """ Column-to-field mapping of a table, resolved once and applied to every row
+
+    Parameters
+    ----------
+    columns : list of str
+        Column names of the table
+    mapping : dict
+        {column: field path} for columns not named after their field; None as field path ignores a column
+    acquisitions : dict
+        Acquisitions dictionary (as default_single_acquisition_metadata.json) every session starts with
+    ignore_unknown : bool
+        Ignore columns that are not field paths instead of raising KeyError
+    now : datetime.datetime
+        Creation moment of the batch (local_now() when None). Rows without a time get it, plus their row
+        index in microseconds so that the sess_uids of a batch never collide
+    """
+
+    def __init__(self, columns, mapping=None, acquisitions=None, ignore_unknown=False, now=None):
+
+        self.columns = list(columns)
+        self.mapping = dict(mapping or {})
+        self.ignore_unknown = ignore_unknown
+        self.now = local_now() if now is None else now
+
+        template = default_session(metadata_pb2.Session())
+        template.date = str(self.now.date())
+        if acquisitions is not None:
+            fill_session({'acquisitions': acquisitions.get('acquisitions', [])}, template)
+        self._template = template.SerializeToString()
+        self.fields = {}
+        for column in self.columns:
+            path = self.mapping.get(column, column)
+            if path is None:
+                continue
+            try:
+                _resolve(path)
+            except KeyError:
+                if not ignore_unknown:
+                    raise
+                continue
+            self.fields[column] = path
+        self._stamp_time = 'time' not in self.fields.values()
+        self._stamp_uid = 'sess_uid' not in self.fields.values()
+        self._compiled = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_compiled'] = None       # Closures are rebuilt in worker processes
+        return state
+
+    def _compile(self):
+        """ Private method: [(column index, column, setter)] of the mapped columns """
+
+        if self._compiled is None:
+            self._compiled = [(self.columns.index(column), column, _setter(path))
+                              for column, path in self.fields.items()]
+        return self._compiled
+
+    def build(self, row, index=0):
+        """ Session of one row
+
+        Parameters
+        ----------
+        row : sequence
+            Cell values in the order of the plan's columns
+        index : int
+            Row number in the table (used in error messages and to stamp the session time)
+
+        Returns
+        -------
+        metadata_pb2.Session
+        """
+
+        setters = self._compile()
+        sess = metadata_pb2.Session()
+        sess.ParseFromString(self._template)
+        for i, column, set_value in setters:
+            value = row[i] if i < len(row) else None
+            if _is_missing(value):
+                continue
+            try:
+                set_value(sess, value)
+            except (ValueError, TypeError) as e:
+                raise ValueError('row %d, column %r: %s' % (index, column, e)) from None
+        if self._stamp_time:
+            sess.time = str((self.now + timedelta(microseconds=index)).time())
+        if self._stamp_uid:
+            condition = sess.Condition.Name(sess.condition) if sess.condition in sess.Condition.values() \
+                else str(sess.condition)
+            sess.sess_uid = condition + '-' + sess.bird_uid + '-' + sess.date + '-' + sess.time
+        return sess
+
+
+'''Tables'''
+
+def read_table(table):
+    """ Columns and rows of a CSV file, pandas DataFrame or list of dictionaries
+
+    Parameters
+    ----------
+    table : str, text file object, pandas.DataFrame or iterable of dict
+        CSV path or open file (first line is the header), DataFrame, or one dictionary per row
+
+    Returns
+    -------
+    (list of str, iterator of sequences)
+        Column names, and the cell values of every row in column order
+    """
+
+    if isinstance(table, str):
+        f = open(table, newline='')
+        reader = csv.reader(f)
+        columns = [c.strip() for c in next(reader, [])]
+
+        def rows():
+            with f:
+                yield from reader
+        return columns, rows()
+    if hasattr(table, 'read'):
+        reader = csv.reader(table)
+        return [c.strip() for c in next(reader, [])], reader
+    if hasattr(table, 'itertuples') and hasattr(table, 'columns'):
+        # pandas DataFrame, without importing pandas
+        return [str(c) for c in table.columns], table.itertuples(index=False, name=None)
+    records = list(table)
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    return columns, ([record.get(c) for c in columns] for record in records)
+
+
+def iter_sessions(table, mapping=None, acquisitions=None, ignore_unknown=False):
+    """ Sessions of the rows of a table, built one at a time
+
+    Parameters
+    ----------
+    table : str, text file object, pandas.DataFrame or iterable of dict
+        Experiment plan (see read_table)
+    mapping, acquisitions, ignore_unknown
+        See BatchPlan
+
+    Yields
+    ------
+    metadata_pb2.Session
+    """
+
+    columns, rows = read_table(table)
+    plan = BatchPlan(columns, mapping, acquisitions, ignore_unknown)
+    for index, row in enumerate(rows):
+        yield plan.build(row, index)
+
+
+def build_sessions(table, mapping=None, acquisitions=None, ignore_unknown=False):
+    """ List of the sessions of the rows of a table (see iter_sessions) """
+
+    return list(iter_sessions(table, mapping, acquisitions, ignore_unknown))
+
+
+'''Archive writer'''
+
+def _chunks(rows, chunk_size):
+    """ Private helper: (index of the first row, list of rows) of consecutive chunks """
+
+    chunk, start = [], 0
+    for row in rows:
+        chunk.append(tuple(row))
+        if len(chunk) == chunk_size:
+            yield start, chunk
+            start += len(chunk)
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+def _build_chunk(plan, start, rows):
+    """ Private helper run in worker processes: serialized sessions of a chunk of rows """
+
+    return [plan.build(row, start + i).SerializeToString() for i, row in enumerate(rows)]
+
+
+def write_archive(table, archive, mapping=None, acquisitions=None, ignore_unknown=False, workers=None,
+                  chunk_size=CHUNK_SIZE):
+    """ Build the sessions of a table and append them to a session archive, in parallel chunks
+
+    Chunks of rows are built and serialized in worker processes; the calling process only appends the
+    records, in row order. At most two chunks per worker are in flight, so tables of any length are
+    written in bounded memory. If any row fails, the records written by this call are removed again.
+
+    Parameters
+    ----------
+    table : str, text file object, pandas.DataFrame or iterable of dict
+        Experiment plan (see read_table)
+    archive : str
+        Session archive to append to (created if needed)
+    mapping, acquisitions, ignore_unknown
+        See BatchPlan
+    workers : int
+        Worker processes (None uses every CPU, 1 builds in the calling process)
+    chunk_size : int
+        Rows per chunk
+
+    Returns
+    -------
+    dict
+        {'sessions', 'chunks', 'seconds', 'sessions_per_second', 'offset': offset of the first new record}
+    """
+
+    start_time = time.time()
+    columns, rows = read_table(table)
+    plan = BatchPlan(columns, mapping, acquisitions, ignore_unknown)
+    report = {'sessions': 0, 'chunks': 0}
+    writer = SessionArchiveWriter(archive)
+    report['offset'] = writer.offset
+    pool = None
+    try:
+        if workers == 1:
+            results = (_build_chunk(plan, start, chunk) for start, chunk in _chunks(rows, chunk_size))
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = _ordered_results(pool, plan, _chunks(rows, chunk_size), 2 * (workers or os.cpu_count()))
+        for payloads in results:
+            for payload in payloads:
+                writer.append(payload)
+            report['sessions'] += len(payloads)
+            report['chunks'] += 1
+    except BaseException:
+        writer.truncate(report['offset'])
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        writer.close()
+
+    seconds = report['seconds'] = time.time() - start_time
+    report['sessions_per_second'] = report['sessions'] / seconds if seconds else 0.0
+    return report
+
+
+def _ordered_results(pool, plan, chunks, window):
+    """ Private helper: results of _build_chunk over the chunks, in order, with at most window in flight """
+
+    pending = deque()
+    for start, chunk in chunks:
+        pending.append(pool.submit(_build_chunk, plan, start, chunk))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+'''Benchmark'''
+
+def benchmark_batch(n_rows=5000):
+    """ Time to build sessions of a plan row by row through ProtobufMetadata and with a BatchPlan
+
+    Returns
+    -------
+    dict
+        {method: seconds}
+    """
+
+    from metadata_API import ProtobufMetadata
+    rows = [{'bird_uid': 'z_r%02dg%02d_21' % (i % 100, i % 37), 'bird_type': 'ZEBRA', 'bird_sex': 'MALE',
+             'condition': 'CHRONIC', 'weight_grams': 15.5, 'box': 'cuervecito%d' % (i % 16), 'testosterone': False,
+             'details': ['cohort 3']} for i in range(n_rows)]
+
+    def one_at_a_time():
+        sessions = []
+        for row in rows:
+            metadata = ProtobufMetadata()
+            metadata.read_bird_metadata(row)
+            sessions.append(metadata.sess)
+        return sessions
+
+    results = {}
+    for name, build in [('ProtobufMetadata', one_at_a_time), ('BatchPlan', lambda: build_sessions(rows))]:
+        start = time.perf_counter()
+        build()
+        results[name] = time.perf_counter() - start
+    return results
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Build the sessions of an experiment plan into a session archive')
+    parser.add_argument('plan', help='CSV file, one row per session')
+    parser.add_argument('archive', help='session archive to append to')
+    parser.add_argument('--acquisitions', default=None, help='JSON file with the acquisitions of every session')
+    parser.add_argument('--map', action='append', default=[], metavar='COLUMN=FIELD',
+                        help='field path of a column (FIELD empty to ignore the column)')
+    parser.add_argument('--ignore-unknown', action='store_true', help='skip columns that are not fields')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    mapping = {}
+    for item in args.map:
+        column, _, path = item.partition('=')
+        mapping[column] = path or None
+    acquisitions = None
+    if args.acquisitions is not None:
+        with open(args.acquisitions) as f:
+            acquisitions = json.load(f)
+    report = write_archive(args.plan, args.archive, mapping, acquisitions, args.ignore_unknown, args.workers,
+                           args.chunk_size)
+    print('%(sessions)d sessions in %(chunks)d chunks, %(seconds).2f s (%(sessions_per_second).0f sessions/s)'
+          % report)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
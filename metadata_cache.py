@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+"""Caching of parsed Session messages for Birdsong Project metadata
+
+Besides the generic SessionLRU, this module keeps a process-level cache of parsed metadata files, keyed on
+(path, mtime, size) so that a modified file is parsed again. It sits in front of
+ProtobufMetadata.parse_serialized_metadata / parse_metadata_from_json (cache=True) and load_cached_session.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+import metadata_pb2
+from google.protobuf.json_format import ParseDict
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+class SessionLRU:
+
+    """ Thread-safe LRU cache of parsed Session messages, bounded by their serialized size (ByteSize)
+
+    Parameters
+    ----------
+    max_bytes : int
+        Total ByteSize() of the cached sessions above which the least recently used ones are evicted
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()       # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the cached value for a key (marking it as most recently used), or None """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """ Cache a value under a key, evicting least recently used entries to stay within max_bytes
+
+        Parameters
+        ----------
+        key : hashable
+            Cache key
+        value : metadata_pb2.Session or any object
+            Value to cache. It is stored as is, callers must not mutate it afterwards
+        size : int
+            Size accounted for the value. Defaults to value.ByteSize()
+        """
+
+        size = value.ByteSize() if size is None else size
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            self._evict()
+
+    def _evict(self):
+        """ Private method: drops least recently used entries until the cache fits in max_bytes (lock held) """
+
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_size
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        """ Change the size bound, evicting entries if the cache shrinks """
+
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """ Drop every cached value and reset the counters """
+
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        """ Return the cache counters as a dictionary (hits, misses, evictions, entries, nbytes, max_bytes) """
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'nbytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+'''Process-level cache of parsed metadata files'''
+
+_file_cache = SessionLRU(128 * 1024 * 1024)
+
+
+def _file_key(filename):
+    """ Private helper: cache key of a file, changes whenever the file is rewritten """
+
+    path = os.path.realpath(filename)
+    st = os.stat(path)
+    return path, st.st_mtime_ns, st.st_size
+
+
+def _cached_parse(filename, is_json):
+    """ Private helper: returns the cached (Session, json_fields) entry of a file, parsing it on a miss
+
+    json_fields holds the names of the top-level fields present in a JSON file (None for .pb files), needed to replay
+    ParseDict's merge semantics on a target message.
+    """
+
+    key = _file_key(filename) + (is_json,)
+    entry = _file_cache.get(key)
+    if entry is not None:
+        return entry
+    sess = metadata_pb2.Session()
+    if is_json:
+        with open(filename) as f:
+            json_dict = json.load(f)
+        ParseDict(json_dict, sess, ignore_unknown_fields=False, descriptor_pool=None)
+        by_json_name = {f.json_name: f.name for f in sess.DESCRIPTOR.fields}
+        fields = tuple(by_json_name.get(k, k) for k in json_dict)
+    else:
+        with open(filename, 'rb') as f:
+            sess.ParseFromString(f.read())
+        fields = None
+    entry = (sess, fields)
+    _file_cache.put(key, entry, size=sess.ByteSize())
+    return entry
+
+
+def load_cached_session(filename):
+    """ Load a session from a .pb or .json file through the process-level cache
+
+    Parameters
+    ----------
+    filename : str
+        Path to the metadata file, including the extension
+
+    Returns
+    -------
+    metadata_pb2.Session
+        A private copy of the cached session, safe to modify
+    """
+
+    cached, _ = _cached_parse(filename, filename.endswith('.json'))
+    sess = metadata_pb2.Session()
+    sess.CopyFrom(cached)
+    return sess
+
+
+def parse_serialized_cached(filename, sess):
+    """ Equivalent of sess.ParseFromString(<file contents>) served from the process-level cache
+
+    Parameters
+    ----------
+    filename : str
+        Path to the .pb file
+    sess : metadata_pb2.Session
+        Message to overwrite with the cached session
+    """
+
+    cached, _ = _cached_parse(filename, False)
+    sess.CopyFrom(cached)
+
+
+def parse_json_cached(filename, sess):
+    """ Equivalent of ParseDict(json.load(<file>), sess) served from the process-level cache
+
+    Parameters
+    ----------
+    filename : str
+        Path to the .json file
+    sess : metadata_pb2.Session
+        Message the cached session is merged into. As with ParseDict, every field present in the file
+        replaces the one in sess (repeated fields are cleared first, null clears the field); the other
+        fields of sess are kept
+    """
+
+    cached, fields = _cached_parse(filename, True)
+    for name in fields:
+        sess.ClearField(name)
+        field = cached.DESCRIPTOR.fields_by_name[name]
+        if field.label == field.LABEL_REPEATED:
+            getattr(sess, name).extend(getattr(cached, name))
+        else:
+            setattr(sess, name, getattr(cached, name))
+
+
+def cache_info():
+    """ Return the hit / miss / eviction counters and the size of the process-level file cache """
+
+    return _file_cache.info()
+
+
+def cache_clear():
+    """ Empty the process-level file cache and reset its counters """
+
+    _file_cache.clear()
+
+
+def set_cache_size(max_bytes):
+    """ Set the size bound (total ByteSize of cached sessions) of the process-level file cache """
+
+    _file_cache.resize(max_bytes)
@@ -0,0 +1,502 @@
+#!/usr/bin/env python
+
+"""Generator of the specialized metadata readers / writers in metadata_generated.py
+
+The generic json_format functions look every field up in the descriptors of metadata.proto for every
+message they convert. This build step walks metadata_pb2.DESCRIPTOR once and writes straight-line Python
+for every message M of the file (snake_case name m, e.g. neural_probe for NeuralProbe):
+
+    fill_m(d, msg)          dict -> message, the inverse of m_to_dict (enums as names or numbers, keys that
+                            are not fields are ignored, None leaves a field unset)
+    m_to_dict(msg)          message -> dict equal to session_to_dict / MessageToDict(including defaults,
+                            proto field names, enums as names)
+    default_m(msg)          sets the template values of default_bird_metadata.json and
+                            default_single_acquisition_metadata.json (per-session fields excepted)
+    validate_m(d, path='')  list of the problems of a dict about to be filled (unknown keys, wrong types)
+
+Run it again whenever metadata.proto or the default files change; --check fails when the committed module
+is stale, and metadata_generated warns when it was generated from another metadata.proto.
+
+Usage:
+    python metadata_codegen.py [--output metadata_generated.py] [--check] [--benchmark]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import metadata_pb2
+from google.protobuf.descriptor import FieldDescriptor
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+OUTPUT = os.path.join(_HERE, 'metadata_generated.py')
+DEFAULT_FILES = [os.path.join(_HERE, 'default_bird_metadata.json'),
+                 os.path.join(_HERE, 'default_single_acquisition_metadata.json')]
+
+# Fields stamped on every session when it is created, or recorded for each session (condition, weight):
+# listed by the templates but never part of the defaults
+PER_SESSION_FIELDS = {'Session': ('date', 'time', 'sess_uid', 'weight_grams', 'condition')}
+
+_INT64_TYPES = (FieldDescriptor.CPPTYPE_INT64, FieldDescriptor.CPPTYPE_UINT64)
+_FLOAT_TYPES = (FieldDescriptor.CPPTYPE_FLOAT, FieldDescriptor.CPPTYPE_DOUBLE)
+_INT_RANGES = {FieldDescriptor.CPPTYPE_INT32: (-2 ** 31, 2 ** 31), FieldDescriptor.CPPTYPE_UINT32: (0, 2 ** 32),
+               FieldDescriptor.CPPTYPE_INT64: (-2 ** 63, 2 ** 63), FieldDescriptor.CPPTYPE_UINT64: (0, 2 ** 64)}
+
+
+def snake_case(name):
+    """ Name of the generated functions of a message, e.g. snake_case('NeuralProbe') == 'neural_probe' """
+
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+
+def fingerprint(file_descriptor=metadata_pb2.DESCRIPTOR):
+    """ Digest of a compiled .proto file: the generated module records the one it was generated from """
+
+    return hashlib.sha1(file_descriptor.serialized_pb).hexdigest()
+
+
+def _messages(file_descriptor):
+    """ Private helper: every message descriptor of a file, nested messages before their containers """
+
+    ordered = []
+
+    def visit(desc):
+        for nested in desc.nested_types:
+            visit(nested)
+        ordered.append(desc)
+
+    for desc in file_descriptor.message_types_by_name.values():
+        visit(desc)
+    return ordered
+
+
+def _enums(messages):
+    """ Private helper: {enum full name: enum descriptor} used by fields of the messages """
+
+    return {f.enum_type.full_name: f.enum_type for desc in messages for f in desc.fields if f.enum_type is not None}
+
+
+def _enum_id(enum):
+    """ Private helper: identifier of an enum in the generated module, e.g. Session_BirdSex """
+
+    package = enum.file.package
+    name = enum.full_name[len(package) + 1:] if package else enum.full_name
+    return name.replace('.', '_')
+
+
+'''Defaults'''
+
+def load_defaults(paths=None, file_descriptor=metadata_pb2.DESCRIPTOR):
+    """ Default field values of every message, taken from the template JSON files
+
+    Every template is a dictionary of a top-level message (as written by export_metadata_to_json). The
+    first element of every repeated message field provides the defaults of that message type.
+
+    Parameters
+    ----------
+    paths : list of str
+        Template files (DEFAULT_FILES when None)
+    file_descriptor : google.protobuf.descriptor.FileDescriptor
+        Compiled .proto file the templates follow
+
+    Returns
+    -------
+    dict
+        {message name: {field name: value}}, scalar and repeated scalar fields only
+    """
+
+    messages = {desc.full_name: desc for desc in _messages(file_descriptor)}
+    top_level = {desc.name: desc for desc in file_descriptor.message_types_by_name.values()}
+    defaults = {}
+
+    def collect(desc, doc):
+        values = defaults.setdefault(desc.name, {})
+        skip = PER_SESSION_FIELDS.get(desc.name, ())
+        for key, value in doc.items():
+            field = desc.fields_by_name.get(key)
+            if field is None or key in skip:
+                continue
+            if field.message_type is not None:
+                if value:
+                    collect(messages[field.message_type.full_name], value[0])
+            elif key not in values and (value or field.label != field.LABEL_REPEATED):
+                values[key] = value
+
+    for path in DEFAULT_FILES if paths is None else paths:
+        with open(path) as f:
+            doc = json.load(f)
+        # Both templates are sessions: the first top-level message is the root of the file
+        collect(top_level[next(iter(top_level))], doc)
+    return defaults
+
+
+'''Code generation'''
+
+def _literal(field, value):
+    """ Private helper: Python literal of a template value of a field """
+
+    if field.enum_type is not None and isinstance(value, str):
+        return str(field.enum_type.values_by_name[value].number)
+    if field.cpp_type in (FieldDescriptor.CPPTYPE_FLOAT, FieldDescriptor.CPPTYPE_DOUBLE):
+        return repr(float(value))
+    return repr(value)
+
+
+def _fill_lines(desc):
+    names = {f.name: snake_case(f.message_type.name) for f in desc.fields if f.message_type is not None}
+    lines = ['def fill_%s(d, msg):' % snake_case(desc.name),
+             '    """ Fills a %s message from a dictionary (see %s_to_dict) """' % (desc.name, snake_case(desc.name)),
+             '    get = d.get']
+    for f in desc.fields:
+        lines.append('    v = get(%r)' % f.name)
+        if f.message_type is not None:
+            lines.append('    if v is not None:')
+            lines.append('        add = msg.%s.add' % f.name)
+            lines.append('        for x in v: fill_%s(x, add())' % names[f.name])
+        elif f.label == f.LABEL_REPEATED:
+            if f.enum_type is not None:
+                lines.append('    if v is not None: msg.%s.extend([_%s_NUMBERS.get(x, x) for x in v])'
+                             % (f.name, _enum_id(f.enum_type)))
+            elif f.cpp_type in _FLOAT_TYPES:
+                lines.append('    if v is not None: msg.%s.extend([_FLOAT_NAMES.get(x, x) for x in v])' % f.name)
+            else:
+                lines.append('    if v is not None: msg.%s.extend(v)' % f.name)
+        elif f.enum_type is not None:
+            lines.append('    if v is not None: msg.%s = _%s_NUMBERS.get(v, v)' % (f.name, _enum_id(f.enum_type)))
+        elif f.cpp_type in _INT64_TYPES:
+            lines.append('    if v is not None: msg.%s = int(v)' % f.name)
+        elif f.cpp_type in _FLOAT_TYPES:
+            # MessageToDict writes non-finite floats as 'Infinity', '-Infinity' and 'NaN'
+            lines.append('    if v is not None: msg.%s = _FLOAT_NAMES.get(v, v) if v.__class__ is str else v' % f.name)
+        else:
+            lines.append('    if v is not None: msg.%s = v' % f.name)
+    lines.append('    return msg')
+    return lines
+
+
+def _export_value(f, value):
+    """ Private helper: expression converting a field value as MessageToDict does """
+
+    if f.enum_type is not None:
+        return '_%s_NAMES.get(%s, %s)' % (_enum_id(f.enum_type), value, value)
+    if f.cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+        return 'json_float32(%s)' % value
+    if f.cpp_type == FieldDescriptor.CPPTYPE_DOUBLE:
+        return 'json_float64(%s)' % value
+    if f.cpp_type in _INT64_TYPES:
+        return 'str(%s)' % value
+    if f.type == f.TYPE_BYTES:
+        return 'json_bytes(%s)' % value
+    return value
+
+
+def _to_dict_lines(desc):
+    items = []
+    for f in desc.fields:
+        if f.message_type is not None:
+            value = '[%s_to_dict(x) for x in msg.%s]' % (snake_case(f.message_type.name), f.name)
+        elif f.label == f.LABEL_REPEATED:
+            converted = _export_value(f, 'x')
+            value = 'list(msg.%s)' % f.name if converted == 'x' else '[%s for x in msg.%s]' % (converted, f.name)
+        else:
+            value = _export_value(f, 'msg.' + f.name)
+        items.append('        %r: %s,' % (f.name, value))
+    return ['def %s_to_dict(msg):' % snake_case(desc.name),
+            '    """ Dictionary of a %s message: all fields, proto field names, enums as names """' % desc.name,
+            '    return {'] + items + ['    }']
+
+
+def _default_lines(desc, defaults):
+    lines = ['def default_%s(msg):' % snake_case(desc.name),
+             '    """ Sets the template values of a %s message """' % desc.name]
+    for f in desc.fields:
+        if f.name not in defaults:
+            continue
+        value = defaults[f.name]
+        if f.label == f.LABEL_REPEATED:
+            lines.append('    msg.%s.extend([%s])' % (f.name, ', '.join(_literal(f, x) for x in value)))
+        else:
+            lines.append('    msg.%s = %s' % (f.name, _literal(f, value)))
+    lines.append('    return msg')
+    return lines
+
+
+def _check(f, value):
+    """ Private helper: expression that is True when value is NOT acceptable for a non-message field """
+
+    if f.enum_type is not None:
+        return ('%s not in _%s_NAMES if %s.__class__ is int else %s not in _%s_NUMBERS'
+                % (value, _enum_id(f.enum_type), value, value, _enum_id(f.enum_type)))
+    if f.cpp_type == FieldDescriptor.CPPTYPE_STRING:
+        return '%s.__class__ is not %s' % (value, 'bytes' if f.type == f.TYPE_BYTES else 'str')
+    if f.cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+        return '%s.__class__ is not bool' % value
+    if f.cpp_type in _INT_RANGES:
+        low, high = _INT_RANGES[f.cpp_type]
+        return '%s.__class__ is not int or not %d <= %s < %d' % (value, low, value, high)
+    return ('%s.__class__ not in (int, float) and (%s.__class__ is not str or %s not in _FLOAT_NAMES)'
+            % (value, value, value))
+
+
+_EXPECTED = {FieldDescriptor.CPPTYPE_STRING: 'a string', FieldDescriptor.CPPTYPE_BOOL: 'a bool',
+             FieldDescriptor.CPPTYPE_INT32: 'an int32', FieldDescriptor.CPPTYPE_UINT32: 'a uint32',
+             FieldDescriptor.CPPTYPE_INT64: 'an int64', FieldDescriptor.CPPTYPE_UINT64: 'a uint64',
+             FieldDescriptor.CPPTYPE_FLOAT: 'a number', FieldDescriptor.CPPTYPE_DOUBLE: 'a number'}
+
+
+def _validate_lines(desc):
+    name = snake_case(desc.name)
+    lines = ['def validate_%s(d, path=\'\'):' % name,
+             '    """ Problems of a %s dictionary, as "path: problem" strings (empty when it can be filled) """'
+             % desc.name,
+             '    if d.__class__ is not dict:',
+             '        return [\'%s: expected an object, got %r\' % (path or \'.\', d)]',
+             '    errors = []',
+             '    for key in d:',
+             '        if key not in _%s_FIELDS:' % desc.name,
+             '            errors.append(\'%s%s: unknown field\' % (path, key))',
+             '    get = d.get']
+    for f in desc.fields:
+        lines.append('    v = get(%r)' % f.name)
+        if f.label == f.LABEL_REPEATED:
+            lines.append('    if v is not None:')
+            lines.append('        if v.__class__ is not list:')
+            lines.append('            errors.append(\'%%s%s: expected a list, got %%r\' %% (path, v))' % f.name)
+            lines.append('        else:')
+            lines.append('            for i, x in enumerate(v):')
+            if f.message_type is not None:
+                lines.append('                errors.extend(validate_%s(x, \'%%s%s[%%d].\' %% (path, i)))'
+                             % (snake_case(f.message_type.name), f.name))
+            else:
+                expected = 'a %s name or number' % f.enum_type.name if f.enum_type is not None else _EXPECTED[f.cpp_type]
+                lines.append('                if %s:' % _check(f, 'x'))
+                lines.append('                    errors.append(\'%%s%s[%%d]: expected %s, got %%r\' %% (path, i, x))'
+                             % (f.name, expected))
+        elif f.message_type is not None:
+            lines.append('    if v is not None: errors.extend(validate_%s(v, path + %s))'
+                         % (snake_case(f.message_type.name), repr(f.name + '.')))
+        else:
+            expected = 'a %s name or number' % f.enum_type.name if f.enum_type is not None else _EXPECTED[f.cpp_type]
+            lines.append('    if v is not None and (%s):' % _check(f, 'v'))
+            lines.append('        errors.append(\'%%s%s: expected %s, got %%r\' %% (path, v))' % (f.name, expected))
+    lines.append('    return errors')
+    return lines
+
+
+_HEADER = '''\
+#!/usr/bin/env python
+
+"""Specialized readers / writers of Birdsong Project metadata
+
+GENERATED by metadata_codegen.py from metadata.proto and the default_*.json templates: do not edit,
+run python metadata_codegen.py instead. See metadata_codegen for the functions of every message.
+"""
+
+import math
+import base64
+import struct
+import hashlib
+import warnings
+import metadata_pb2
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+PROTO_FINGERPRINT = %(fingerprint)r
+
+if hashlib.sha1(metadata_pb2.DESCRIPTOR.serialized_pb).hexdigest() != PROTO_FINGERPRINT:
+    warnings.warn('metadata_generated.py is out of date with metadata_pb2: run python metadata_codegen.py')
+
+_isfinite = math.isfinite
+_NON_FINITE = {math.inf: 'Infinity', -math.inf: '-Infinity'}
+_FLOAT_NAMES = {'Infinity': math.inf, '-Infinity': -math.inf, 'NaN': math.nan}
+_float32 = struct.Struct('<f')
+
+
+def _shortest_float32(v):
+    """ Private helper: fewest significant digits (6 at least) that read back as the float32 v, as protobuf does """
+    for precision in range(6, 10):
+        rounded = float('%%.*g' %% (precision, v))
+        if _float32.unpack(_float32.pack(rounded))[0] == v:
+            break
+    return rounded
+
+
+def json_float32(v):
+    """ float field value as MessageToDict writes it (shortest repr of the float32) """
+    if not v:
+        return 0.0
+    if _isfinite(v):
+        return _shortest_float32(v)
+    return _NON_FINITE.get(v, 'NaN')
+
+
+def json_float64(v):
+    """ double field value as MessageToDict writes it """
+    if _isfinite(v):
+        return v
+    return _NON_FINITE.get(v, 'NaN')
+
+
+def json_bytes(v):
+    """ bytes field value as MessageToDict writes it (base64) """
+    return base64.b64encode(v).decode()
+
+'''
+
+
+def generate(file_descriptor=metadata_pb2.DESCRIPTOR, defaults=None):
+    """ Source code of the specialized module of a compiled .proto file
+
+    Parameters
+    ----------
+    file_descriptor : google.protobuf.descriptor.FileDescriptor
+        Compiled .proto file (metadata_pb2.DESCRIPTOR)
+    defaults : dict
+        {message name: {field name: value}} (load_defaults() when None)
+
+    Returns
+    -------
+    str
+        Python source of metadata_generated.py
+    """
+
+    defaults = load_defaults(file_descriptor=file_descriptor) if defaults is None else defaults
+    messages = _messages(file_descriptor)
+    lines = [_HEADER % {'fingerprint': fingerprint(file_descriptor)}]
+
+    for enum in sorted(_enums(messages).values(), key=lambda e: e.full_name):
+        enum_id = _enum_id(enum)
+        lines.append('_%s_NAMES = {%s}' % (enum_id, ', '.join('%d: %r' % (v.number, v.name) for v in enum.values)))
+        lines.append('_%s_NUMBERS = {%s}' % (enum_id, ', '.join('%r: %d' % (v.name, v.number) for v in enum.values)))
+    for desc in messages:
+        lines.append('_%s_FIELDS = frozenset([%s])' % (desc.name, ', '.join(repr(f.name) for f in desc.fields)))
+    lines.append('')
+
+    for desc in messages:
+        for section in (_fill_lines(desc), _to_dict_lines(desc), _default_lines(desc, defaults.get(desc.name, {})),
+                        _validate_lines(desc)):
+            lines.append('')
+            lines.extend(section)
+            lines.append('')
+    return '\n'.join(lines).rstrip('\n') + '\n'
+
+
+def write_module(path=OUTPUT, source=None):
+    """ Writes the generated module (generate() when source is None). Returns True if the file changed """
+
+    source = generate() if source is None else source
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == source:
+                return False
+    with open(path + '.tmp', 'w') as f:
+        f.write(source)
+    os.replace(path + '.tmp', path)
+    return True
+
+
+'''Benchmark'''
+
+def benchmark_codegen(n_acquisitions=20, n_items=10, repeat=50):
+    """ Time of the generated functions against the generic json_format ones on the same session
+
+    Parameters
+    ----------
+    n_acquisitions : int
+        Acquisitions of the benchmark session
+    n_items : int
+        Neural probes, sensors and stimuli per acquisition
+    repeat : int
+        Conversions timed per function
+
+    Returns
+    -------
+    dict
+        {operation: (generic seconds, generated seconds)}; the generated outputs are checked against the
+        generic ones first
+    """
+
+    import metadata_generated as generated
+    from google.protobuf.json_format import ParseDict
+    from metadata_API import session_to_dict
+    from metadata_fixtures import benchmark_session
+
+    sess = benchmark_session(n_acquisitions, n_items)
+    sess.details.extend(['note %d' % i for i in range(50)])
+    doc = session_to_dict(sess)
+    if generated.session_to_dict(sess) != doc:
+        raise AssertionError('session_to_dict of metadata_generated differs from MessageToDict')
+    if generated.fill_session(doc, metadata_pb2.Session()) != sess:
+        raise AssertionError('fill_session of metadata_generated differs from ParseDict')
+    if generated.validate_session(doc):
+        raise AssertionError('validate_session rejects a valid session')
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return time.perf_counter() - start
+
+    return {
+        'dict -> message': (timed(lambda: ParseDict(doc, metadata_pb2.Session())),
+                            timed(lambda: generated.fill_session(doc, metadata_pb2.Session()))),
+        'message -> dict': (timed(lambda: session_to_dict(sess)), timed(lambda: generated.session_to_dict(sess))),
+        'validate + fill': (timed(lambda: ParseDict(doc, metadata_pb2.Session())),
+                            timed(lambda: generated.validate_session(doc) or
+                                  generated.fill_session(doc, metadata_pb2.Session()))),
+    }
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Generate metadata_generated.py from metadata.proto')
+    parser.add_argument('--output', default=OUTPUT)
+    parser.add_argument('--check', action='store_true', help='fail if the output is not up to date')
+    parser.add_argument('--benchmark', action='store_true', help='time the generated functions afterwards')
+    args = parser.parse_args(argv)
+
+    source = generate()
+    if args.check:
+        current = None
+        if os.path.exists(args.output):
+            with open(args.output) as f:
+                current = f.read()
+        if current != source:
+            print('%s is out of date: run python metadata_codegen.py' % args.output)
+            return 1
+        print('%s is up to date' % args.output)
+    else:
+        print('%s %s' % ('wrote' if write_module(args.output, source) else 'unchanged', args.output))
+
+    if args.benchmark:
+        for name, (generic, specialized) in benchmark_codegen().items():
+            print('    %-16s json_format %7.3f s   generated %7.3f s   x%.1f'
+                  % (name, generic, specialized, generic / specialized))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
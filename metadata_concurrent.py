@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+"""Concurrent construction and writing of Birdsong Project sessions
+
+ProtobufMetadata wraps a single mutable Session and is not meant to be shared between threads. When several
+birds are recorded concurrently, each recording thread stages its own session in a SessionBuilder (one
+ProtobufMetadata per thread, no locking while it is being filled) and commits it to a shared SessionWriter,
+which serializes the session on the calling thread and hands the bytes to a single background I/O thread
+through a bounded queue. A full queue blocks producers (backpressure) instead of growing without bound.
+"""
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from metadata_API import ProtobufMetadata
+from metadata_archive import SessionArchiveWriter
+from metadata_import import safe_file_name, session_file_name
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+_STOP = object()
+
+
+class SessionWriteError(Exception):
+
+    """ Raised once a write of a SessionWriter failed: that session and every one queued after it were dropped
+
+    Attributes
+    ----------
+    dropped : list of str
+        sess_uid of the sessions that were not written, the failed one first
+    """
+
+    def __init__(self, error, dropped):
+        super().__init__('Writing session %r failed (%s: %s); %d sessions not written: %s'
+                         % (dropped[0], type(error).__name__, error, len(dropped), ', '.join(map(repr, dropped))))
+        self.error = error
+        self.dropped = list(dropped)
+
+
+class SessionWriter:
+
+    """ Write sessions submitted from many producer threads through one background I/O thread
+
+    Parameters
+    ----------
+    target : str
+        Session archive to append to, or an existing directory in which one `<sess_uid>_metadata.pb`
+        file is written per session (named as metadata_import.session_file_name: existing files are never
+        overwritten, colliding sessions are written as `<sess_uid>_2_metadata.pb`, ... and listed in renamed)
+    max_queue : int
+        Maximum number of sessions waiting to be written. submit() blocks while the queue is full
+    fsync : bool
+        Force every write to the storage device before it is counted as written
+
+    Attributes
+    ----------
+    written : int
+        Sessions written
+    renamed : list of (str, str)
+        (sess_uid, file name) of the sessions written under another name than <sess_uid>_metadata.pb
+    dropped : list of str
+        sess_uid of the sessions not written: the first failed write stops the writer, and submit(), join()
+        and close() then raise SessionWriteError
+    """
+
+    def __init__(self, target, max_queue=64, fsync=False):
+
+        self.target = target
+        self.fsync = fsync
+        self.written = 0
+        self.renamed = []
+        self.dropped = []
+        self._names = set()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._closed = False
+        self._archive = None if os.path.isdir(target) else SessionArchiveWriter(target)
+        self._thread = threading.Thread(target=self._run, name='SessionWriter', daemon=True)
+        self._thread.start()
+
+    def _write(self, sess_uid, payload):
+        """ Private method: writes one serialized session (I/O thread only) """
+
+        if self._archive is not None:
+            self._archive.append(payload)
+            self._archive.flush(fsync=self.fsync)
+            return
+        name = session_file_name(self.target, sess_uid, 'session', self._names)
+        self._names.add(name)
+        if name != safe_file_name(sess_uid, 'session'):
+            self.renamed.append((sess_uid, name))
+        path = os.path.join(self.target, name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _run(self):
+        """ Private method: body of the background I/O thread """
+
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if self._error is None:
+                    self._write(*item)
+                    self.written += 1
+                else:
+                    self.dropped.append(item[0])
+            except Exception as e:
+                self._error = e
+                self.dropped.append(item[0])
+            finally:
+                self._queue.task_done()
+
+    def _raise_pending_error(self):
+        """ Private method: raises SessionWriteError once a write failed (every time: the error is sticky) """
+
+        if self._error is not None:
+            raise SessionWriteError(self._error, self.dropped)
+
+    def submit(self, sess, timeout=None):
+        """ Queue a session for writing
+
+        The session is serialized immediately, so the caller may keep modifying or reuse the message.
+
+        Parameters
+        ----------
+        sess : metadata_pb2.Session
+            Session to write
+        timeout : float
+            Seconds to wait for room in the queue. None waits forever; raises queue.Full on timeout
+        """
+
+        if self._closed:
+            raise ValueError('SessionWriter is closed')
+        self._raise_pending_error()
+        self._queue.put((sess.sess_uid, sess.SerializeToString()), timeout=timeout)
+
+    def join(self):
+        """ Block until every submitted session has been written """
+
+        self._queue.join()
+        self._raise_pending_error()
+
+    def close(self):
+        """ Write the remaining sessions, stop the I/O thread and close the archive """
+
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._archive is not None:
+            self._archive.close()
+        self._raise_pending_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SessionBuilder:
+
+    """ Per-thread staging of sessions committed to a shared SessionWriter
+
+    Every thread gets its own ProtobufMetadata (builder.metadata), filled without any locking. commit()
+    submits the thread's session to the writer and starts a fresh one.
+
+    Parameters
+    ----------
+    writer : SessionWriter
+        Shared writer receiving the committed sessions
+    """
+
+    def __init__(self, writer):
+
+        self.writer = writer
+        self._local = threading.local()
+
+    @property
+    def metadata(self):
+        """ The ProtobufMetadata staged by the calling thread (created on first access) """
+
+        metadata = getattr(self._local, 'metadata', None)
+        if metadata is None:
+            metadata = self._local.metadata = ProtobufMetadata()
+        return metadata
+
+    def commit(self, timeout=None):
+        """ Submit the calling thread's session to the writer and reset the thread's staging area
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait for room in the writer queue (None waits forever)
+
+        Returns
+        -------
+        str
+            sess_uid of the committed session
+        """
+
+        metadata = self.metadata
+        self.writer.submit(metadata.sess, timeout=timeout)
+        self._local.metadata = None
+        return metadata.sess.sess_uid
+
+    def discard(self):
+        """ Drop the calling thread's staged session without writing it """
+
+        self._local.metadata = None
+
+    @contextmanager
+    def session(self, bird_dict=None, acquisitions_dict=None):
+        """ Stage a session for the calling thread and commit it when the block exits without error
+
+        Parameters
+        ----------
+        bird_dict : dict or metadata_pb2.Session
+            Bird metadata passed to ProtobufMetadata.read_bird_metadata
+        acquisitions_dict : dict
+            Acquisitions passed to ProtobufMetadata.read_aquisitions_metadata
+
+        Yields
+        ------
+        ProtobufMetadata
+            The thread's staged metadata
+        """
+
+        self.discard()
+        metadata = self.metadata
+        if bird_dict is not None:
+            metadata.read_bird_metadata(bird_dict)
+        if acquisitions_dict is not None:
+            metadata.read_aquisitions_metadata(acquisitions_dict)
+        try:
+            yield metadata
+        except BaseException:
+            self.discard()
+            raise
+        self.commit()
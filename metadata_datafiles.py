@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+"""References from Birdsong Project acquisitions to the data files they recorded
+
+Every Acquisition can carry DataFile records (Session.DataFile, field 16 of Session.Acquisition in
+metadata.proto): where the file is, its size and modification time, a BLAKE2 checksum computed in
+streaming fashion, and how to read it (numpy dtype, header size, channel count). They are ordinary fields,
+so .pb files, archives and JSON exports (MessageToDict / ParseDict) all keep them.
+
+open_datafile returns a lazy loader: the file is memory-mapped on first access, as a (samples, channels)
+array whose columns are split between the probes or sensors of the acquisition in order.
+
+Usage:
+    python metadata_datafiles.py verify METADATA [--quick]       check the data files of a session
+"""
+
+import os
+import re
+import mmap
+import sys
+import hashlib
+import argparse
+import numpy as np
+import metadata_pb2
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+CHECKSUM_ALGORITHM = 'blake2b'
+CHECKSUM_DIGEST_SIZE = 16
+CHUNK_SIZE = 1024 * 1024
+
+DataFile = metadata_pb2.Session.DataFile
+
+
+def file_checksum(path, algorithm=CHECKSUM_ALGORITHM, chunk_size=CHUNK_SIZE):
+    """ Streaming checksum of a file, as stored in DataFile.checksum
+
+    Parameters
+    ----------
+    path : str
+        File to hash (read chunk by chunk, never whole)
+    algorithm : str
+        'blake2b' or 'blake2s' (or any hashlib algorithm)
+    chunk_size : int
+        Bytes read at a time
+
+    Returns
+    -------
+    str
+        '<algorithm>:<hex digest>'
+    """
+
+    digest = hashlib.new(algorithm, digest_size=CHECKSUM_DIGEST_SIZE) if algorithm.startswith('blake2') \
+        else hashlib.new(algorithm)
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+    return '%s:%s' % (algorithm, digest.hexdigest())
+
+
+def describe_file(path, base_dir=None, signal='', dtype='<i2', num_channels=0, header_bytes=0, checksum=True):
+    """ DataFile record of a file on disk
+
+    Parameters
+    ----------
+    path : str
+        Data file
+    base_dir : str
+        Directory the recorded path is made relative to (usually the directory of the metadata file).
+        None records the absolute path
+    signal : str
+        acquisition_signal of the probes / sensors recorded in the file
+    dtype : str
+        numpy dtype of the samples
+    num_channels : int
+        Interleaved channels (0: the sum over the probes / sensors of the acquisition)
+    header_bytes : int
+        Offset of the first sample
+    checksum : bool
+        Hash the file (it is read once, in chunks)
+
+    Returns
+    -------
+    DataFile
+    """
+
+    st = os.stat(path)
+    recorded = os.path.abspath(path) if base_dir is None else os.path.relpath(path, base_dir)
+    return DataFile(path=recorded, size=st.st_size, modified_ns=st.st_mtime_ns,
+                    checksum=file_checksum(path) if checksum else '', signal=signal, dtype=np.dtype(dtype).str,
+                    num_channels=num_channels, header_bytes=header_bytes)
+
+
+def get_datafiles(acquisition):
+    """ DataFile records of a metadata_pb2.Session.Acquisition (list, possibly empty) """
+
+    return list(acquisition.datafiles)
+
+
+def set_datafiles(acquisition, datafiles):
+    """ Replace the DataFile records of a metadata_pb2.Session.Acquisition (in place) """
+
+    datafiles = list(datafiles)         # May be acquisition.datafiles itself
+    del acquisition.datafiles[:]
+    acquisition.datafiles.extend(datafiles)
+
+
+def add_datafile(acquisition, path, **kwargs):
+    """ Describe a file (see describe_file for the keyword arguments) and append it to an acquisition """
+
+    datafile = describe_file(path, **kwargs)
+    acquisition.datafiles.append(datafile)
+    return datafile
+
+
+def _resolve(datafile, base_dir):
+    return datafile.path if os.path.isabs(datafile.path) else os.path.join(base_dir, datafile.path)
+
+
+def verify_datafiles(sess, base_dir='.', quick=False):
+    """ Check the data files referenced by the acquisitions of a session
+
+    Parameters
+    ----------
+    sess : metadata_pb2.Session
+        Session whose acquisitions carry DataFile records
+    base_dir : str
+        Directory relative paths are resolved against (the directory of the metadata file)
+    quick : bool
+        Compare sizes and modification times only, instead of hashing the files
+
+    Returns
+    -------
+    list of (int, str, str)
+        (acquisition index, path, problem) for every missing, resized, modified or corrupted file
+    """
+
+    problems = []
+    for index, acquisition in enumerate(sess.acquisitions):
+        for datafile in get_datafiles(acquisition):
+            path = _resolve(datafile, base_dir)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                problems.append((index, path, 'missing'))
+                continue
+            if st.st_size != datafile.size:
+                problems.append((index, path, 'size %d, recorded %d' % (st.st_size, datafile.size)))
+            elif quick:
+                if datafile.modified_ns and st.st_mtime_ns != datafile.modified_ns:
+                    problems.append((index, path, 'modified since it was recorded'))
+            elif datafile.checksum:
+                algorithm = datafile.checksum.split(':', 1)[0]
+                if file_checksum(path, algorithm) != datafile.checksum:
+                    problems.append((index, path, 'checksum mismatch'))
+    return problems
+
+
+'''Lazy loading'''
+
+_RANGE = re.compile(r'^\s*(\d+)\s*-\s*(\d+)\s*$')
+
+
+def count_channels(channels):
+    """ Number of channels of a channels field: '0-31' -> 32, '[aux_0, aux_1]' -> 2, '[0]' -> 1, '' -> 0 """
+
+    total = 0
+    for part in channels.strip().strip('[]').split(','):
+        match = _RANGE.match(part)
+        if match:
+            total += abs(int(match.group(2)) - int(match.group(1))) + 1
+        elif part.strip() and part.strip() != '_':
+            total += 1
+    return total
+
+
+def channel_layout(acquisition, signal=''):
+    """ Columns of the probes or sensors of an acquisition in an interleaved data file
+
+    Parameters
+    ----------
+    acquisition : metadata_pb2.Session.Acquisition
+    signal : str
+        acquisition_signal recorded in the file. '' takes the neural probes (or the sensors if there are none)
+
+    Returns
+    -------
+    list of (message, int, int)
+        (NeuralProbe or Sensor, first column, column after the last) in file order. Probes use num_channels
+        (or their channels field when it is 0), sensors their channels field
+    """
+
+    probes = [p for p in acquisition.neuralprobes if not signal or p.acquisition_signal == signal]
+    items = probes if probes or signal else []
+    if not items:
+        items = [s for s in acquisition.sensors if not signal or s.acquisition_signal == signal]
+    layout = []
+    column = 0
+    for item in items:
+        n = getattr(item, 'num_channels', 0) or count_channels(item.channels)
+        layout.append((item, column, column + n))
+        column += n
+    return layout
+
+
+class LazyRecording:
+
+    """ Data file of an acquisition, memory-mapped on first access
+
+    Parameters
+    ----------
+    path : str
+        Data file
+    datafile : DataFile
+        Its record (dtype, header, channels)
+    layout : list of (message, int, int)
+        channel_layout of the acquisition
+    """
+
+    def __init__(self, path, datafile, layout):
+
+        self.path = path
+        self.datafile = datafile
+        self.layout = layout
+        self.num_channels = datafile.num_channels or (layout[-1][2] if layout else 1)
+        self._mmap = None
+        self._samples = None
+
+    @property
+    def samples(self):
+        """ (samples, channels) read-only array of the whole file, memory-mapped on first access """
+
+        if self._samples is None:
+            dtype = np.dtype(self.datafile.dtype or '<i2')
+            n_samples = (os.path.getsize(self.path) - self.datafile.header_bytes) // (dtype.itemsize * self.num_channels)
+            if n_samples <= 0:
+                self._samples = np.empty((0, self.num_channels), dtype=dtype)
+            else:
+                with open(self.path, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._samples = np.frombuffer(self._mmap, dtype=dtype, count=n_samples * self.num_channels,
+                                              offset=self.datafile.header_bytes).reshape(n_samples, self.num_channels)
+        return self._samples
+
+    def __len__(self):
+        return self.samples.shape[0]
+
+    def item(self, index):
+        """ (samples, channels) view of the columns of the index-th probe / sensor of the layout """
+
+        _, start, stop = self.layout[index]
+        return self.samples[:, start:stop]
+
+    def signal(self, name):
+        """ View of the columns of the probe / sensor with a given signal_name or serial_number """
+
+        for index, (item, _, _) in enumerate(self.layout):
+            if name in (getattr(item, 'signal_name', None), item.serial_number):
+                return self.item(index)
+        raise KeyError(name)
+
+    def close(self):
+        """ Drop the mapping (it is recreated on the next access)
+
+        Views returned by samples / item / signal that are still referenced keep the file mapped until they
+        are garbage collected.
+        """
+
+        self._samples = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:         # Views still alive: the map is released with the last of them
+                pass
+            self._mmap = None
+
+
+def open_datafile(acquisition, index=0, base_dir='.'):
+    """ Lazy loader of a data file of an acquisition
+
+    Parameters
+    ----------
+    acquisition : metadata_pb2.Session.Acquisition
+        Acquisition carrying DataFile records
+    index : int
+        Which of its data files
+    base_dir : str
+        Directory relative paths are resolved against (the directory of the metadata file)
+
+    Returns
+    -------
+    LazyRecording
+    """
+
+    datafile = get_datafiles(acquisition)[index]
+    return LazyRecording(_resolve(datafile, base_dir), datafile, channel_layout(acquisition, datafile.signal))
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Data files referenced by session metadata')
+    commands = parser.add_subparsers(dest='command', required=True)
+    verify = commands.add_parser('verify', help='check the data files of a session')
+    verify.add_argument('metadata', help='.pb metadata file')
+    verify.add_argument('--quick', action='store_true', help='sizes and modification times only')
+    args = parser.parse_args(argv)
+
+    sess = metadata_pb2.Session()
+    with open(args.metadata, 'rb') as f:
+        sess.ParseFromString(f.read())
+    problems = verify_datafiles(sess, os.path.dirname(os.path.abspath(args.metadata)), quick=args.quick)
+    n_files = sum(len(get_datafiles(a)) for a in sess.acquisitions)
+    print('%d data files, %d problems' % (n_files, len(problems)))
+    for index, path, problem in problems:
+        print('    acquisition %d %s: %s' % (index, path, problem))
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
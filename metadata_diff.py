@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+
+"""Structural diff and three-way merge of Birdsong Project sessions
+
+Both operate on the serialized bytes of the sessions. Whenever two (sub)messages have identical bytes they
+are skipped without being decoded, so the cost of a diff grows with the size of the change rather than the
+size of the sessions. Repeated submessages are matched by key instead of by position:
+
+    acquisitions    (acquisition_hardware, acquisition_software)
+    neuralprobes    serial_number
+    datafiles       path
+    sensors         serial_number, or signal_name when there is no serial number
+    stimuli         serial_number, or signal_name when there is no serial number
+
+Elements without a key (or sharing one with a sibling) fall back to positional matching.
+
+Fields unknown to metadata_pb2 (e.g. fields added by a newer metadata.proto) are compared and merged as a
+whole by their wire bytes. Their paths use the field number, e.g. "acquisitions[openephys/spikeglx].21",
+and their values are lists of the wire bytes of each occurrence.
+"""
+
+from collections import namedtuple, OrderedDict
+import metadata_pb2
+from metadata_wire import iter_fields, encode_tag, encode_varint, WIRETYPE_LENGTH_DELIMITED
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+KEY_FIELDS = {
+    'Acquisition': ('acquisition_hardware', 'acquisition_software'),    # all of them form the key
+    'NeuralProbe': ('serial_number',),
+    'DataFile': ('path',),
+    'Sensor': ('serial_number', 'signal_name'),                         # first non-empty one is the key
+    'Stimulus': ('serial_number', 'signal_name'),
+}
+_COMPOSITE_KEYS = ('Acquisition',)
+
+_CLASSES = {metadata_pb2.Session.DESCRIPTOR: metadata_pb2.Session}
+_CLASSES.update((getattr(metadata_pb2.Session, d.name).DESCRIPTOR, getattr(metadata_pb2.Session, d.name))
+                for d in metadata_pb2.Session.DESCRIPTOR.nested_types)
+
+# A change between two sessions: path e.g. "acquisitions[openephys/spikeglx].neuralprobes[U656].num_channels",
+# kind is 'added', 'removed' or 'changed', old / new are decoded values (None when absent)
+Change = namedtuple('Change', ['path', 'kind', 'old', 'new'])
+
+# A field modified differently on both sides of a merge (the merged session keeps `ours`)
+Conflict = namedtuple('Conflict', ['path', 'base', 'ours', 'theirs'])
+
+
+def _as_bytes(sess):
+    """ Private helper: serialized bytes of a Session (bytes are passed through) """
+
+    if isinstance(sess, (bytes, bytearray, memoryview)):
+        return memoryview(sess)
+    return memoryview(sess.SerializeToString(deterministic=True))
+
+
+def _spans(data, start, end):
+    """ Private helper: {field number: [(tag_pos, value_pos, end), ...]} of a message span """
+
+    spans = {}
+    for number, _, tag_pos, value_pos, field_end in iter_fields(data, start, end):
+        spans.setdefault(number, []).append((tag_pos, value_pos, field_end))
+    return spans
+
+
+def _raw(data, spans):
+    """ Private helper: the concatenated wire bytes of a field's occurrences """
+
+    return b''.join(data[tag:end] for tag, _, end in spans)
+
+
+def _decode_field(desc, field, data, spans):
+    """ Private helper: decoded value of a non-message field (enum names, lists for repeated fields) """
+
+    if not spans:
+        return None
+    msg = _CLASSES[desc]()
+    msg.ParseFromString(_raw(data, spans))
+    value = getattr(msg, field.name)
+    if field.enum_type is not None:
+        names = field.enum_type.values_by_number
+        to_name = lambda v: names[v].name if v in names else v
+        return [to_name(v) for v in value] if field.label == field.LABEL_REPEATED else to_name(value)
+    return list(value) if field.label == field.LABEL_REPEATED else value
+
+
+def _decode_message(desc, data, span):
+    """ Private helper: parsed submessage from its (tag_pos, value_pos, end) span """
+
+    msg = _CLASSES[desc]()
+    msg.ParseFromString(bytes(data[span[1]:span[2]]))
+    return msg
+
+
+def _keyed(desc, data, spans):
+    """ Private helper: OrderedDict key -> span of the elements of a repeated message field """
+
+    key_fields = KEY_FIELDS.get(desc.name, ())
+    numbers = [desc.fields_by_name[name].number for name in key_fields]
+    keys = []
+    for tag, value_pos, end in spans:
+        values = {}
+        for number, _, _, v, e in iter_fields(data, value_pos, end):
+            if number in numbers:
+                values[number] = bytes(data[v:e]).decode('utf-8')
+        if desc.name in _COMPOSITE_KEYS:
+            key = '/'.join(values.get(n, '') for n in numbers) if values else ''
+        else:
+            key = next((values[n] for n in numbers if values.get(n)), '')
+        keys.append(key)
+    elements = OrderedDict()
+    for i, (key, span) in enumerate(zip(keys, spans)):
+        if not key or keys.count(key) > 1:
+            key = '#%d' % i
+        elements[key] = span
+    return elements
+
+
+def _unknown_numbers(desc, field_maps):
+    """ Private helper: sorted field numbers of the span maps that are not fields of desc """
+
+    return sorted({n for spans in field_maps for n in spans if n not in desc.fields_by_number})
+
+
+def _unknown_values(data, spans):
+    """ Private helper: wire bytes of every occurrence of an unknown field (None when absent) """
+
+    return [bytes(data[value_pos:end]) for _, value_pos, end in spans] if spans else None
+
+
+def _path(path, name):
+    return name if not path else path + '.' + name
+
+
+'''Diff'''
+
+def _diff(desc, a, a_span, b, b_span, path, changes):
+    """ Private helper: appends the changes between two serialized messages of type desc """
+
+    if a[a_span[0]:a_span[1]] == b[b_span[0]:b_span[1]]:
+        return
+    a_fields = _spans(a, *a_span)
+    b_fields = _spans(b, *b_span)
+    for field in desc.fields:
+        a_occ = a_fields.get(field.number, [])
+        b_occ = b_fields.get(field.number, [])
+        if not a_occ and not b_occ:
+            continue
+        field_path = _path(path, field.name)
+        if field.message_type is None:
+            if _raw(a, a_occ) != _raw(b, b_occ):
+                old = _decode_field(desc, field, a, a_occ)
+                new = _decode_field(desc, field, b, b_occ)
+                if old != new:
+                    kind = 'added' if not a_occ else 'removed' if not b_occ else 'changed'
+                    changes.append(Change(field_path, kind, old, new))
+        elif field.label != field.LABEL_REPEATED:
+            sub = field.message_type
+            if not a_occ or not b_occ:
+                kind = 'added' if not a_occ else 'removed'
+                occ = (a, a_occ[-1]) if a_occ else (b, b_occ[-1])
+                msg = _decode_message(sub, *occ)
+                changes.append(Change(field_path, kind, msg if a_occ else None, msg if b_occ else None))
+            else:
+                _diff(sub, a, a_occ[-1][1:], b, b_occ[-1][1:], field_path, changes)
+        else:
+            sub = field.message_type
+            a_elems = _keyed(sub, a, a_occ)
+            b_elems = _keyed(sub, b, b_occ)
+            for key, span in a_elems.items():
+                elem_path = '%s[%s]' % (field_path, key)
+                if key in b_elems:
+                    _diff(sub, a, span[1:], b, b_elems[key][1:], elem_path, changes)
+                else:
+                    changes.append(Change(elem_path, 'removed', _decode_message(sub, a, span), None))
+            for key, span in b_elems.items():
+                if key not in a_elems:
+                    changes.append(Change('%s[%s]' % (field_path, key), 'added', None, _decode_message(sub, b, span)))
+    for number in _unknown_numbers(desc, (a_fields, b_fields)):
+        a_occ = a_fields.get(number, [])
+        b_occ = b_fields.get(number, [])
+        if _raw(a, a_occ) != _raw(b, b_occ):
+            kind = 'added' if not a_occ else 'removed' if not b_occ else 'changed'
+            changes.append(Change(_path(path, str(number)), kind, _unknown_values(a, a_occ), _unknown_values(b, b_occ)))
+
+
+def diff_sessions(old, new):
+    """ List the differences between two sessions
+
+    Parameters
+    ----------
+    old : metadata_pb2.Session or bytes
+        Reference session (or its serialized bytes, e.g. the contents of a .pb file)
+    new : metadata_pb2.Session or bytes
+        Session compared against the reference
+
+    Returns
+    -------
+    list of Change
+        One entry per added, removed or changed field or keyed submessage. Empty if the sessions are equal
+    """
+
+    a = _as_bytes(old)
+    b = _as_bytes(new)
+    changes = []
+    _diff(metadata_pb2.Session.DESCRIPTOR, a, (0, len(a)), b, (0, len(b)), '', changes)
+    return changes
+
+
+'''Three-way merge'''
+
+def _merge(desc, base, ours, theirs, path, conflicts):
+    """ Private helper: merges three serialized messages given as (data, start, end) or None, returns bytes """
+
+    segment = lambda side: bytes(side[0][side[1]:side[2]]) if side is not None else None
+    b, o, t = segment(base), segment(ours), segment(theirs)
+    if o == t or b == t:
+        return o
+    if b == o:
+        return t
+
+    empty = (memoryview(b''), 0, 0)
+    base, ours, theirs = base or empty, ours or empty, theirs or empty
+    fields = [(side[0], _spans(*side)) for side in (base, ours, theirs)]
+    out = []
+    for field in desc.fields:
+        occ = [(data, spans.get(field.number, [])) for data, spans in fields]
+        field_path = _path(path, field.name)
+        if field.message_type is None or field.label != field.LABEL_REPEATED:
+            if field.message_type is not None and all(spans for _, spans in occ):
+                merged = _merge(field.message_type, *[(data, spans[-1][1], spans[-1][2]) for data, spans in occ],
+                                path=field_path, conflicts=conflicts)
+                out.append(encode_tag(field.number, WIRETYPE_LENGTH_DELIMITED) + encode_varint(len(merged)) + merged)
+                continue
+            rb, ro, rt = [_raw(data, spans) for data, spans in occ]
+            if ro == rt or rb == rt:
+                out.append(ro)
+            elif rb == ro:
+                out.append(rt)
+            else:
+                out.append(ro)
+                if field.message_type is None:
+                    values = [_decode_field(desc, field, data, spans) for data, spans in occ]
+                else:
+                    values = [_decode_message(field.message_type, data, spans[-1]) if spans else None
+                              for data, spans in occ]
+                conflicts.append(Conflict(field_path, *values))
+            continue
+
+        sub = field.message_type
+        eb, eo, et = [_keyed(sub, data, spans) for data, spans in occ]
+        keys = list(eo) + [k for k in et if k not in eo]
+        elem = lambda data, elems, key: (data, elems[key][1], elems[key][2]) if key in elems else None
+        for key in keys + [k for k in eb if k not in eo and k not in et]:
+            sb, so, st = elem(base[0], eb, key), elem(ours[0], eo, key), elem(theirs[0], et, key)
+            elem_path = '%s[%s]' % (field_path, key)
+            if so is None or st is None:
+                # Deleted on (at least) one side: the deletion wins unless the other side modified the element
+                kept = so or st
+                if kept is None or (sb is not None and segment(kept) == segment(sb)):
+                    continue
+                if sb is not None:
+                    conflicts.append(Conflict(elem_path, _decode_message(sub, sb[0], (None,) + sb[1:]),
+                                              _decode_message(sub, so[0], (None,) + so[1:]) if so else None,
+                                              _decode_message(sub, st[0], (None,) + st[1:]) if st else None))
+                merged = segment(kept)
+            else:
+                merged = _merge(sub, sb, so, st, elem_path, conflicts)
+            out.append(encode_tag(field.number, WIRETYPE_LENGTH_DELIMITED) + encode_varint(len(merged)) + merged)
+
+    for number in _unknown_numbers(desc, [spans for _, spans in fields]):
+        occ = [(data, spans.get(number, [])) for data, spans in fields]
+        rb, ro, rt = [_raw(data, spans) for data, spans in occ]
+        if ro == rt or rb == rt:
+            out.append(ro)
+        elif rb == ro:
+            out.append(rt)
+        else:
+            out.append(ro)
+            conflicts.append(Conflict(_path(path, str(number)), *[_unknown_values(data, spans) for data, spans in occ]))
+    return b''.join(out)
+
+
+def merge_sessions(base, ours, theirs):
+    """ Three-way merge of two sessions derived from a common ancestor
+
+    Fields changed on only one side take that side's value. Keyed submessages (see KEY_FIELDS) added on
+    either side are kept, deleted ones are dropped unless the other side modified them. Fields changed
+    differently on both sides are conflicts: the merged session keeps `ours` and the conflict is reported.
+
+    Parameters
+    ----------
+    base : metadata_pb2.Session or bytes
+        Common ancestor
+    ours : metadata_pb2.Session or bytes
+        First descendant (wins conflicts)
+    theirs : metadata_pb2.Session or bytes
+        Second descendant
+
+    Returns
+    -------
+    (metadata_pb2.Session, list of Conflict)
+        The merged session and the conflicts found
+    """
+
+    sides = [_as_bytes(s) for s in (base, ours, theirs)]
+    conflicts = []
+    merged = metadata_pb2.Session()
+    merged.ParseFromString(_merge(metadata_pb2.Session.DESCRIPTOR, *[(s, 0, len(s)) for s in sides],
+                                  path='', conflicts=conflicts))
+    return merged, conflicts
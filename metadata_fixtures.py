@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Synthetic sessions and measurements shared by the benchmarks of the metadata_* modules
+
+benchmark_session builds one large session (many acquisitions, probes, sensors and stimuli),
+realistic_sessions a year of serialized sessions with the repetition of a real dataset (few birds, boxes and
+rigs), and measure the memory and time taken to build an object.
+"""
+
+import time
+import random
+import tracemalloc
+import metadata_pb2
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+def benchmark_session(n_acquisitions, n_items):
+    """ A session with many acquisitions, probes, sensors and stimuli
+
+    Parameters
+    ----------
+    n_acquisitions : int
+        Acquisitions in the session
+    n_items : int
+        Neural probes, sensors and stimuli per acquisition
+
+    Returns
+    -------
+    metadata_pb2.Session
+    """
+
+    sess = metadata_pb2.Session()
+    sess.bird_type = sess.BirdType.ZEBRA
+    sess.bird_sex = sess.BirdSex.MALE
+    sess.bird_uid = 'z_m10g8_20'
+    sess.date = '2021-03-10'
+    sess.time = '14:42:01.754603'
+    sess.weight_grams = 18.3
+    sess.condition = sess.Condition.CHRONIC
+    sess.box = 'cuervecito3'
+    sess.sess_uid = 'CHRONIC-z_m10g8_20-2021-03-10-14:42:01.754603'
+    sess.details.append('benchmark session')
+    for a in range(n_acquisitions):
+        acquisition = sess.acquisitions.add(acquisition_hardware='openephys', acquisition_software='spikeglx')
+        for i in range(n_items):
+            acquisition.neuralprobes.add(acquisition_signal='neural', manufacturer='neuropixel', model='neuropixels_1',
+                                         serial_number='U%d_%d' % (a, i), num_channels=384, tip_depth_microns=1500.5,
+                                         brain_nucleus=['hvc', 'ra'], channel_group='imec_%d' % i, channels='0-383',
+                                         details=['probe %d of acquisition %d' % (i, a)])
+            acquisition.sensors.add(acquisition_signal='audio', manufacturer='miniDSP', model='uma8raw',
+                                    signal_name='mic_%d' % i, channels='0-6', locations='top-back-left corner',
+                                    details=['Positioned in top-back-left corner of the chamber.'])
+            acquisition.stimuli.add(stimulus_signal='song_replay', manufacturer='inhouse', signal_name='stim_%d' % i,
+                                    channel_gropup='DIN', channels='[0]')
+    return sess
+
+
+def realistic_sessions(n_sessions, seed=0):
+    """ Serialized sessions resembling a year of recordings (few birds, boxes and rigs)
+
+    Parameters
+    ----------
+    n_sessions : int
+        Number of sessions
+    seed : int
+        Seed of the random generator: the same seed gives the same sessions
+
+    Returns
+    -------
+    list of bytes
+    """
+
+    rng = random.Random(seed)
+    birds = ['z_%s%d%s%d_%d' % (rng.choice('mrgby'), rng.randrange(100), rng.choice('mrgby'), rng.randrange(100),
+                                rng.choice((19, 20, 21))) for _ in range(40)]
+    details = ['Positioned in top-back-left and top-front-right corners of the chamber.', 'dummy_weight + tether',
+               'female in adjacent cage', 'lights on 7am-7pm']
+    payloads = []
+    for i in range(n_sessions):
+        sess = metadata_pb2.Session()
+        sess.bird_type = sess.BirdType.ZEBRA
+        sess.bird_sex = rng.choice((sess.BirdSex.MALE, sess.BirdSex.FEMALE))
+        sess.bird_uid = rng.choice(birds)
+        sess.date = '2021-%02d-%02d' % (rng.randint(1, 12), rng.randint(1, 28))
+        sess.time = '%02d:%02d:%02d.%06d' % (rng.randrange(24), rng.randrange(60), rng.randrange(60), rng.randrange(10 ** 6))
+        sess.weight_grams = round(rng.uniform(14, 20), 1)
+        sess.condition = rng.choice((sess.Condition.HABITUATION, sess.Condition.CHRONIC, sess.Condition.ACUTE))
+        sess.sess_uid = '%s-%s-%s-%s' % (sess.Condition.Name(sess.condition), sess.bird_uid, sess.date, sess.time)
+        sess.box = 'cuervecito%d' % rng.randint(1, 16)
+        sess.details.append(rng.choice(details))
+        audio = sess.acquisitions.add(acquisition_hardware='uma8-usb', acquisition_software='alsa')
+        for model, name, channels in (('uma8raw', 'audio_raw', '0-6'), ('uma8DSP', 'audio_DSP', '7-8')):
+            audio.sensors.add(acquisition_signal='audio', manufacturer='miniDSP', model=model, signal_name=name,
+                              channels=channels, locations='OUT', details=[details[0]])
+        if sess.condition != sess.Condition.HABITUATION:
+            ephys = sess.acquisitions.add(acquisition_hardware='openephys', acquisition_software='openephys')
+            ephys.neuralprobes.add(acquisition_signal='neural', manufacturer='neuronexus', model='buzsaki32',
+                                   serial_number='U%d' % birds.index(sess.bird_uid), num_channels=32,
+                                   hemisphere=rng.choice(('left', 'right')), brain_nucleus=['hvc'],
+                                   headstage='intan32', channel_group='port_0', channels='0-31')
+            ephys.stimuli.add(stimulus_signal='song_replay', manufacturer='inhouse', signal_name='stim',
+                              channel_gropup='DIN', channels='[0]')
+        payloads.append(sess.SerializeToString())
+    return payloads
+
+
+def measure(build):
+    """ Build an object while tracing allocations
+
+    Parameters
+    ----------
+    build : callable
+        Function without arguments returning the object
+
+    Returns
+    -------
+    (object, int, float)
+        The object, the bytes allocated while building it (and still held) and the seconds it took
+    """
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        obj = build()
+        seconds = time.perf_counter() - start
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return obj, size, seconds
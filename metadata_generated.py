@@ -0,0 +1,741 @@
+#!/usr/bin/env python
+
+"""Specialized readers / writers of Birdsong Project metadata
+
+GENERATED by metadata_codegen.py from metadata.proto and the default_*.json templates: do not edit,
+run python metadata_codegen.py instead. See metadata_codegen for the functions of every message.
+"""
+
+import math
+import base64
+import struct
+import hashlib
+import warnings
+import metadata_pb2
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+PROTO_FINGERPRINT = '05834ec77f505526cda1dd47611aaa08c48e3743'
+
+if hashlib.sha1(metadata_pb2.DESCRIPTOR.serialized_pb).hexdigest() != PROTO_FINGERPRINT:
+    warnings.warn('metadata_generated.py is out of date with metadata_pb2: run python metadata_codegen.py')
+
+_isfinite = math.isfinite
+_NON_FINITE = {math.inf: 'Infinity', -math.inf: '-Infinity'}
+_FLOAT_NAMES = {'Infinity': math.inf, '-Infinity': -math.inf, 'NaN': math.nan}
+_float32 = struct.Struct('<f')
+
+
+def _shortest_float32(v):
+    """ Private helper: fewest significant digits (6 at least) that read back as the float32 v, as protobuf does """
+    for precision in range(6, 10):
+        rounded = float('%.*g' % (precision, v))
+        if _float32.unpack(_float32.pack(rounded))[0] == v:
+            break
+    return rounded
+
+
+def json_float32(v):
+    """ float field value as MessageToDict writes it (shortest repr of the float32) """
+    if not v:
+        return 0.0
+    if _isfinite(v):
+        return _shortest_float32(v)
+    return _NON_FINITE.get(v, 'NaN')
+
+
+def json_float64(v):
+    """ double field value as MessageToDict writes it """
+    if _isfinite(v):
+        return v
+    return _NON_FINITE.get(v, 'NaN')
+
+
+def json_bytes(v):
+    """ bytes field value as MessageToDict writes it (base64) """
+    return base64.b64encode(v).decode()
+
+
+_Session_BirdSex_NAMES = {0: 'UNKNOWN_BIRDSEX', 1: 'MALE', 2: 'FEMALE'}
+_Session_BirdSex_NUMBERS = {'UNKNOWN_BIRDSEX': 0, 'MALE': 1, 'FEMALE': 2}
+_Session_BirdType_NAMES = {0: 'UNKNOWN_BIRDTYPE', 1: 'ZEBRA', 2: 'STARLING', 3: 'BENGALESE'}
+_Session_BirdType_NUMBERS = {'UNKNOWN_BIRDTYPE': 0, 'ZEBRA': 1, 'STARLING': 2, 'BENGALESE': 3}
+_Session_Condition_NAMES = {0: 'UNKNOWN_CONDITION', 1: 'HABITUATION', 2: 'CHRONIC', 3: 'ACUTE'}
+_Session_Condition_NUMBERS = {'UNKNOWN_CONDITION': 0, 'HABITUATION': 1, 'CHRONIC': 2, 'ACUTE': 3}
+_NeuralProbe_FIELDS = frozenset(['acquisition_signal', 'manufacturer', 'model', 'serial_number', 'num_channels', 'tip_depth_microns', 'implant_coordinates_microns', 'hemisphere', 'brain_nucleus', 'headstage', 'channel_group', 'channels', 'details'])
+_Sensor_FIELDS = frozenset(['acquisition_signal', 'manufacturer', 'model', 'serial_number', 'signal_name', 'headstage', 'channel_group', 'channels', 'locations', 'details'])
+_Stimulus_FIELDS = frozenset(['stimulus_signal', 'manufacturer', 'model', 'serial_number', 'signal_name', 'channel_gropup', 'channels', 'details'])
+_DataFile_FIELDS = frozenset(['path', 'size', 'modified_ns', 'checksum', 'signal', 'dtype', 'num_channels', 'header_bytes'])
+_Acquisition_FIELDS = frozenset(['acquisition_hardware', 'acquisition_software', 'neuralprobes', 'sensors', 'stimuli', 'datafiles'])
+_Session_FIELDS = frozenset(['bird_type', 'bird_sex', 'bird_uid', 'date', 'time', 'weight_grams', 'testosterone', 'testosterone_date', 'dummy_weight', 'dummy_weight_grams', 'dummy_weight_date', 'dummy_tether', 'dummy_tether_date', 'dummy_implant', 'dummy_implant_date', 'condition', 'sess_uid', 'box', 'details', 'acquisitions'])
+
+
+def fill_neural_probe(d, msg):
+    """ Fills a NeuralProbe message from a dictionary (see neural_probe_to_dict) """
+    get = d.get
+    v = get('acquisition_signal')
+    if v is not None: msg.acquisition_signal = v
+    v = get('manufacturer')
+    if v is not None: msg.manufacturer = v
+    v = get('model')
+    if v is not None: msg.model = v
+    v = get('serial_number')
+    if v is not None: msg.serial_number = v
+    v = get('num_channels')
+    if v is not None: msg.num_channels = v
+    v = get('tip_depth_microns')
+    if v is not None: msg.tip_depth_microns = _FLOAT_NAMES.get(v, v) if v.__class__ is str else v
+    v = get('implant_coordinates_microns')
+    if v is not None: msg.implant_coordinates_microns = v
+    v = get('hemisphere')
+    if v is not None: msg.hemisphere = v
+    v = get('brain_nucleus')
+    if v is not None: msg.brain_nucleus.extend(v)
+    v = get('headstage')
+    if v is not None: msg.headstage = v
+    v = get('channel_group')
+    if v is not None: msg.channel_group = v
+    v = get('channels')
+    if v is not None: msg.channels = v
+    v = get('details')
+    if v is not None: msg.details.extend(v)
+    return msg
+
+
+def neural_probe_to_dict(msg):
+    """ Dictionary of a NeuralProbe message: all fields, proto field names, enums as names """
+    return {
+        'acquisition_signal': msg.acquisition_signal,
+        'manufacturer': msg.manufacturer,
+        'model': msg.model,
+        'serial_number': msg.serial_number,
+        'num_channels': msg.num_channels,
+        'tip_depth_microns': json_float32(msg.tip_depth_microns),
+        'implant_coordinates_microns': msg.implant_coordinates_microns,
+        'hemisphere': msg.hemisphere,
+        'brain_nucleus': list(msg.brain_nucleus),
+        'headstage': msg.headstage,
+        'channel_group': msg.channel_group,
+        'channels': msg.channels,
+        'details': list(msg.details),
+    }
+
+
+def default_neural_probe(msg):
+    """ Sets the template values of a NeuralProbe message """
+    msg.acquisition_signal = 'neural'
+    msg.manufacturer = 'neuropixel'
+    msg.model = 'neuropixel_1'
+    msg.serial_number = 'Uxxx'
+    msg.num_channels = 384
+    msg.tip_depth_microns = 0.0
+    msg.implant_coordinates_microns = '00 A/P, 00 M/L, 00 D/V'
+    msg.hemisphere = 'none'
+    msg.brain_nucleus.extend(['append repeated strings'])
+    msg.headstage = '_'
+    msg.channel_group = 'imec X'
+    msg.channels = '00-00'
+    return msg
+
+
+def validate_neural_probe(d, path=''):
+    """ Problems of a NeuralProbe dictionary, as "path: problem" strings (empty when it can be filled) """
+    if d.__class__ is not dict:
+        return ['%s: expected an object, got %r' % (path or '.', d)]
+    errors = []
+    for key in d:
+        if key not in _NeuralProbe_FIELDS:
+            errors.append('%s%s: unknown field' % (path, key))
+    get = d.get
+    v = get('acquisition_signal')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sacquisition_signal: expected a string, got %r' % (path, v))
+    v = get('manufacturer')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%smanufacturer: expected a string, got %r' % (path, v))
+    v = get('model')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%smodel: expected a string, got %r' % (path, v))
+    v = get('serial_number')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sserial_number: expected a string, got %r' % (path, v))
+    v = get('num_channels')
+    if v is not None and (v.__class__ is not int or not -2147483648 <= v < 2147483648):
+        errors.append('%snum_channels: expected an int32, got %r' % (path, v))
+    v = get('tip_depth_microns')
+    if v is not None and (v.__class__ not in (int, float) and (v.__class__ is not str or v not in _FLOAT_NAMES)):
+        errors.append('%stip_depth_microns: expected a number, got %r' % (path, v))
+    v = get('implant_coordinates_microns')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%simplant_coordinates_microns: expected a string, got %r' % (path, v))
+    v = get('hemisphere')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%shemisphere: expected a string, got %r' % (path, v))
+    v = get('brain_nucleus')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%sbrain_nucleus: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                if x.__class__ is not str:
+                    errors.append('%sbrain_nucleus[%d]: expected a string, got %r' % (path, i, x))
+    v = get('headstage')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sheadstage: expected a string, got %r' % (path, v))
+    v = get('channel_group')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%schannel_group: expected a string, got %r' % (path, v))
+    v = get('channels')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%schannels: expected a string, got %r' % (path, v))
+    v = get('details')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%sdetails: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                if x.__class__ is not str:
+                    errors.append('%sdetails[%d]: expected a string, got %r' % (path, i, x))
+    return errors
+
+
+def fill_sensor(d, msg):
+    """ Fills a Sensor message from a dictionary (see sensor_to_dict) """
+    get = d.get
+    v = get('acquisition_signal')
+    if v is not None: msg.acquisition_signal = v
+    v = get('manufacturer')
+    if v is not None: msg.manufacturer = v
+    v = get('model')
+    if v is not None: msg.model = v
+    v = get('serial_number')
+    if v is not None: msg.serial_number = v
+    v = get('signal_name')
+    if v is not None: msg.signal_name = v
+    v = get('headstage')
+    if v is not None: msg.headstage = v
+    v = get('channel_group')
+    if v is not None: msg.channel_group = v
+    v = get('channels')
+    if v is not None: msg.channels = v
+    v = get('locations')
+    if v is not None: msg.locations = v
+    v = get('details')
+    if v is not None: msg.details.extend(v)
+    return msg
+
+
+def sensor_to_dict(msg):
+    """ Dictionary of a Sensor message: all fields, proto field names, enums as names """
+    return {
+        'acquisition_signal': msg.acquisition_signal,
+        'manufacturer': msg.manufacturer,
+        'model': msg.model,
+        'serial_number': msg.serial_number,
+        'signal_name': msg.signal_name,
+        'headstage': msg.headstage,
+        'channel_group': msg.channel_group,
+        'channels': msg.channels,
+        'locations': msg.locations,
+        'details': list(msg.details),
+    }
+
+
+def default_sensor(msg):
+    """ Sets the template values of a Sensor message """
+    msg.acquisition_signal = '_'
+    msg.manufacturer = '_'
+    msg.model = '_'
+    msg.serial_number = '_'
+    msg.signal_name = '_'
+    msg.headstage = '_'
+    msg.channel_group = '_'
+    msg.channels = '_'
+    msg.locations = '_'
+    return msg
+
+
+def validate_sensor(d, path=''):
+    """ Problems of a Sensor dictionary, as "path: problem" strings (empty when it can be filled) """
+    if d.__class__ is not dict:
+        return ['%s: expected an object, got %r' % (path or '.', d)]
+    errors = []
+    for key in d:
+        if key not in _Sensor_FIELDS:
+            errors.append('%s%s: unknown field' % (path, key))
+    get = d.get
+    v = get('acquisition_signal')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sacquisition_signal: expected a string, got %r' % (path, v))
+    v = get('manufacturer')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%smanufacturer: expected a string, got %r' % (path, v))
+    v = get('model')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%smodel: expected a string, got %r' % (path, v))
+    v = get('serial_number')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sserial_number: expected a string, got %r' % (path, v))
+    v = get('signal_name')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%ssignal_name: expected a string, got %r' % (path, v))
+    v = get('headstage')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sheadstage: expected a string, got %r' % (path, v))
+    v = get('channel_group')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%schannel_group: expected a string, got %r' % (path, v))
+    v = get('channels')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%schannels: expected a string, got %r' % (path, v))
+    v = get('locations')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%slocations: expected a string, got %r' % (path, v))
+    v = get('details')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%sdetails: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                if x.__class__ is not str:
+                    errors.append('%sdetails[%d]: expected a string, got %r' % (path, i, x))
+    return errors
+
+
+def fill_stimulus(d, msg):
+    """ Fills a Stimulus message from a dictionary (see stimulus_to_dict) """
+    get = d.get
+    v = get('stimulus_signal')
+    if v is not None: msg.stimulus_signal = v
+    v = get('manufacturer')
+    if v is not None: msg.manufacturer = v
+    v = get('model')
+    if v is not None: msg.model = v
+    v = get('serial_number')
+    if v is not None: msg.serial_number = v
+    v = get('signal_name')
+    if v is not None: msg.signal_name = v
+    v = get('channel_gropup')
+    if v is not None: msg.channel_gropup = v
+    v = get('channels')
+    if v is not None: msg.channels = v
+    v = get('details')
+    if v is not None: msg.details.extend(v)
+    return msg
+
+
+def stimulus_to_dict(msg):
+    """ Dictionary of a Stimulus message: all fields, proto field names, enums as names """
+    return {
+        'stimulus_signal': msg.stimulus_signal,
+        'manufacturer': msg.manufacturer,
+        'model': msg.model,
+        'serial_number': msg.serial_number,
+        'signal_name': msg.signal_name,
+        'channel_gropup': msg.channel_gropup,
+        'channels': msg.channels,
+        'details': list(msg.details),
+    }
+
+
+def default_stimulus(msg):
+    """ Sets the template values of a Stimulus message """
+    msg.stimulus_signal = '_'
+    msg.manufacturer = '_'
+    msg.model = '_'
+    msg.serial_number = '_'
+    msg.signal_name = '_'
+    msg.channel_gropup = '_'
+    msg.channels = '_'
+    return msg
+
+
+def validate_stimulus(d, path=''):
+    """ Problems of a Stimulus dictionary, as "path: problem" strings (empty when it can be filled) """
+    if d.__class__ is not dict:
+        return ['%s: expected an object, got %r' % (path or '.', d)]
+    errors = []
+    for key in d:
+        if key not in _Stimulus_FIELDS:
+            errors.append('%s%s: unknown field' % (path, key))
+    get = d.get
+    v = get('stimulus_signal')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sstimulus_signal: expected a string, got %r' % (path, v))
+    v = get('manufacturer')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%smanufacturer: expected a string, got %r' % (path, v))
+    v = get('model')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%smodel: expected a string, got %r' % (path, v))
+    v = get('serial_number')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sserial_number: expected a string, got %r' % (path, v))
+    v = get('signal_name')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%ssignal_name: expected a string, got %r' % (path, v))
+    v = get('channel_gropup')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%schannel_gropup: expected a string, got %r' % (path, v))
+    v = get('channels')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%schannels: expected a string, got %r' % (path, v))
+    v = get('details')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%sdetails: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                if x.__class__ is not str:
+                    errors.append('%sdetails[%d]: expected a string, got %r' % (path, i, x))
+    return errors
+
+
+def fill_data_file(d, msg):
+    """ Fills a DataFile message from a dictionary (see data_file_to_dict) """
+    get = d.get
+    v = get('path')
+    if v is not None: msg.path = v
+    v = get('size')
+    if v is not None: msg.size = int(v)
+    v = get('modified_ns')
+    if v is not None: msg.modified_ns = int(v)
+    v = get('checksum')
+    if v is not None: msg.checksum = v
+    v = get('signal')
+    if v is not None: msg.signal = v
+    v = get('dtype')
+    if v is not None: msg.dtype = v
+    v = get('num_channels')
+    if v is not None: msg.num_channels = v
+    v = get('header_bytes')
+    if v is not None: msg.header_bytes = int(v)
+    return msg
+
+
+def data_file_to_dict(msg):
+    """ Dictionary of a DataFile message: all fields, proto field names, enums as names """
+    return {
+        'path': msg.path,
+        'size': str(msg.size),
+        'modified_ns': str(msg.modified_ns),
+        'checksum': msg.checksum,
+        'signal': msg.signal,
+        'dtype': msg.dtype,
+        'num_channels': msg.num_channels,
+        'header_bytes': str(msg.header_bytes),
+    }
+
+
+def default_data_file(msg):
+    """ Sets the template values of a DataFile message """
+    return msg
+
+
+def validate_data_file(d, path=''):
+    """ Problems of a DataFile dictionary, as "path: problem" strings (empty when it can be filled) """
+    if d.__class__ is not dict:
+        return ['%s: expected an object, got %r' % (path or '.', d)]
+    errors = []
+    for key in d:
+        if key not in _DataFile_FIELDS:
+            errors.append('%s%s: unknown field' % (path, key))
+    get = d.get
+    v = get('path')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%spath: expected a string, got %r' % (path, v))
+    v = get('size')
+    if v is not None and (v.__class__ is not int or not 0 <= v < 18446744073709551616):
+        errors.append('%ssize: expected a uint64, got %r' % (path, v))
+    v = get('modified_ns')
+    if v is not None and (v.__class__ is not int or not -9223372036854775808 <= v < 9223372036854775808):
+        errors.append('%smodified_ns: expected an int64, got %r' % (path, v))
+    v = get('checksum')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%schecksum: expected a string, got %r' % (path, v))
+    v = get('signal')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%ssignal: expected a string, got %r' % (path, v))
+    v = get('dtype')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sdtype: expected a string, got %r' % (path, v))
+    v = get('num_channels')
+    if v is not None and (v.__class__ is not int or not -2147483648 <= v < 2147483648):
+        errors.append('%snum_channels: expected an int32, got %r' % (path, v))
+    v = get('header_bytes')
+    if v is not None and (v.__class__ is not int or not 0 <= v < 18446744073709551616):
+        errors.append('%sheader_bytes: expected a uint64, got %r' % (path, v))
+    return errors
+
+
+def fill_acquisition(d, msg):
+    """ Fills a Acquisition message from a dictionary (see acquisition_to_dict) """
+    get = d.get
+    v = get('acquisition_hardware')
+    if v is not None: msg.acquisition_hardware = v
+    v = get('acquisition_software')
+    if v is not None: msg.acquisition_software = v
+    v = get('neuralprobes')
+    if v is not None:
+        add = msg.neuralprobes.add
+        for x in v: fill_neural_probe(x, add())
+    v = get('sensors')
+    if v is not None:
+        add = msg.sensors.add
+        for x in v: fill_sensor(x, add())
+    v = get('stimuli')
+    if v is not None:
+        add = msg.stimuli.add
+        for x in v: fill_stimulus(x, add())
+    v = get('datafiles')
+    if v is not None:
+        add = msg.datafiles.add
+        for x in v: fill_data_file(x, add())
+    return msg
+
+
+def acquisition_to_dict(msg):
+    """ Dictionary of a Acquisition message: all fields, proto field names, enums as names """
+    return {
+        'acquisition_hardware': msg.acquisition_hardware,
+        'acquisition_software': msg.acquisition_software,
+        'neuralprobes': [neural_probe_to_dict(x) for x in msg.neuralprobes],
+        'sensors': [sensor_to_dict(x) for x in msg.sensors],
+        'stimuli': [stimulus_to_dict(x) for x in msg.stimuli],
+        'datafiles': [data_file_to_dict(x) for x in msg.datafiles],
+    }
+
+
+def default_acquisition(msg):
+    """ Sets the template values of a Acquisition message """
+    msg.acquisition_hardware = 'hardware'
+    msg.acquisition_software = 'software'
+    return msg
+
+
+def validate_acquisition(d, path=''):
+    """ Problems of a Acquisition dictionary, as "path: problem" strings (empty when it can be filled) """
+    if d.__class__ is not dict:
+        return ['%s: expected an object, got %r' % (path or '.', d)]
+    errors = []
+    for key in d:
+        if key not in _Acquisition_FIELDS:
+            errors.append('%s%s: unknown field' % (path, key))
+    get = d.get
+    v = get('acquisition_hardware')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sacquisition_hardware: expected a string, got %r' % (path, v))
+    v = get('acquisition_software')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sacquisition_software: expected a string, got %r' % (path, v))
+    v = get('neuralprobes')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%sneuralprobes: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                errors.extend(validate_neural_probe(x, '%sneuralprobes[%d].' % (path, i)))
+    v = get('sensors')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%ssensors: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                errors.extend(validate_sensor(x, '%ssensors[%d].' % (path, i)))
+    v = get('stimuli')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%sstimuli: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                errors.extend(validate_stimulus(x, '%sstimuli[%d].' % (path, i)))
+    v = get('datafiles')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%sdatafiles: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                errors.extend(validate_data_file(x, '%sdatafiles[%d].' % (path, i)))
+    return errors
+
+
+def fill_session(d, msg):
+    """ Fills a Session message from a dictionary (see session_to_dict) """
+    get = d.get
+    v = get('bird_type')
+    if v is not None: msg.bird_type = _Session_BirdType_NUMBERS.get(v, v)
+    v = get('bird_sex')
+    if v is not None: msg.bird_sex = _Session_BirdSex_NUMBERS.get(v, v)
+    v = get('bird_uid')
+    if v is not None: msg.bird_uid = v
+    v = get('date')
+    if v is not None: msg.date = v
+    v = get('time')
+    if v is not None: msg.time = v
+    v = get('weight_grams')
+    if v is not None: msg.weight_grams = _FLOAT_NAMES.get(v, v) if v.__class__ is str else v
+    v = get('testosterone')
+    if v is not None: msg.testosterone = v
+    v = get('testosterone_date')
+    if v is not None: msg.testosterone_date = v
+    v = get('dummy_weight')
+    if v is not None: msg.dummy_weight = v
+    v = get('dummy_weight_grams')
+    if v is not None: msg.dummy_weight_grams = _FLOAT_NAMES.get(v, v) if v.__class__ is str else v
+    v = get('dummy_weight_date')
+    if v is not None: msg.dummy_weight_date = v
+    v = get('dummy_tether')
+    if v is not None: msg.dummy_tether = v
+    v = get('dummy_tether_date')
+    if v is not None: msg.dummy_tether_date = v
+    v = get('dummy_implant')
+    if v is not None: msg.dummy_implant = v
+    v = get('dummy_implant_date')
+    if v is not None: msg.dummy_implant_date = v
+    v = get('condition')
+    if v is not None: msg.condition = _Session_Condition_NUMBERS.get(v, v)
+    v = get('sess_uid')
+    if v is not None: msg.sess_uid = v
+    v = get('box')
+    if v is not None: msg.box = v
+    v = get('details')
+    if v is not None: msg.details.extend(v)
+    v = get('acquisitions')
+    if v is not None:
+        add = msg.acquisitions.add
+        for x in v: fill_acquisition(x, add())
+    return msg
+
+
+def session_to_dict(msg):
+    """ Dictionary of a Session message: all fields, proto field names, enums as names """
+    return {
+        'bird_type': _Session_BirdType_NAMES.get(msg.bird_type, msg.bird_type),
+        'bird_sex': _Session_BirdSex_NAMES.get(msg.bird_sex, msg.bird_sex),
+        'bird_uid': msg.bird_uid,
+        'date': msg.date,
+        'time': msg.time,
+        'weight_grams': json_float32(msg.weight_grams),
+        'testosterone': msg.testosterone,
+        'testosterone_date': msg.testosterone_date,
+        'dummy_weight': msg.dummy_weight,
+        'dummy_weight_grams': json_float32(msg.dummy_weight_grams),
+        'dummy_weight_date': msg.dummy_weight_date,
+        'dummy_tether': msg.dummy_tether,
+        'dummy_tether_date': msg.dummy_tether_date,
+        'dummy_implant': msg.dummy_implant,
+        'dummy_implant_date': msg.dummy_implant_date,
+        'condition': _Session_Condition_NAMES.get(msg.condition, msg.condition),
+        'sess_uid': msg.sess_uid,
+        'box': msg.box,
+        'details': list(msg.details),
+        'acquisitions': [acquisition_to_dict(x) for x in msg.acquisitions],
+    }
+
+
+def default_session(msg):
+    """ Sets the template values of a Session message """
+    msg.bird_type = 0
+    msg.bird_sex = 1
+    msg.bird_uid = 'x_x00x00_00'
+    msg.testosterone = False
+    msg.testosterone_date = 'YYYY-MM-DD'
+    msg.dummy_weight = False
+    msg.dummy_weight_grams = 0.0
+    msg.dummy_weight_date = 'YYYY-MM-DD'
+    msg.dummy_tether = False
+    msg.dummy_tether_date = 'YYYY-MM-DD'
+    msg.dummy_implant = False
+    msg.dummy_implant_date = 'YYYY-MM-DD'
+    msg.box = '_'
+    return msg
+
+
+def validate_session(d, path=''):
+    """ Problems of a Session dictionary, as "path: problem" strings (empty when it can be filled) """
+    if d.__class__ is not dict:
+        return ['%s: expected an object, got %r' % (path or '.', d)]
+    errors = []
+    for key in d:
+        if key not in _Session_FIELDS:
+            errors.append('%s%s: unknown field' % (path, key))
+    get = d.get
+    v = get('bird_type')
+    if v is not None and (v not in _Session_BirdType_NAMES if v.__class__ is int else v not in _Session_BirdType_NUMBERS):
+        errors.append('%sbird_type: expected a BirdType name or number, got %r' % (path, v))
+    v = get('bird_sex')
+    if v is not None and (v not in _Session_BirdSex_NAMES if v.__class__ is int else v not in _Session_BirdSex_NUMBERS):
+        errors.append('%sbird_sex: expected a BirdSex name or number, got %r' % (path, v))
+    v = get('bird_uid')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sbird_uid: expected a string, got %r' % (path, v))
+    v = get('date')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sdate: expected a string, got %r' % (path, v))
+    v = get('time')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%stime: expected a string, got %r' % (path, v))
+    v = get('weight_grams')
+    if v is not None and (v.__class__ not in (int, float) and (v.__class__ is not str or v not in _FLOAT_NAMES)):
+        errors.append('%sweight_grams: expected a number, got %r' % (path, v))
+    v = get('testosterone')
+    if v is not None and (v.__class__ is not bool):
+        errors.append('%stestosterone: expected a bool, got %r' % (path, v))
+    v = get('testosterone_date')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%stestosterone_date: expected a string, got %r' % (path, v))
+    v = get('dummy_weight')
+    if v is not None and (v.__class__ is not bool):
+        errors.append('%sdummy_weight: expected a bool, got %r' % (path, v))
+    v = get('dummy_weight_grams')
+    if v is not None and (v.__class__ not in (int, float) and (v.__class__ is not str or v not in _FLOAT_NAMES)):
+        errors.append('%sdummy_weight_grams: expected a number, got %r' % (path, v))
+    v = get('dummy_weight_date')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sdummy_weight_date: expected a string, got %r' % (path, v))
+    v = get('dummy_tether')
+    if v is not None and (v.__class__ is not bool):
+        errors.append('%sdummy_tether: expected a bool, got %r' % (path, v))
+    v = get('dummy_tether_date')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sdummy_tether_date: expected a string, got %r' % (path, v))
+    v = get('dummy_implant')
+    if v is not None and (v.__class__ is not bool):
+        errors.append('%sdummy_implant: expected a bool, got %r' % (path, v))
+    v = get('dummy_implant_date')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sdummy_implant_date: expected a string, got %r' % (path, v))
+    v = get('condition')
+    if v is not None and (v not in _Session_Condition_NAMES if v.__class__ is int else v not in _Session_Condition_NUMBERS):
+        errors.append('%scondition: expected a Condition name or number, got %r' % (path, v))
+    v = get('sess_uid')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%ssess_uid: expected a string, got %r' % (path, v))
+    v = get('box')
+    if v is not None and (v.__class__ is not str):
+        errors.append('%sbox: expected a string, got %r' % (path, v))
+    v = get('details')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%sdetails: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                if x.__class__ is not str:
+                    errors.append('%sdetails[%d]: expected a string, got %r' % (path, i, x))
+    v = get('acquisitions')
+    if v is not None:
+        if v.__class__ is not list:
+            errors.append('%sacquisitions: expected a list, got %r' % (path, v))
+        else:
+            for i, x in enumerate(v):
+                errors.extend(validate_acquisition(x, '%sacquisitions[%d].' % (path, i)))
+    return errors
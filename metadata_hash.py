@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+"""Content hashing and deduplication of Birdsong Project sessions
+
+Two sessions with the same content always have the same canonical bytes: the session is re-serialized
+deterministically (fields in field-number order), optionally without the fields that change between
+reruns of the acquisition script (time, sess_uid). The BLAKE2b digest of those bytes identifies the
+content of a session regardless of the name of the file it was stored in.
+
+Usage:
+    python metadata_hash.py SOURCE [SOURCE ...] [--ignore-volatile] [--delete | --move DIR]
+"""
+
+import os
+import shutil
+import hashlib
+import argparse
+import metadata_pb2
+from google.protobuf.json_format import ParseError
+from google.protobuf.message import DecodeError
+from metadata_API import load_session
+from metadata_archive import ArchiveError, is_archive, iter_archive_records, SessionArchiveWriter
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+VOLATILE_FIELDS = ('time', 'sess_uid')      # Regenerated every time the Pi script runs
+DIGEST_SIZE = 16                            # 128 bit digests: compact, collisions are not a concern
+
+
+def canonical_bytes(sess, exclude=()):
+    """ Deterministic serialization of a session, identical for any two sessions with the same content
+
+    Parameters
+    ----------
+    sess : metadata_pb2.Session or bytes
+        Session, or its serialized bytes
+    exclude : tuple of str
+        Top-level fields left out of the canonical form, e.g. VOLATILE_FIELDS
+
+    Returns
+    -------
+    bytes
+        Canonical serialized session
+    """
+
+    if isinstance(sess, (bytes, bytearray, memoryview)):
+        data, sess = sess, metadata_pb2.Session()
+        sess.ParseFromString(data)
+    elif exclude:
+        copy = metadata_pb2.Session()
+        copy.CopyFrom(sess)
+        sess = copy
+    for name in exclude:
+        sess.ClearField(name)
+    return sess.SerializeToString(deterministic=True)
+
+
+def session_hash(sess, exclude=(), digest_size=DIGEST_SIZE):
+    """ BLAKE2b content hash of a session
+
+    Parameters
+    ----------
+    sess : metadata_pb2.Session or bytes
+        Session, or its serialized bytes
+    exclude : tuple of str
+        Top-level fields ignored by the hash, e.g. VOLATILE_FIELDS
+    digest_size : int
+        Size of the digest in bytes (1 to 64)
+
+    Returns
+    -------
+    bytes
+        The digest (use .hex() for a printable form)
+    """
+
+    return hashlib.blake2b(canonical_bytes(sess, exclude), digest_size=digest_size).digest()
+
+
+def iter_sources(sources, errors=None):
+    """ Yields (location, session payload or Session) for files, directory trees and archives
+
+    location is a path for metadata files and (path, offset) for archive records. .json files that are not
+    sessions (e.g. manifests) are skipped, as are the records of an archive after a damaged one, and
+    (location, error) appended to errors when it is a list.
+    """
+
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                # .pb files sort before the .json of the same session, so the .pb is the copy that is kept
+                names = sorted(files, key=lambda name: (os.path.splitext(name)[0], not name.endswith('.pb')))
+                yield from iter_sources((os.path.join(root, name) for name in names
+                                          if name.endswith(('.pb', '.json')) or is_archive(os.path.join(root, name))),
+                                         errors)
+        elif is_archive(source):
+            try:
+                for offset, payload in iter_archive_records(source):
+                    yield (source, offset), payload
+            except ArchiveError as e:
+                if errors is not None:
+                    errors.append(((source, e.offset), '%s: %s' % (type(e).__name__, e)))
+        elif source.endswith('.json'):
+            try:
+                sess = load_session(source)
+            except (ParseError, ValueError) as e:
+                if errors is not None:
+                    errors.append((source, '%s: %s' % (type(e).__name__, e)))
+                continue
+            yield source, sess
+        else:
+            with open(source, 'rb') as f:
+                yield source, f.read()
+
+
+def _is_twin(a, b):
+    """ Private helper: True for the .pb and .json files of the same session """
+
+    if isinstance(a, tuple) or isinstance(b, tuple):
+        return False
+    return os.path.splitext(a)[0] == os.path.splitext(b)[0]
+
+
+def find_duplicates(sources, exclude=(), errors=None):
+    """ Stream the duplicate sessions found in files, directory trees and archives in a single pass
+
+    Only one digest per distinct session is kept in memory. The .json twin of a .pb file
+    (<name>.pb / <name>.json) is not reported as a duplicate.
+
+    Parameters
+    ----------
+    sources : list of str
+        Metadata files, directories (walked recursively) and session archives
+    exclude : tuple of str
+        Top-level fields ignored when comparing sessions, e.g. VOLATILE_FIELDS
+    errors : list
+        Receives (location, error) for what is not a session and is skipped: .json files that are not
+        sessions, .pb files and archive records that do not parse, the records after a damaged one
+
+    Yields
+    ------
+    (location, location)
+        The duplicate and the first location holding the same content. A location is a path, or an
+        (archive path, record offset) tuple
+    """
+
+    seen = {}
+    for location, sess in iter_sources(sources, errors):
+        try:
+            digest = session_hash(sess, exclude)
+        except (DecodeError, ValueError) as e:
+            if errors is not None:
+                errors.append((location, '%s: %s' % (type(e).__name__, e)))
+            continue
+        first = seen.setdefault(digest, location)
+        if first is not location and not _is_twin(location, first):
+            yield location, first
+
+
+def _unique_destination(directory, name):
+    """ Private helper: path of name in directory, as <stem>_2<ext>, ... when it is taken """
+
+    stem, ext = os.path.splitext(name)
+    path, n = os.path.join(directory, name), 1
+    while os.path.exists(path):
+        n += 1
+        path = os.path.join(directory, '%s_%d%s' % (stem, n, ext))
+    return path
+
+
+def collapse_duplicate_files(sources, exclude=(), action='report', move_to=None, errors=None):
+    """ Find duplicate metadata files and optionally delete them or move them aside
+
+    Archive records are reported but never modified (see dedupe_archive). The first file in walk order
+    is always kept.
+
+    Parameters
+    ----------
+    sources : list of str
+        Metadata files, directories (walked recursively) and session archives
+    exclude : tuple of str
+        Top-level fields ignored when comparing sessions, e.g. VOLATILE_FIELDS
+    action : str
+        'report' (default, nothing is touched), 'delete' or 'move'
+    move_to : str
+        Destination directory of the duplicates when action is 'move' (a duplicate whose name is already
+        taken there is moved as <name>_2.pb, ...)
+    errors : list
+        Receives (location, error) for what is not a session (see find_duplicates)
+
+    Returns
+    -------
+    list of (location, location)
+        The (duplicate, kept) pairs found
+    """
+
+    if action not in ('report', 'delete', 'move'):
+        raise ValueError('action must be report, delete or move')
+    pairs = list(find_duplicates(sources, exclude, errors))
+    if action == 'move':
+        os.makedirs(move_to, exist_ok=True)
+    for duplicate, kept in pairs:
+        if isinstance(duplicate, tuple) or action == 'report':
+            continue
+        if action == 'delete':
+            os.remove(duplicate)
+        else:
+            shutil.move(duplicate, _unique_destination(move_to, os.path.basename(duplicate)))
+    return pairs
+
+
+def dedupe_archive(src, dst, exclude=()):
+    """ Copy the records of an archive to a new archive, keeping only the first copy of every session
+
+    Parameters
+    ----------
+    src : str
+        Source session archive
+    dst : str
+        Destination archive (overwritten; must not be src)
+    exclude : tuple of str
+        Top-level fields ignored when comparing sessions, e.g. VOLATILE_FIELDS
+
+    Returns
+    -------
+    (int, int)
+        Number of records kept and number of duplicates dropped
+    """
+
+    if os.path.abspath(src) == os.path.abspath(dst):
+        raise ValueError('dedupe_archive writes a new archive: dst must differ from src')
+    seen = set()
+    kept = dropped = 0
+    with SessionArchiveWriter(dst, truncate=True) as writer:
+        for _, payload in iter_archive_records(src):
+            digest = session_hash(payload, exclude)
+            if digest in seen:
+                dropped += 1
+                continue
+            seen.add(digest)
+            writer.append(payload)
+            kept += 1
+    return kept, dropped
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Find duplicate sessions in metadata files and archives')
+    parser.add_argument('sources', nargs='+', help='metadata files, directories and session archives')
+    parser.add_argument('--ignore-volatile', action='store_true', help='ignore time and sess_uid')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--delete', action='store_true', help='delete duplicate files')
+    group.add_argument('--move', metavar='DIR', help='move duplicate files to DIR')
+    args = parser.parse_args(argv)
+
+    action = 'delete' if args.delete else 'move' if args.move else 'report'
+    exclude = VOLATILE_FIELDS if args.ignore_volatile else ()
+    errors = []
+    pairs = collapse_duplicate_files(args.sources, exclude=exclude, action=action, move_to=args.move, errors=errors)
+    for duplicate, kept in pairs:
+        print('%s  duplicate of  %s' % (duplicate, kept))
+    for location, error in errors:
+        print('SKIPPED %s: %s' % (location, error))
+    print('%d duplicates' % len(pairs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+
+"""Per-bird time series of the values tracked across daily Birdsong Project sessions
+
+BirdHistory scans metadata files and session archives once and keeps, for every bird_uid, one array per
+top-level scalar field of the Session (weight_grams, testosterone, dummy_weight_grams, box, condition,
+...), sorted by the session timestamp. date / time are parsed once into a UTC datetime64 timestamp (see
+metadata_time; query bounds are local times of the lab), and the *_date fields into datetime64 dates. With a cache directory the arrays are stored as one .npz file per
+bird next to a manifest of the sources already scanned; refresh() then only reads what is new (records
+appended to archives, new or modified files), so queries never rescan the data.
+
+    history = BirdHistory(['/data/archive.pb'], cache_dir='/data/history')
+    bird = history['z_m10g8_20']
+    bird.as_of('2021-03-10')                          # values of the last session on or before that day
+    bird.range('2021-03-01', '2021-04-01')            # sub-series
+    bird.resample('weight_grams', '1D', how='mean')   # (bin starts, daily means)
+"""
+
+import os
+import json
+from datetime import datetime, timezone
+import numpy as np
+from urllib.parse import quote
+import metadata_pb2
+from metadata_API import load_session
+from metadata_partial import parse_masked, HEADER_FIELDS
+from metadata_time import session_times, parse_dates, local_to_utc, utc_to_local
+from metadata_archive import ARCHIVE_MAGIC, RECORD_HEADER, is_archive, iter_archive_records, read_archive_session
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+_CACHE_VERSION = 2
+_F = metadata_pb2.Session.DESCRIPTOR.fields_by_name['date']     # any FieldDescriptor, for the type constants
+
+
+def _column_dtype(field):
+    """ Private helper: numpy dtype of the column of a top-level field (None: the field is not tracked) """
+
+    if field.label == field.LABEL_REPEATED or field.message_type is not None:
+        return None
+    if field.name in ('date', 'time'):
+        return None                                     # combined into the timestamp column
+    if field.enum_type is not None:
+        return np.dtype(np.int32)
+    if field.cpp_type == _F.CPPTYPE_BOOL:
+        return np.dtype(bool)
+    if field.cpp_type == _F.CPPTYPE_FLOAT:
+        return np.dtype(np.float32)
+    if field.cpp_type == _F.CPPTYPE_DOUBLE:
+        return np.dtype(np.float64)
+    if field.cpp_type in (_F.CPPTYPE_INT32, _F.CPPTYPE_INT64, _F.CPPTYPE_UINT32, _F.CPPTYPE_UINT64):
+        return np.dtype(np.int64)
+    if field.name.endswith('_date'):
+        return np.dtype('datetime64[D]')
+    return np.dtype(str)
+
+
+# Tracked fields and their dtypes, derived from metadata.proto
+COLUMNS = {f.name: _column_dtype(f) for f in metadata_pb2.Session.DESCRIPTOR.fields if _column_dtype(f) is not None}
+
+
+def columns_from_sessions(sessions, locations, offsets):
+    """ {column: array} of a list of parsed sessions, locations and record offsets (the index layout) """
+
+    columns = {'timestamp': session_times([s.date for s in sessions], [s.time for s in sessions],
+                                          [s.sess_uid for s in sessions])}
+    for name, dtype in COLUMNS.items():
+        values = [getattr(s, name) for s in sessions]
+        columns[name] = parse_dates(values) if dtype.kind == 'M' else np.array(values, dtype=dtype)
+    columns['location'] = np.array(locations, dtype=str)
+    columns['offset'] = np.array(offsets, dtype=np.int64)
+    return columns
+
+
+def _empty_columns():
+    return columns_from_sessions([], [], [])
+
+
+class BirdSeries:
+
+    """ The sessions of one bird as time-sorted columns
+
+    Attributes
+    ----------
+    bird_uid : str
+    timestamp : numpy.ndarray of datetime64[us]
+        Session timestamps in UTC (see metadata_time), sorted
+    columns : dict of str -> numpy.ndarray
+        One array per tracked field (see COLUMNS), plus 'location' / 'offset' locating the session on disk
+        (offset is -1 for metadata files). Columns are also available as attributes: series.weight_grams
+    """
+
+    def __init__(self, bird_uid, columns):
+
+        self.bird_uid = bird_uid
+        self.columns = columns
+
+    @property
+    def timestamp(self):
+        return self.columns['timestamp']
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns', {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def __repr__(self):
+        return 'BirdSeries(%r, %d sessions)' % (self.bird_uid, len(self))
+
+    def _take(self, index):
+        return BirdSeries(self.bird_uid, {name: column[index] for name, column in self.columns.items()})
+
+    @staticmethod
+    def _bound(when, end_of_day):
+        """ Private method: UTC datetime64[us] of a query bound
+
+        Strings, naive datetimes and datetime64 values are local times of the lab; a bare date means the start
+        (or end) of that local day. Timezone-aware datetimes are converted as they are.
+        """
+
+        if isinstance(when, datetime) and when.tzinfo is not None:
+            return np.datetime64(when.astimezone(timezone.utc).replace(tzinfo=None), 'us')
+        when = np.datetime64(when)
+        if end_of_day and np.datetime_data(when.dtype)[0] in ('D', 'W', 'M', 'Y'):
+            when = (when + 1).astype('datetime64[us]') - np.timedelta64(1, 'us')
+        return local_to_utc(np.array([when], dtype='datetime64[us]'))[0]
+
+    def range(self, start=None, end=None):
+        """ Sessions with start <= timestamp <= end (dates include the whole day of end)
+
+        Parameters
+        ----------
+        start, end : str, datetime or numpy.datetime64
+            Bounds of the range (None: unbounded)
+
+        Returns
+        -------
+        BirdSeries
+        """
+
+        t = self.timestamp
+        first = 0 if start is None else np.searchsorted(t, self._bound(start, False), 'left')
+        last = len(t) if end is None else np.searchsorted(t, self._bound(end, True), 'right')
+        return self._take(slice(first, last))
+
+    def as_of(self, when):
+        """ Values of the last session on or before a moment, e.g. as_of('2021-03-10') for the setup of that day
+
+        Returns
+        -------
+        dict or None
+            {column: value} of that session, None if the bird had no session yet
+        """
+
+        i = np.searchsorted(self.timestamp, self._bound(when, True), 'right') - 1
+        if i < 0:
+            return None
+        return {name: column[i].item() for name, column in self.columns.items()}
+
+    def session_as_of(self, when):
+        """ The complete Session (acquisitions included) of the last session on or before a moment, or None """
+
+        row = self.as_of(when)
+        if row is None:
+            return None
+        if row['offset'] >= 0:
+            return read_archive_session(row['location'], row['offset'])
+        if row['location'].endswith('.json'):
+            return load_session(row['location'])
+        sess = metadata_pb2.Session()
+        with open(row['location'], 'rb') as f:
+            sess.ParseFromString(f.read())
+        return sess
+
+    def _fixed_bins(self, t, step, start, end):
+        """ Private method: (bin starts, bin index of every timestamp) of bins of a fixed length """
+
+        if start is not None:
+            origin = self._bound(start, False)
+        elif len(t):
+            # First bin starts on a whole period of local time, e.g. the local midnight before the first session
+            first = utc_to_local(t[:1])[0]
+            origin = local_to_utc(np.array([first - (first - np.datetime64(0, 'us')) % step]))[0]
+        else:
+            origin = np.datetime64(0, 'us')
+        stop = self._bound(end, True) if end is not None else (t[-1] if len(t) else origin)
+        n_bins = int((stop - origin) // step) + 1
+        return origin + step * np.arange(n_bins), ((t - origin) // step).astype(np.int64)
+
+    def _calendar_bins(self, t, unit, n, start, end):
+        """ Private method: (bin starts, bin index of every timestamp) of bins of n local months or years """
+
+        def periods(utc):
+            # Months / years since 1970 of the local times of UTC values
+            return utc_to_local(utc).astype('datetime64[%s]' % unit).astype(np.int64)
+
+        if start is not None:
+            origin = periods([self._bound(start, False)])[0]
+        elif len(t):
+            origin = periods(t[:1])[0]
+            origin -= origin % n
+        else:
+            origin = 0
+        stop = periods([self._bound(end, True)])[0] if end is not None else (periods(t[-1:])[0] if len(t) else origin)
+        firsts = (origin + n * np.arange((stop - origin) // n + 1)).astype('datetime64[%s]' % unit)
+        return local_to_utc(firsts.astype('datetime64[us]')), (periods(t) - origin) // n
+
+    def resample(self, column, every='1D', how='last', start=None, end=None, fill=False):
+        """ Aggregate a column over regular time bins
+
+        Parameters
+        ----------
+        column : str
+            Tracked field, e.g. 'weight_grams'
+        every : str or numpy.timedelta64
+            Bin width, e.g. '1D', '12h', '1W': bins of a fixed length in UTC. Months and years ('1M', '3M',
+            '1Y') are calendar bins starting on the first day of a local month / year
+        how : str
+            'last', 'first', 'count', or for numeric columns 'mean', 'sum', 'min', 'max'
+        start, end : str, datetime or numpy.datetime64
+            Bounds of the bins (default: the first and last sessions)
+        fill : bool
+            Forward-fill empty bins with the previous bin's value (only meaningful for 'last' / 'first')
+
+        Returns
+        -------
+        (numpy.ndarray of datetime64[us], numpy.ndarray)
+            Start of every bin and its aggregated value. Empty bins hold NaN (NaT for dates, '' for
+            strings, 0 for counts) unless filled
+        """
+
+        if isinstance(every, str):
+            digits = every.rstrip('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+            every = np.timedelta64(int(digits or 1), every[len(digits):])
+        series = self.range(start, end)
+        t = series.timestamp
+        values = series.columns[column]
+        keep = ~np.isnat(t)
+        t, values = t[keep], values[keep]
+        unit = np.datetime_data(every.dtype)[0]
+        if unit in ('M', 'Y'):
+            bins, index = self._calendar_bins(t, unit, int(every.astype(np.int64)), start, end)
+        else:
+            bins, index = self._fixed_bins(t, every.astype('timedelta64[us]'), start, end)
+        n_bins = len(bins)
+
+        counts = np.bincount(index, minlength=n_bins)
+        if how == 'count':
+            return bins, counts
+        if how in ('last', 'first'):
+            out = np.full(n_bins, _missing(values.dtype), dtype=values.dtype)
+            order = slice(None) if how == 'last' else slice(None, None, -1)
+            out[index[order]] = values[order]            # later assignments win
+        elif how in ('mean', 'sum', 'min', 'max'):
+            numeric = values.astype(np.float64)
+            if how in ('mean', 'sum'):
+                sums = np.bincount(index, weights=numeric, minlength=n_bins)
+                out = sums / np.where(counts, counts, 1) if how == 'mean' else sums
+            else:
+                out = np.full(n_bins, np.inf if how == 'min' else -np.inf)
+                (np.minimum if how == 'min' else np.maximum).at(out, index, numeric)
+            out = np.where(counts > 0, out, np.nan)
+        else:
+            raise ValueError('how must be last, first, count, mean, sum, min or max')
+        if fill:
+            filled = np.maximum.accumulate(np.where(counts > 0, np.arange(n_bins), -1))
+            out = np.where(filled >= 0, out[np.maximum(filled, 0)], out)
+        return bins, out
+
+
+def _signature(path):
+    """ Private helper: [mtime_ns, size] of a file, stored in the manifest to tell when it changed """
+
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _missing(dtype):
+    """ Private helper: value of empty bins for a column dtype """
+
+    if dtype.kind == 'M':
+        return np.datetime64('NaT')
+    if dtype.kind == 'U':
+        return ''
+    if dtype.kind == 'f':
+        return np.nan
+    return 0
+
+
+class BirdHistory:
+
+    """ Time series of every bird found in metadata files and session archives
+
+    Parameters
+    ----------
+    sources : list of str
+        Session archives, metadata files (.pb / .json) and directories (walked recursively)
+    cache_dir : str
+        Directory holding the cached arrays (created if needed). None keeps everything in memory
+    refresh : bool
+        Scan the sources for new sessions immediately
+
+    Attributes
+    ----------
+    errors : list of (str, str)
+        (path, error) of the files the last refresh() could not read, e.g. .json files that are not sessions.
+        A rejected file is read again only once it is modified
+    """
+
+    def __init__(self, sources, cache_dir=None, refresh=True):
+
+        self.sources = list(sources)
+        self.cache_dir = cache_dir
+        self.errors = []
+        self._series = {}
+        self._manifest = {'version': _CACHE_VERSION, 'sources': {}}
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, 'manifest.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    manifest = json.load(f)
+                if manifest.get('version') == _CACHE_VERSION:
+                    self._manifest = manifest
+        if refresh:
+            self.refresh()
+
+    def birds(self):
+        """ Sorted list of the bird_uids with at least one session """
+
+        return sorted(self._manifest.get('birds', []))
+
+    def __contains__(self, bird_uid):
+        return bird_uid in self._manifest.get('birds', [])
+
+    def __getitem__(self, bird_uid):
+        """ BirdSeries of a bird (loaded from the cache on first access) """
+
+        if bird_uid not in self._series:
+            if bird_uid not in self:
+                raise KeyError(bird_uid)
+            self._series[bird_uid] = self._load(bird_uid)
+        return self._series[bird_uid]
+
+    '''Cache'''
+
+    def _bird_path(self, bird_uid):
+        return os.path.join(self.cache_dir, quote(bird_uid, safe='') + '.npz')
+
+    def _load(self, bird_uid):
+        """ Private method: reads the cached arrays of a bird """
+
+        if self.cache_dir is None or not os.path.exists(self._bird_path(bird_uid)):
+            return BirdSeries(bird_uid, _empty_columns())
+        with np.load(self._bird_path(bird_uid), allow_pickle=False) as npz:
+            return BirdSeries(bird_uid, {name: npz[name] for name in npz.files})
+
+    def _save(self, bird_uids):
+        """ Private method: writes the arrays of the modified birds, then the manifest (atomically) """
+
+        if self.cache_dir is None:
+            return
+        for bird_uid in bird_uids:
+            path = self._bird_path(bird_uid)
+            with open(path + '.tmp', 'wb') as f:
+                np.savez(f, **self._series[bird_uid].columns)
+            os.replace(path + '.tmp', path)
+        path = os.path.join(self.cache_dir, 'manifest.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self._manifest, f)
+        os.replace(path + '.tmp', path)
+
+    '''Scanning'''
+
+    def _iter_files(self):
+        """ Private method: the archives and metadata files of the sources """
+
+        cache_dir = os.path.abspath(self.cache_dir) if self.cache_dir is not None else None
+        for source in self.sources:
+            if not os.path.isdir(source):
+                yield source
+                continue
+            for root, dirs, files in os.walk(source):
+                dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != cache_dir)
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    if name.endswith(('.pb', '.json')) or is_archive(path):
+                        yield path
+
+    def _scan(self, path, state, signature):
+        """ Private method: sessions of a file not read yet, updating its manifest state
+
+        signature is the [mtime_ns, size] of the file, as _signature returns it.
+
+        Returns
+        -------
+        (list of Session, list of offsets, bool)
+            The new sessions, their archive offsets (-1 for metadata files) and whether the file was
+            rewritten since the last scan (its previous rows are then stale)
+        """
+
+        if state.get('signature') == signature:
+            return [], [], False
+        sessions, offsets = [], []
+        if is_archive(path):
+            # Archives only grow: resume after the last record read, unless the first record changed
+            with open(path, 'rb') as f:
+                head = f.read(len(ARCHIVE_MAGIC) + RECORD_HEADER.size).hex()
+            size = signature[1]
+            end = state.get('end')
+            rewritten = end is not None and (end > size or state.get('head') != head)
+            start = None if end is None or rewritten else end
+            for offset, payload in iter_archive_records(path, start=start, stop=size):
+                sessions.append(parse_masked(payload, HEADER_FIELDS))
+                offsets.append(offset)
+            state['end'] = size
+            state['head'] = head
+        else:
+            rewritten = state.get('signature') is not None
+            if path.endswith('.json'):
+                sessions.append(load_session(path))
+            else:
+                with open(path, 'rb') as f:
+                    sessions.append(parse_masked(f.read(), HEADER_FIELDS))
+            offsets.append(-1)
+        state['signature'] = signature
+        return sessions, offsets, rewritten
+
+    def _drop_location(self, path, birds):
+        """ Private method: removes the rows of a rewritten or deleted file from the birds it contributed to """
+
+        for bird_uid in birds:
+            series = self[bird_uid]
+            self._series[bird_uid] = series._take(series.columns['location'] != path)
+
+    def refresh(self):
+        """ Scan the sources for new or modified sessions and update the arrays (and the cache)
+
+        Returns
+        -------
+        int
+            Number of sessions added
+        """
+
+        known = self._manifest['sources']
+        birds = set(self._manifest.get('birds', []))
+        self._manifest['birds'] = sorted(birds)
+        self.errors = []
+        seen = set()
+        new = {}                # bird_uid -> ([sessions], [locations], [offsets])
+        modified = set()
+        for path in self._iter_files():
+            seen.add(path)
+            state = known.setdefault(path, {'birds': []})
+            previous = json.loads(json.dumps(state))
+            signature = None
+            try:
+                signature = _signature(path)
+                if state.get('rejected') == signature:
+                    self.errors.append((path, state['error']))      # Unchanged since it failed: not read again
+                    continue
+                sessions, offsets, rewritten = self._scan(path, state, signature)
+            except Exception as e:
+                error = '%s: %s' % (type(e).__name__, e)
+                known[path] = previous
+                if signature is not None:
+                    previous['rejected'] = signature
+                    previous['error'] = error
+                self.errors.append((path, error))
+                continue
+            state.pop('rejected', None)
+            state.pop('error', None)
+            if rewritten:
+                self._drop_location(path, state['birds'])
+                modified.update(state['birds'])
+                state['birds'] = []
+            for sess, offset in zip(sessions, offsets):
+                rows = new.setdefault(sess.bird_uid, ([], [], []))
+                rows[0].append(sess)
+                rows[1].append(path)
+                rows[2].append(offset)
+                if sess.bird_uid not in state['birds']:
+                    state['birds'].append(sess.bird_uid)
+
+        for path in [p for p in known if p not in seen]:
+            gone = known.pop(path)['birds']
+            self._drop_location(path, gone)
+            modified.update(gone)
+
+        added = 0
+        for bird_uid, (sessions, locations, offsets) in new.items():
+            series = self[bird_uid] if bird_uid in birds else BirdSeries(bird_uid, _empty_columns())
+            columns = columns_from_sessions(sessions, locations, offsets)
+            merged = {name: np.concatenate([series.columns[name], columns[name]]) for name in columns}
+            order = np.argsort(merged['timestamp'], kind='stable')
+            self._series[bird_uid] = BirdSeries(bird_uid, {name: column[order] for name, column in merged.items()})
+            birds.add(bird_uid)
+            modified.add(bird_uid)
+            added += len(sessions)
+        for bird_uid in [b for b in modified if not len(self._series[b])]:
+            del self._series[bird_uid]
+            birds.discard(bird_uid)
+            modified.discard(bird_uid)
+            if self.cache_dir is not None and os.path.exists(self._bird_path(bird_uid)):
+                os.remove(self._bird_path(bird_uid))
+        self._manifest['birds'] = sorted(birds)
+        self._save(modified)
+        return added
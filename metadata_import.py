@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+"""Bulk import of Birdsong Project metadata written in any past format
+
+Recognized inputs:
+
+    pickle      python dictionaries pickled by the first acquisition scripts, e.g. deprecated/metadata.pickle
+    pb-legacy   .pb files of a legacy layout (see metadata_legacy), e.g. deprecated/eg_meta_*.pb
+    pb          .pb files of the current layout
+    json        .json files written by export_metadata_to_json (any layout, see metadata_migrations)
+    archive     session archives (see metadata_archive)
+
+Every input is converted to current Session messages by a pool of worker processes and written to one
+session archive, or to one <sess_uid>_metadata.pb file per session in an output directory. Inputs that
+cannot be converted are copied to a quarantine directory next to a .error.txt file giving the reason;
+originals are never modified.
+
+Usage:
+    python metadata_import.py OUTPUT SOURCE [SOURCE ...] [--workers N] [--quarantine DIR]
+"""
+
+import os
+import io
+import re
+import json
+import time
+import pickle
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import metadata_pb2
+from google.protobuf.json_format import ParseDict
+from metadata_legacy import CURRENT_VERSION, legacy_pb_to_dict
+from metadata_migrations import detect_dict_version, upgrade_dict, upgrade_serialized
+from metadata_archive import is_archive, iter_archive_records, SessionArchiveWriter
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+FORMATS = ('pickle', 'pb-legacy', 'pb', 'json', 'archive')
+_PICKLE_EXTENSIONS = ('.pickle', '.pkl')
+_EXTENSIONS = ('.pb', '.json') + _PICKLE_EXTENSIONS
+_UNSAFE = re.compile(r'[^\w.:+-]')         # Characters replaced in output file names (keeps sess_uid ':')
+
+
+class _DataUnpickler(pickle.Unpickler):
+
+    """ Unpickler restricted to plain data: metadata pickles never hold objects, so no class is ever loaded """
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError('%s.%s is not allowed in a metadata pickle' % (module, name))
+
+
+def _is_pickle(path, data):
+    """ Private helper: pickles start with the PROTO opcode (protocol 2+) and end with STOP """
+
+    if path.endswith(_PICKLE_EXTENSIONS):
+        return True
+    return len(data) > 2 and data[0] == 0x80 and data[-1:] == b'.'
+
+
+def detect_format(path):
+    """ Detect the format of a metadata file
+
+    Parameters
+    ----------
+    path : str
+        File to inspect
+
+    Returns
+    -------
+    str
+        One of FORMATS
+
+    Raises
+    ------
+    ValueError
+        If the file is not in any known format
+    """
+
+    if is_archive(path):
+        return 'archive'
+    if path.endswith('.json'):
+        return 'json'
+    with open(path, 'rb') as f:
+        data = f.read()
+    if _is_pickle(path, data):
+        return 'pickle'
+    version, _ = legacy_pb_to_dict(data)
+    return 'pb' if version == CURRENT_VERSION else 'pb-legacy'
+
+
+def _session_from_dict(doc):
+    """ Private helper: current Session from a session dictionary of any layout """
+
+    if not isinstance(doc, dict):
+        raise ValueError('Expected a session dictionary, got %s' % type(doc).__name__)
+    sess = metadata_pb2.Session()
+    ParseDict(upgrade_dict(doc, detect_dict_version(doc)), sess)
+    return sess
+
+
+def convert_file(path):
+    """ Convert a metadata file of any known format to current sessions
+
+    Parameters
+    ----------
+    path : str
+        File to convert
+
+    Returns
+    -------
+    (str, list of metadata_pb2.Session)
+        The detected format and the sessions it holds (archives and pickled lists hold several)
+    """
+
+    if is_archive(path):
+        return 'archive', [upgrade_serialized(payload)[1] for _, payload in iter_archive_records(path)]
+    if path.endswith('.json'):
+        with open(path) as f:
+            return 'json', [_session_from_dict(json.load(f))]
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    if _is_pickle(path, data):
+        doc = _DataUnpickler(io.BytesIO(data)).load()
+        docs = doc if isinstance(doc, list) else [doc]
+        return 'pickle', [_session_from_dict(d) for d in docs]
+    version, sess = upgrade_serialized(data)
+    return 'pb' if version == CURRENT_VERSION else 'pb-legacy', [sess]
+
+
+def safe_file_name(sess_uid, stem=''):
+    """ Safe <name>_metadata.pb name of a session (no path separators, never '.' or '..'), see session_file_name """
+
+    return (_UNSAFE.sub('_', sess_uid or stem).lstrip('.') or '_') + '_metadata.pb'
+
+
+def session_file_name(directory, sess_uid, stem='', taken=()):
+    """ Safe, unused <name>_metadata.pb file name for a session written to a directory
+
+    Characters other than letters, digits and '.:+-' are replaced by '_' (no path separators, never '.' or
+    '..'). When the name is in taken or already exists in directory, <name>_2_metadata.pb, ... is used.
+
+    Parameters
+    ----------
+    directory : str
+        Output directory
+    sess_uid : str
+        Session uid
+    stem : str
+        Name used when sess_uid is empty (e.g. the name of the source file)
+    taken : set of str
+        Names already claimed by the caller but possibly not written yet
+
+    Returns
+    -------
+    str
+        File name (relative to directory)
+    """
+
+    name = safe_file_name(sess_uid, stem)
+    base, n = name[:-len('_metadata.pb')], 1
+    while name in taken or os.path.exists(os.path.join(directory, name)):
+        n += 1
+        name = '%s_%d_metadata.pb' % (base, n)
+    return name
+
+
+def _convert_worker(path):
+    """ Private helper run in worker processes: (path, format, [(sess_uid, payload)], size, error) """
+
+    size = os.path.getsize(path)
+    try:
+        fmt, sessions = convert_file(path)
+    except Exception as e:
+        return path, None, [], size, '%s: %s' % (type(e).__name__, e)
+    return path, fmt, [(s.sess_uid, s.SerializeToString()) for s in sessions], size, None
+
+
+def _iter_inputs(sources, skip=()):
+    """ Private helper: candidate input files in the sources (directories are walked recursively, except skip) """
+
+    skip = {os.path.abspath(p) for p in skip if p is not None}
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) not in skip)
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    if name.endswith(_EXTENSIONS) or is_archive(path):
+                        yield path
+        else:
+            yield source
+
+
+def _quarantine(path, error, directory):
+    """ Private helper: copies a failed input and the reason of the failure to the quarantine directory """
+
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.basename(path)
+    target = os.path.join(directory, name)
+    n = 1
+    while os.path.exists(target):
+        target = os.path.join(directory, '%s.%d' % (name, n))
+        n += 1
+    shutil.copy2(path, target)
+    with open(target + '.error.txt', 'w') as f:
+        f.write('%s\n%s\n' % (path, error))
+    return target
+
+
+def import_files(sources, output, workers=None, quarantine=None):
+    """ Convert metadata files of any known format to current sessions, in parallel
+
+    Parameters
+    ----------
+    sources : list of str
+        Files, session archives and directories (walked recursively)
+    output : str
+        Session archive to append to, or an existing directory receiving one <sess_uid>_metadata.pb per session
+        (see session_file_name: existing files are never overwritten, a session whose name is already
+        taken, by this import or an earlier one, is written as <sess_uid>_2_metadata.pb, ... and reported)
+    workers : int
+        Worker processes (None uses every CPU, 1 converts in the calling process)
+    quarantine : str
+        Directory receiving a copy of every file that fails to convert (None: failures are only reported)
+
+    Returns
+    -------
+    dict
+        {'files', 'sessions', 'bytes', 'seconds', 'files_per_second', 'sessions_per_second', 'mb_per_second',
+         'formats': {format: files}, 'failed': [(path, error)], 'renamed': [(sess_uid, file written)]}
+    """
+
+    report = {'files': 0, 'sessions': 0, 'bytes': 0, 'formats': dict.fromkeys(FORMATS, 0), 'failed': [],
+              'renamed': []}
+    written = set()
+    archive = None if os.path.isdir(output) else SessionArchiveWriter(output)
+    paths = [p for p in _iter_inputs(sources, skip=(output, quarantine)) if os.path.abspath(p) != os.path.abspath(output)]
+
+    def write(sess_uid, payload, stem):
+        if archive is not None:
+            archive.append(payload)
+            return
+        name = session_file_name(output, sess_uid, stem, written)
+        if name != safe_file_name(sess_uid, stem):
+            report['renamed'].append((sess_uid, name))
+        written.add(name)
+        path = os.path.join(output, name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+    pool = None
+    start = time.time()
+    try:
+        if workers == 1:
+            results = map(_convert_worker, paths)
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(_convert_worker, paths, chunksize=max(1, len(paths) // (8 * (workers or os.cpu_count()))))
+        for path, fmt, sessions, size, error in results:
+            report['files'] += 1
+            report['bytes'] += size
+            if error is not None:
+                report['failed'].append((path, error))
+                if quarantine is not None:
+                    _quarantine(path, error, quarantine)
+                continue
+            report['formats'][fmt] += 1
+            stem = os.path.splitext(os.path.basename(path))[0]
+            for sess_uid, payload in sessions:
+                write(sess_uid, payload, stem)
+                report['sessions'] += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if archive is not None:
+            archive.close()
+
+    seconds = report['seconds'] = time.time() - start
+    report['files_per_second'] = report['files'] / seconds if seconds else 0.0
+    report['sessions_per_second'] = report['sessions'] / seconds if seconds else 0.0
+    report['mb_per_second'] = report['bytes'] / 1e6 / seconds if seconds else 0.0
+    return report
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Convert legacy and current metadata files to current sessions')
+    parser.add_argument('output', help='session archive, or existing directory for one .pb file per session')
+    parser.add_argument('sources', nargs='+', help='metadata files, pickles, session archives and directories')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--quarantine', default=None, help='directory receiving the files that fail')
+    args = parser.parse_args(argv)
+
+    report = import_files(args.sources, args.output, workers=args.workers, quarantine=args.quarantine)
+    print('%(files)d files, %(sessions)d sessions in %(seconds).2f s: %(files_per_second).1f files/s, '
+          '%(sessions_per_second).1f sessions/s, %(mb_per_second).2f MB/s' % report)
+    for fmt, n in report['formats'].items():
+        print('    %-10s %d' % (fmt, n))
+    for path, error in report['failed']:
+        print('    FAILED %s: %s' % (path, error))
+    for sess_uid, name in report['renamed']:
+        print('    RENAMED %s: %s (name already taken)' % (sess_uid, name))
+
+
+if __name__ == '__main__':
+    main()
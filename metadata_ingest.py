@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+
+"""Incremental ingestion of new session metadata files into an archive
+
+The rigs write `<sess_uid>_metadata.pb` / `<sess_uid>_metadata.json` pairs into a directory.
+SessionIngestDaemon watches one or more of those directories (inotify on Linux, polling elsewhere),
+deduplicates on sess_uid, appends new sessions to a session archive in batches and checkpoints its
+progress so that a restart resumes where it left off instead of re-parsing every file.
+
+Usage:
+    python metadata_ingest.py ARCHIVE DIR [DIR ...] [--batch-size N] [--max-latency S]
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import argparse
+import threading
+from metadata_API import load_session
+from metadata_archive import SessionArchiveWriter, archive_record_offsets, iter_archive_sessions
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+METADATA_EXTENSIONS = ('.pb', '.json')       # .pb is preferred when both files of a pair exist
+METADATA_SUFFIX = '_metadata'
+
+# inotify constants (linux/inotify.h)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+_INOTIFY_EVENT = struct.Struct('iIII')      # wd, mask, cookie, len
+
+
+def sess_uid_from_filename(filename):
+    """ Guess the sess_uid of a metadata file from its name (<sess_uid>_metadata.pb)
+
+    Parameters
+    ----------
+    filename : str
+        File name or path
+
+    Returns
+    -------
+    str
+        The file name without extension and without the _metadata suffix
+    """
+
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return stem[:-len(METADATA_SUFFIX)] if stem.endswith(METADATA_SUFFIX) else stem
+
+
+class _Inotify:
+
+    """ Minimal ctypes wrapper around the Linux inotify API """
+
+    def __init__(self, directories):
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), 'inotify_add_watch failed for %s' % directory)
+            self.watches[wd] = directory
+
+    def read(self, timeout):
+        """ Wait up to `timeout` seconds and return the paths of files that were closed or moved in
+
+        Returns None when the kernel queue overflowed: events were lost and the directories must be listed.
+        """
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        paths = []
+        overflowed = False
+        pos = 0
+        while pos + _INOTIFY_EVENT.size <= len(buf):
+            wd, mask, cookie, length = _INOTIFY_EVENT.unpack_from(buf, pos)
+            pos += _INOTIFY_EVENT.size
+            overflowed |= bool(mask & _IN_Q_OVERFLOW)
+            name = buf[pos:pos + length].rstrip(b'\0')
+            pos += length
+            if name and wd in self.watches:
+                paths.append(os.path.join(self.watches[wd], os.fsdecode(name)))
+        return None if overflowed else paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SessionIngestDaemon:
+
+    """ Watch directories for new session metadata files and append them to an archive
+
+    Parameters
+    ----------
+    directories : list of str
+        Directories written to by the rigs
+    archive : str
+        Session archive that new sessions are appended to
+    checkpoint : str
+        JSON file recording ingestion progress (defaults to <archive>.checkpoint.json)
+    batch_size : int
+        Number of pending sessions that triggers a write to the archive
+    max_latency : float
+        Maximum number of seconds a parsed session may wait before its batch is written
+    poll_interval : float
+        Seconds between directory listings when inotify is unavailable (or disabled)
+    settle_time : float
+        When polling, files modified less than this many seconds ago are left for the next poll,
+        since the rig may still be writing them
+    use_inotify : bool
+        Use inotify when available; set to False to force the polling fallback
+    """
+
+    def __init__(self, directories, archive, checkpoint=None, batch_size=100, max_latency=5.0,
+                 poll_interval=2.0, settle_time=1.0, use_inotify=True):
+
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.archive = archive
+        self.checkpoint = checkpoint if checkpoint is not None else archive + '.checkpoint.json'
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.use_inotify = use_inotify
+
+        self.files = {}         # path -> [mtime_ns, size] of every file already handled
+        self.sessions = {}      # sess_uid -> archive offset
+        self.failed = {}        # path -> [mtime_ns, size] of files that could not be parsed
+        self._pending = []      # [(path, stat signature, Session)] waiting to be written
+        self._pending_uids = set()
+        self._pending_since = None
+        self._stop = threading.Event()
+
+        self._load_checkpoint()
+        self._writer = SessionArchiveWriter(self.archive)
+        if self._archive_size is None:
+            # No checkpoint yet: index the sessions an existing archive already holds
+            for offset, sess in zip(archive_record_offsets(self.archive), iter_archive_sessions(self.archive)):
+                self.sessions[sess.sess_uid] = offset
+        elif self._writer.offset > self._archive_size:
+            # Records written after the last checkpoint were never acknowledged: drop them,
+            # their files are still unknown to the checkpoint and will be ingested again.
+            self._writer.truncate(self._archive_size)
+        self._archive_size = self._writer.offset
+
+    '''Checkpointing'''
+
+    def _load_checkpoint(self):
+        """ Private method: restores progress from the checkpoint file, if any """
+
+        self._archive_size = None
+        if not os.path.exists(self.checkpoint):
+            return
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        self._archive_size = state['archive_size']
+        self.files = state['files']
+        self.sessions = state['sessions']
+        self.failed = state.get('failed', {})
+
+    def _save_checkpoint(self):
+        """ Private method: atomically writes the current progress to the checkpoint file """
+
+        state = {'archive': os.path.abspath(self.archive), 'archive_size': self._archive_size,
+                 'files': self.files, 'sessions': self.sessions, 'failed': self.failed}
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint)
+
+    '''Discovery'''
+
+    def _list_candidates(self):
+        """ Private method: lists metadata files that are new or changed since they were last handled """
+
+        candidates = []
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name.endswith(METADATA_EXTENSIONS) and entry.is_file():
+                    candidates.append(entry.path)
+        return candidates
+
+    def _offer(self, path, now, settle_time):
+        """ Private method: parses a candidate file and queues its session unless it is a duplicate
+
+        Returns
+        -------
+        bool
+            True if a new session was queued
+        """
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        signature = [st.st_mtime_ns, st.st_size]
+        if self.files.get(path) == signature or self.failed.get(path) == signature:
+            return False
+        if now - st.st_mtime < settle_time:
+            return False
+
+        # Cheap dedupe on the file name before paying for a parse (skips the .json twin of a .pb)
+        uid = sess_uid_from_filename(path)
+        if uid in self.sessions or uid in self._pending_uids:
+            self.files[path] = signature
+            return False
+
+        try:
+            sess = load_session(path)
+        except Exception:
+            self.failed[path] = signature
+            return False
+        self.failed.pop(path, None)
+
+        uid = sess.sess_uid or uid
+        if uid in self.sessions or uid in self._pending_uids:
+            self.files[path] = signature
+            return False
+        self._pending.append((path, signature, sess))
+        self._pending_uids.update((uid, sess_uid_from_filename(path)))
+        if self._pending_since is None:
+            self._pending_since = now
+        return True
+
+    def _sorted(self, paths):
+        """ Private method: orders paths so that the .pb of a pair is seen before its .json """
+
+        return sorted(set(paths), key=lambda p: (sess_uid_from_filename(p), not p.endswith('.pb')))
+
+    '''Batching'''
+
+    def flush(self):
+        """ Append every pending session to the archive and checkpoint the progress
+
+        Returns
+        -------
+        int
+            Number of sessions written
+        """
+
+        if not self._pending:
+            return 0
+        for path, signature, sess in self._pending:
+            uid = sess.sess_uid or sess_uid_from_filename(path)
+            self.sessions[uid] = self._writer.append(sess)
+            self.files[path] = signature
+        self._writer.flush(fsync=True)
+        self._archive_size = self._writer.offset
+        self._save_checkpoint()
+        written = len(self._pending)
+        self._pending = []
+        self._pending_uids = set()
+        self._pending_since = None
+        return written
+
+    def _maybe_flush(self, now):
+        """ Private method: flushes when the batch is full or its oldest session waited too long """
+
+        if len(self._pending) >= self.batch_size:
+            return self.flush()
+        if self._pending_since is not None and now - self._pending_since >= self.max_latency:
+            return self.flush()
+        return 0
+
+    def ingest(self, paths=None, settle_time=None):
+        """ Offer files to the daemon and write whatever batches became due
+
+        Parameters
+        ----------
+        paths : list of str
+            Files to consider. Defaults to a full listing of the watched directories
+        settle_time : float
+            Overrides the daemon's settle_time (0 for files known to be completely written)
+
+        Returns
+        -------
+        int
+            Number of sessions written to the archive by this call
+        """
+
+        now = time.time()
+        settle_time = self.settle_time if settle_time is None else settle_time
+        written = 0
+        for path in self._sorted(self._list_candidates() if paths is None else paths):
+            if os.path.splitext(path)[1] not in METADATA_EXTENSIONS:
+                continue
+            if self._offer(path, now, settle_time) and len(self._pending) >= self.batch_size:
+                written += self.flush()
+        return written + self._maybe_flush(now)
+
+    '''Main loop'''
+
+    def run(self):
+        """ Watch the directories until stop() is called, ingesting new files as they appear
+
+        The directories are also listed every poll_interval with inotify, for the files that were still
+        settling at the previous listing and after the kernel event queue overflowed.
+        """
+
+        # The watch is created before catching up, so files written in between are not missed
+        watcher = None
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                watcher = _Inotify(self.directories)
+            except OSError:
+                watcher = None
+
+        # Wake up often enough to honour the latency bound of a partially filled batch
+        tick = min(self.poll_interval, self.max_latency)
+        try:
+            # Catch up on files written while the daemon was not running
+            self.ingest()
+            last_listing = time.time()
+            while not self._stop.is_set():
+                if watcher is not None:
+                    # IN_CLOSE_WRITE / IN_MOVED_TO are only reported once the file is complete
+                    paths = watcher.read(tick)
+                    if paths:
+                        self.ingest(paths, settle_time=0)
+                    if paths is None or time.time() - last_listing >= self.poll_interval:
+                        self.ingest()
+                        last_listing = time.time()
+                    else:
+                        self._maybe_flush(time.time())
+                else:
+                    self._stop.wait(tick)
+                    if time.time() - last_listing >= self.poll_interval:
+                        self.ingest()
+                        last_listing = time.time()
+                    else:
+                        self._maybe_flush(time.time())
+        finally:
+            if watcher is not None:
+                watcher.close()
+            self.flush()
+
+    def stop(self):
+        """ Ask a running daemon to write its pending batch and return from run() """
+
+        self._stop.set()
+
+    def close(self):
+        """ Write the pending batch and close the archive """
+
+        self.flush()
+        self._writer.close()
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Ingest new session metadata files into an archive')
+    parser.add_argument('archive', help='session archive to append to')
+    parser.add_argument('directories', nargs='+', help='directories to watch')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: ARCHIVE.checkpoint.json)')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--max-latency', type=float, default=5.0)
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    parser.add_argument('--no-inotify', action='store_true', help='always use the polling fallback')
+    args = parser.parse_args(argv)
+
+    daemon = SessionIngestDaemon(args.directories, args.archive, checkpoint=args.checkpoint,
+                                 batch_size=args.batch_size, max_latency=args.max_latency,
+                                 poll_interval=args.poll_interval, use_inotify=not args.no_inotify)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+
+if __name__ == '__main__':
+    main()
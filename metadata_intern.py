@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+"""String interning across many loaded Birdsong Project sessions
+
+Most string fields take a handful of values over the whole dataset (manufacturer="miniDSP",
+acquisition_software="alsa", box="cuervecito3", ...), yet every parsed message, MessageToDict dictionary
+or view holds its own copy of each of them. Passing a shared StringPool to the bulk loaders below (or to
+metadata_views.to_view / sessions_to_views) makes all equal strings one object. Fields unique to every
+session (metadata_views.UNIQUE_FIELDS) are left alone, and enum fields are kept as ints: their names
+come from cached lookups (metadata_views <field>_name properties, enum_name).
+
+Usage:
+    python metadata_intern.py [SOURCE ...]     memory report on metadata files / archives (or synthetic sessions)
+"""
+
+import sys
+import metadata_pb2
+from google.protobuf.json_format import MessageToDict
+from metadata_hash import iter_sources
+from metadata_views import UNIQUE_FIELDS, sessions_to_views
+from metadata_fixtures import realistic_sessions, measure
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+class StringPool(dict):
+
+    """ Pool of shared strings: pool(s) returns the first string equal to s ever passed to the pool
+
+    Lookups of known strings run entirely in C (dict.__getitem__); only new strings go through __missing__.
+    A pool is an ordinary object: dropping it releases its strings, unlike sys.intern.
+    """
+
+    __slots__ = ()
+    __call__ = dict.__getitem__
+
+    def __missing__(self, key):
+        self[key] = key
+        return key
+
+
+# (message name, enum field name) -> {number: name}
+_ENUM_NAMES = {(m.name, f.name): {v.number: v.name for v in f.enum_type.values}
+               for m in [metadata_pb2.Session.DESCRIPTOR] + list(metadata_pb2.Session.DESCRIPTOR.nested_types)
+               for f in m.fields if f.enum_type is not None}
+
+
+def enum_name(field, value, message='Session'):
+    """ Name of an enum value, e.g. enum_name('condition', 2) == 'CHRONIC' (unknown values are returned as is) """
+
+    return _ENUM_NAMES[message, field].get(value, value)
+
+
+def _intern_message_dict(doc, desc, pool):
+    """ Private helper: interns in place the strings of a MessageToDict dictionary of message type desc """
+
+    unique = UNIQUE_FIELDS.get(desc.name, ())
+    for f in desc.fields:
+        value = doc.get(f.name)
+        if not value:
+            continue
+        if f.message_type is not None:
+            for element in value:
+                _intern_message_dict(element, f.message_type, pool)
+        elif f.type == f.TYPE_STRING and f.name not in unique:
+            doc[f.name] = [pool(s) for s in value] if f.label == f.LABEL_REPEATED else pool(value)
+    return doc
+
+
+def session_to_interned_dict(sess, pool):
+    """ Dictionary of a session (as session_to_dict), with enums as ints and strings taken from a pool
+
+    Parameters
+    ----------
+    sess : metadata_pb2.Session
+        Session to convert
+    pool : StringPool
+        Pool shared by all the dictionaries
+
+    Returns
+    -------
+    dict
+    """
+
+    doc = MessageToDict(sess, including_default_value_fields=True, preserving_proto_field_name=True,
+                        use_integers_for_enums=True)
+    return _intern_message_dict(doc, sess.DESCRIPTOR, pool)
+
+
+def _iter_messages(sources):
+    """ Private helper: Session messages (or serialized sessions) of files, directories and archives """
+
+    for _, sess in iter_sources(sources):
+        yield sess
+
+
+def load_views(sources, pool=None):
+    """ Bulk load sessions from metadata files, directories and archives as views sharing a string pool
+
+    Parameters
+    ----------
+    sources : list of str
+        Metadata files, directories (walked recursively) and session archives
+    pool : StringPool
+        Pool to use (a new one when None, available as the pool of the returned tuple)
+
+    Returns
+    -------
+    (list of metadata_views.SessionView, StringPool)
+    """
+
+    pool = StringPool() if pool is None else pool
+    return sessions_to_views(_iter_messages(sources), pool=pool), pool
+
+
+def load_dicts(sources, pool=None):
+    """ Bulk load sessions from metadata files, directories and archives as dictionaries sharing a string pool
+
+    Parameters
+    ----------
+    sources : list of str
+        Metadata files, directories (walked recursively) and session archives
+    pool : StringPool
+        Pool to use (a new one when None)
+
+    Returns
+    -------
+    (list of dict, StringPool)
+        Dictionaries as session_to_interned_dict returns them
+    """
+
+    pool = StringPool() if pool is None else pool
+    docs = []
+    parsed = metadata_pb2.Session()
+    for sess in _iter_messages(sources):
+        if isinstance(sess, (bytes, bytearray, memoryview)):
+            parsed.Clear()
+            parsed.ParseFromString(sess)
+            sess = parsed
+        docs.append(session_to_interned_dict(sess, pool))
+    return docs, pool
+
+
+'''Memory measurement'''
+
+def measure_interning(sources=None, n_sessions=10000):
+    """ Memory held by many loaded sessions as views and dictionaries, with and without a string pool
+
+    Parameters
+    ----------
+    sources : list of str
+        Metadata files, directories and session archives to load. None generates n_sessions realistic sessions
+    n_sessions : int
+        Number of synthetic sessions when sources is None
+
+    Returns
+    -------
+    dict
+        {representation: (MB held, seconds to build)}. The pooled representations include the pool itself
+    """
+
+    if sources:
+        sessions = [s if isinstance(s, bytes) else s.SerializeToString() for s in _iter_messages(sources)]
+    else:
+        sessions = realistic_sessions(n_sessions)
+
+    def dicts(pool):
+        parsed = metadata_pb2.Session()
+        docs = []
+        for data in sessions:
+            parsed.Clear()
+            parsed.ParseFromString(data)
+            docs.append(MessageToDict(parsed, including_default_value_fields=True, preserving_proto_field_name=True)
+                        if pool is None else session_to_interned_dict(parsed, pool))
+        return docs
+
+    results = {}
+    for name, build in [('views', lambda: sessions_to_views(sessions)),
+                        ('views + StringPool', lambda: sessions_to_views(sessions, pool=StringPool())),
+                        ('dicts', lambda: dicts(None)),
+                        ('dicts + StringPool', lambda: dicts(StringPool()))]:
+        _, size, seconds = measure(build)
+        results[name] = (size / 1e6, seconds)
+    results['sessions'] = len(sessions)
+    return results
+
+
+if __name__ == '__main__':
+    results = measure_interning(sys.argv[1:] or None)
+    print('%d sessions' % results.pop('sessions'))
+    for name, (mb, seconds) in results.items():
+        print('    %-20s %8.1f MB %8.2f s' % (name, mb, seconds))
@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+
+"""Incremental parsing of large Birdsong Project JSON metadata files
+
+parse_metadata_from_json materializes the whole document with json.load before ParseDict copies it into
+the Session, so a multi-megabyte file briefly exists three times in memory (text, dictionaries, message).
+The parser below reads the file in fixed-size chunks and fills the Session field by field: objects and
+arrays are walked structurally and only one scalar value (a string, a number, ...) is decoded at a time,
+so besides the message being built the memory used is one chunk of text. iter_json_acquisitions goes
+further and yields the acquisitions one at a time without keeping them.
+
+The accepted input is the same as ParseDict's for these files: keys are field names or JSON names, enums
+are names or numbers (quoted or not), numbers may be quoted, null clears a field, float values beyond the
+float32 range raise, and unknown keys or any content after the top-level object raise
+json_format.ParseError.
+"""
+
+import os
+import re
+import json
+import time
+import base64
+import tracemalloc
+import metadata_pb2
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.json_format import ParseDict, ParseError
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_CHARS = re.compile(r'[0-9.eE+\-]*')
+_DECODER = json.JSONDecoder()
+_INT_TYPES = (FieldDescriptor.CPPTYPE_INT32, FieldDescriptor.CPPTYPE_INT64,
+              FieldDescriptor.CPPTYPE_UINT32, FieldDescriptor.CPPTYPE_UINT64)
+_FLOAT_TYPES = (FieldDescriptor.CPPTYPE_FLOAT, FieldDescriptor.CPPTYPE_DOUBLE)
+_SPECIAL_FLOATS = {'NaN': float('nan'), 'Infinity': float('inf'), '-Infinity': float('-inf')}
+_FLOAT32_MAX = 3.4028234663852886e38
+
+
+def _convert(field, value, path):
+    """ Private helper: converts a decoded JSON scalar to the value of a non-message field, as ParseDict does """
+
+    cpp_type = field.cpp_type
+    if field.enum_type is not None:
+        if isinstance(value, str) and value in field.enum_type.values_by_name:
+            return field.enum_type.values_by_name[value].number
+        try:
+            return int(value)                       # Numbers, quoted or not (proto3 keeps unknown numbers)
+        except (ValueError, TypeError):
+            pass
+        raise ParseError('Invalid enum value %s for enum type %s at %s' % (value, field.enum_type.full_name, path))
+    elif cpp_type == FieldDescriptor.CPPTYPE_STRING:
+        if field.type == FieldDescriptor.TYPE_BYTES and isinstance(value, str):
+            return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+        if isinstance(value, str):
+            return value
+    elif cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+        if isinstance(value, bool):
+            return value
+    elif cpp_type in _INT_TYPES:
+        if isinstance(value, str):
+            try:
+                if ' ' not in value:
+                    return int(value)
+            except ValueError:
+                pass
+        elif isinstance(value, float) and value.is_integer():
+            return int(value)
+        elif isinstance(value, int) and not isinstance(value, bool):
+            return value
+    elif cpp_type in _FLOAT_TYPES:
+        if isinstance(value, str):
+            if value in _SPECIAL_FLOATS:
+                return _SPECIAL_FLOATS[value]
+            try:
+                if value != 'nan':
+                    return float(value)
+            except ValueError:
+                pass
+        elif isinstance(value, float):
+            if value != value or value in (float('inf'), float('-inf')):
+                raise ParseError('Invalid value %r for field %s at %s: use a quoted "NaN", "Infinity" or '
+                                 '"-Infinity"' % (value, field.full_name, path))
+            if cpp_type == FieldDescriptor.CPPTYPE_FLOAT and not -_FLOAT32_MAX <= value <= _FLOAT32_MAX:
+                raise ParseError('Float value %r out of range for field %s at %s' % (value, field.full_name, path))
+            return value
+        elif isinstance(value, int) and not isinstance(value, bool):
+            return value
+    raise ParseError('Invalid value %r for field %s at %s' % (value, field.full_name, path))
+
+
+class _ChunkedReader:
+
+    """ Private class: JSON tokens read from a text file one chunk at a time """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """ Private method: drops the consumed text and reads the next chunk. Returns False at end of file """
+
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return not self.eof
+
+    def peek(self):
+        """ Next non-whitespace character, without consuming it ('' at end of file) """
+
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ParseError('Expected %r at character %d of the current chunk' % (char, self.pos))
+        self.pos += 1
+
+    def end(self):
+        """ Checks that nothing but whitespace follows the top-level value """
+
+        char = self.peek()
+        if char:
+            raise ParseError('Unexpected %r after the end of the JSON document' % char)
+
+    def value(self):
+        """ Decodes the next complete JSON value (scalars, or whole arrays / objects that are skipped) """
+
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number followed by nothing but number characters may continue in the next chunk
+            if isinstance(value, (int, float)) and _NUMBER_CHARS.match(self.buf, end).end() == len(self.buf) \
+                    and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def separator(self, close):
+        """ Consumes ',' and returns True, or consumes the closing character and returns False """
+
+        char = self.peek()
+        self.pos += 1
+        if char == ',':
+            return True
+        if char == close:
+            return False
+        raise ParseError('Expected "," or %r, found %r' % (close, char))
+
+    def items(self, close):
+        """ Iterates over the elements of the array / members of the object whose opening character was consumed """
+
+        if self.peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield
+            if not self.separator(close):
+                return
+
+
+def _fields_by_key(desc):
+    """ Private helper: {field name and JSON name: field} of a message type """
+
+    fields = {}
+    for field in desc.fields:
+        fields[field.name] = field
+        fields[field.json_name] = field
+    return fields
+
+
+def _parse_field(reader, field, msg, path, ignore_unknown_fields):
+    """ Private helper: parses the value of one field of msg from the reader """
+
+    if reader.peek() == 'n':
+        reader.value()                              # null: the field is cleared, as ParseDict does
+        msg.ClearField(field.name)
+        return
+    if field.label == field.LABEL_REPEATED:
+        msg.ClearField(field.name)                  # Replaces the container: fetch it afterwards
+        target = getattr(msg, field.name)
+        reader.expect('[')
+        for i, _ in enumerate(reader.items(']')):
+            element_path = '%s[%d]' % (path, i)
+            if field.message_type is not None:
+                _parse_message(reader, field.message_type, target.add(), element_path, ignore_unknown_fields)
+            else:
+                target.append(_convert(field, reader.value(), element_path))
+    elif field.message_type is not None:
+        _parse_message(reader, field.message_type, getattr(msg, field.name), path, ignore_unknown_fields)
+    else:
+        setattr(msg, field.name, _convert(field, reader.value(), path))
+
+
+def _parse_message(reader, desc, msg, path, ignore_unknown_fields):
+    """ Private helper: parses a JSON object into msg, field by field """
+
+    fields = _fields_by_key(desc)
+    reader.expect('{')
+    for _ in reader.items('}'):
+        key = reader.value()
+        reader.expect(':')
+        field = fields.get(key)
+        if field is None:
+            if not ignore_unknown_fields:
+                raise ParseError('Message type "%s" has no field named "%s" at "%s"' % (desc.full_name, key, path))
+            reader.value()
+        else:
+            _parse_field(reader, field, msg, _path(path, field.name), ignore_unknown_fields)
+
+
+def _path(path, name):
+    return name if not path else path + '.' + name
+
+
+def parse_json_stream(f, sess=None, ignore_unknown_fields=False, chunk_size=CHUNK_SIZE):
+    """ Parse a JSON metadata file incrementally into a session
+
+    Parameters
+    ----------
+    f : str or text file object
+        Path of the .json file, or an open file
+    sess : metadata_pb2.Session
+        Message to merge the file into (a new Session when None)
+    ignore_unknown_fields : bool
+        Skip keys that are not fields instead of raising ParseError
+    chunk_size : int
+        Characters read at a time
+
+    Returns
+    -------
+    metadata_pb2.Session
+        The filled message
+    """
+
+    sess = metadata_pb2.Session() if sess is None else sess
+    if isinstance(f, str):
+        with open(f) as fh:
+            return parse_json_stream(fh, sess, ignore_unknown_fields, chunk_size)
+    reader = _ChunkedReader(f, chunk_size)
+    _parse_message(reader, sess.DESCRIPTOR, sess, '', ignore_unknown_fields)
+    reader.end()
+    return sess
+
+
+def iter_json_acquisitions(f, header=None, ignore_unknown_fields=False, chunk_size=CHUNK_SIZE):
+    """ Stream the acquisitions of a JSON metadata file one at a time
+
+    Only the acquisition being yielded is held in memory.
+
+    Parameters
+    ----------
+    f : str or text file object
+        Path of the .json file, or an open file
+    header : metadata_pb2.Session
+        Message receiving every other field of the session (complete once the iteration is over)
+    ignore_unknown_fields : bool
+        Skip keys that are not fields instead of raising ParseError
+    chunk_size : int
+        Characters read at a time
+
+    Yields
+    ------
+    metadata_pb2.Session.Acquisition
+    """
+
+    if isinstance(f, str):
+        with open(f) as fh:
+            yield from iter_json_acquisitions(fh, header, ignore_unknown_fields, chunk_size)
+        return
+    header = metadata_pb2.Session() if header is None else header
+    reader = _ChunkedReader(f, chunk_size)
+    desc = metadata_pb2.Session.DESCRIPTOR
+    acquisition_desc = desc.fields_by_name['acquisitions'].message_type
+
+    # Same walk as _parse_message for the top level, which is a generator here so acquisitions can be yielded
+    fields = _fields_by_key(desc)
+    reader.expect('{')
+    for _ in reader.items('}'):
+        key = reader.value()
+        reader.expect(':')
+        field = fields.get(key)
+        if field is None:
+            if not ignore_unknown_fields:
+                raise ParseError('Message type "%s" has no field named "%s"' % (desc.full_name, key))
+            reader.value()
+        elif field.name == 'acquisitions' and reader.peek() != 'n':
+            reader.expect('[')
+            for i, _ in enumerate(reader.items(']')):
+                acquisition = metadata_pb2.Session.Acquisition()
+                _parse_message(reader, acquisition_desc, acquisition, 'acquisitions[%d]' % i, ignore_unknown_fields)
+                yield acquisition
+        else:
+            _parse_field(reader, field, header, field.name, ignore_unknown_fields)
+    reader.end()
+
+
+'''Benchmark'''
+
+def _large_document(path, n_acquisitions, n_items, n_details):
+    """ Private helper: writes a large JSON session the way export_metadata_to_json does """
+
+    from metadata_fixtures import benchmark_session
+    from metadata_API import session_to_dict
+    sess = benchmark_session(n_acquisitions, n_items)
+    sess.details.extend('note %d: %s' % (i, 'x' * 60) for i in range(n_details))
+    with open(path, 'w') as f:
+        json.dump(session_to_dict(sess), f, indent=5)
+
+
+def benchmark_json_stream(path='/tmp/metadata_json_stream_benchmark.json', n_acquisitions=100, n_items=20,
+                          n_details=5000):
+    """ Time and peak memory of json.load + ParseDict against the incremental parser on a large document
+
+    Parameters
+    ----------
+    path : str
+        Where the benchmark document is written
+    n_acquisitions : int
+        Acquisitions in the document
+    n_items : int
+        Neural probes, sensors and stimuli per acquisition
+    n_details : int
+        Entries of the session details list
+
+    Returns
+    -------
+    dict
+        {'bytes': document size, method: (seconds, peak MB)}
+    """
+
+    _large_document(path, n_acquisitions, n_items, n_details)
+
+    def load():
+        sess = metadata_pb2.Session()
+        with open(path) as f:
+            ParseDict(json.load(f), sess)
+        return sess
+
+    def stream_acquisitions():
+        header = metadata_pb2.Session()
+        return header, sum(1 for _ in iter_json_acquisitions(path, header))
+
+    results = {'bytes': os.path.getsize(path)}
+    for name, fn in [('json.load + ParseDict', load), ('parse_json_stream', lambda: parse_json_stream(path)),
+                     ('iter_json_acquisitions', stream_acquisitions)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            fn()
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results[name] = (seconds, peak / 1e6)
+    return results
+
+
+if __name__ == '__main__':
+    results = benchmark_json_stream()
+    print('%.1f MB document' % (results.pop('bytes') / 1e6))
+    for name, (seconds, peak) in results.items():
+        print('    %-25s %8.2f s %10.1f MB peak' % (name, seconds, peak))
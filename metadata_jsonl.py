@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""JSON Lines import / export of many Birdsong Project sessions
+
+A .jsonl file holds one session per line, each line being the same dictionary export_metadata_to_json
+writes for a single session. Sessions are streamed in both directions so memory stays constant whatever
+the size of the file, and decoding can be spread over a process pool for bulk imports.
+"""
+
+import json
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import metadata_pb2
+from google.protobuf.json_format import ParseDict
+from metadata_API import session_to_dict
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+def export_sessions_to_jsonl(sessions, filename, append=False):
+    """ Write sessions to a JSON Lines file, one session per line
+
+    Parameters
+    ----------
+    sessions : iterable of metadata_pb2.Session
+        Sessions to export, consumed lazily (generators are fine)
+    filename : str
+        Path of the .jsonl file
+    append : bool
+        Append to an existing file instead of overwriting it
+
+    Returns
+    -------
+    int
+        Number of sessions written
+    """
+
+    count = 0
+    with open(filename, 'a' if append else 'w') as f:
+        for sess in sessions:
+            f.write(json.dumps(session_to_dict(sess), separators=(',', ':')))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def parse_session_line(line):
+    """ Parse one line of a JSON Lines file into a session
+
+    Parameters
+    ----------
+    line : str
+        JSON object of a single session
+
+    Returns
+    -------
+    metadata_pb2.Session
+        The parsed session
+    """
+
+    sess = metadata_pb2.Session()
+    ParseDict(json.loads(line), sess, ignore_unknown_fields=False, descriptor_pool=None)
+    return sess
+
+
+def _parse_chunk(lines):
+    """ Private helper run in worker processes: parses lines and returns the sessions serialized """
+
+    return [parse_session_line(line).SerializeToString() for line in lines]
+
+
+def _iter_lines(f):
+    """ Private helper: yields the non-blank lines of a file """
+
+    for line in f:
+        if line.strip():
+            yield line
+
+
+def iter_sessions_from_jsonl(filename, workers=None, chunk_size=500):
+    """ Stream the sessions of a JSON Lines file
+
+    Parameters
+    ----------
+    filename : str
+        Path of the .jsonl file
+    workers : int
+        Number of worker processes decoding chunks of lines in parallel. None (default) or 1 decodes
+        in the calling process
+    chunk_size : int
+        Lines per chunk sent to a worker. At most 2 * workers chunks are in flight at any time
+
+    Yields
+    ------
+    metadata_pb2.Session
+        The sessions, in file order
+    """
+
+    with open(filename) as f:
+        lines = _iter_lines(f)
+        if not workers or workers <= 1:
+            for line in lines:
+                yield parse_session_line(line)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = iter(lambda: list(itertools.islice(lines, chunk_size)), [])
+            in_flight = [pool.submit(_parse_chunk, chunk) for chunk in itertools.islice(chunks, 2 * workers)]
+            while in_flight:
+                payloads = in_flight.pop(0).result()
+                for chunk in itertools.islice(chunks, 1):
+                    in_flight.append(pool.submit(_parse_chunk, chunk))
+                for payload in payloads:
+                    sess = metadata_pb2.Session()
+                    sess.ParseFromString(payload)
+                    yield sess
+
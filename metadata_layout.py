@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+
+"""Hierarchical on-disk layout of Birdsong Project session files
+
+The layout sketched at the bottom of metadata.proto, sharded by bird, acquisition software and day:
+
+    ROOT/.manifest
+    ROOT/.locations/<shard>
+    ROOT/<bird_uid>/.manifest
+    ROOT/<bird_uid>/<software>/.manifest
+    ROOT/<bird_uid>/<software>/<date>/.manifest
+    ROOT/<bird_uid>/<software>/<date>/<sess_uid>_metadata.pb (and / or .json)
+
+<software> is the acquisition_software of the session's acquisitions ('+'-joined when there are several,
+'none' without acquisitions) and <date> its date field. Every directory keeps a manifest: inner directories
+list their children with their number of sessions, day directories list their sessions (files, time,
+condition), and the shards of ROOT/.locations (by crc32 of the sess_uid) map every sess_uid to its day
+directory, so that a session rewritten with another bird or date leaves its old directory. Listing, counting or date-filtering the sessions of a bird
+therefore reads a few small manifests and never walks the tree. Manifests are json files, but they are
+named so that the tools reading every .json of a directory (SessionStore, find_duplicates, ...) skip them.
+Manifests are replaced atomically and writers serialize on a lock file at the root, so several writers (the Pi script, the ingest daemon) can share a layout.
+
+Usage:
+    python metadata_layout.py ROOT add FILE [FILE ...] [--move]     file existing metadata into the layout
+    python metadata_layout.py ROOT list [BIRD]                      birds, or the sessions of a bird
+    python metadata_layout.py ROOT rebuild                          regenerate every manifest from the files
+"""
+
+import os
+import re
+import sys
+import json
+import zlib
+import fcntl
+import shutil
+import argparse
+from contextlib import contextmanager
+from google.protobuf.json_format import ParseError
+from google.protobuf.message import DecodeError
+from metadata_API import load_session, session_to_dict
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+MANIFEST = '.manifest'
+LOCATIONS = '.locations'
+_LOCATION_SHARDS = 4096                 # Every write reads and rewrites one shard: ~1 / 4096 of the sessions
+METADATA_SUFFIX = '_metadata'
+FORMATS = ('pb', 'json')
+_LOCK = '.layout.lock'
+_MANIFEST_VERSION = 1
+_UNSAFE = re.compile(r'[^\w.:+-]')         # Keeps sess_uids (with their ':') as they are
+_DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+
+def _component(name, missing):
+    """ Private helper: a field value made safe as a directory name """
+
+    name = _UNSAFE.sub('_', name.strip()).lstrip('.')
+    return name or missing
+
+
+def session_software(sess):
+    """ Software directory name of a session: its acquisition_software values, '+'-joined ('none' if absent) """
+
+    names = sorted({_component(a.acquisition_software, '') for a in sess.acquisitions} - {''})
+    return '+'.join(names) or 'none'
+
+
+def session_parts(sess):
+    """ (bird, software, date) directory names of a session """
+
+    date = sess.date if _DATE.match(sess.date) else 'undated'
+    return _component(sess.bird_uid, 'unknown_bird'), session_software(sess), date
+
+
+def session_entry(sess, files):
+    """ Manifest entry of a session stored in the given files (names relative to its day directory) """
+
+    return {'files': sorted(files), 'time': sess.time, 'condition': sess.Condition.Name(sess.condition)
+            if sess.condition in sess.Condition.values() else sess.condition}
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _write_atomically(path, data):
+    """ Private helper: writes bytes to a temporary file and renames it over path """
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SessionLayout:
+
+    """ Sessions stored in a bird / software / date directory tree with per-directory manifests
+
+    Parameters
+    ----------
+    root : str
+        Root directory of the layout (created if needed)
+
+    Attributes
+    ----------
+    errors : list of (str, str)
+        (path, error) of the files of day directories that rebuild() could not read (and left out)
+    """
+
+    def __init__(self, root):
+
+        self.root = root
+        self.errors = []
+        os.makedirs(root, exist_ok=True)
+
+    '''Manifests'''
+
+    def _manifest_path(self, *parts):
+        return os.path.join(self.root, *parts, MANIFEST)
+
+    def manifest(self, *parts):
+        """ Manifest of a directory given by its path components below the root (the root manifest for none)
+
+        Returns
+        -------
+        dict
+            {'children': {name: sessions}} for the root, bird and software directories,
+            {'sessions': {sess_uid: entry}} for day directories
+        """
+
+        key = 'sessions' if len(parts) == 3 else 'children'
+        return _read_json(self._manifest_path(*parts), {'version': _MANIFEST_VERSION, key: {}})
+
+    def _save_manifest(self, parts, manifest):
+        os.makedirs(os.path.join(self.root, *parts), exist_ok=True)
+        _write_atomically(self._manifest_path(*parts), json.dumps(manifest, indent=1, sort_keys=True).encode())
+
+    def _update_counts(self, parts, n_sessions):
+        """ Private method: propagates the number of sessions of a day directory to its ancestors """
+
+        for depth in range(len(parts), 0, -1):
+            parent, name = parts[:depth - 1], parts[depth - 1]
+            manifest = self.manifest(*parent)
+            if n_sessions:
+                manifest['children'][name] = n_sessions
+            else:
+                manifest['children'].pop(name, None)
+                directory = os.path.join(self.root, *parts[:depth])
+                if os.path.isdir(directory) and set(os.listdir(directory)) <= {MANIFEST}:
+                    shutil.rmtree(directory)
+            self._save_manifest(parent, manifest)
+            n_sessions = sum(manifest['children'].values())
+
+    @contextmanager
+    def _locked(self):
+        """ Private method: exclusive lock of the layout for the duration of a write """
+
+        with open(os.path.join(self.root, _LOCK), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    '''Writing'''
+
+    def session_dir(self, sess):
+        """ Directory of a session in the layout """
+
+        return os.path.join(self.root, *session_parts(sess))
+
+    def write(self, sess, formats=FORMATS):
+        """ Store a session in the layout (replacing the files of a session with the same sess_uid)
+
+        Parameters
+        ----------
+        sess : metadata_pb2.Session
+            Session to store
+        formats : sequence of str
+            'pb' (serialized) and / or 'json' (as export_metadata_to_json writes it)
+
+        Returns
+        -------
+        list of str
+            Paths of the written files
+        """
+
+        stem = _component(sess.sess_uid, 'unknown_session') + METADATA_SUFFIX
+        payloads = {'pb': lambda: sess.SerializeToString(),
+                    'json': lambda: json.dumps(session_to_dict(sess), indent=5).encode()}
+        parts = session_parts(sess)
+        directory = os.path.join(self.root, *parts)
+        with self._locked():
+            os.makedirs(directory, exist_ok=True)
+            files = []
+            for fmt in formats:
+                name = stem + '.' + fmt
+                _write_atomically(os.path.join(directory, name), payloads[fmt]())
+                files.append(name)
+            self._add_entry(parts, sess, files)
+        return [os.path.join(directory, name) for name in files]
+
+    def _add_entry(self, parts, sess, files):
+        """ Private method: records a session of a day directory in its manifest (and the counts above it)
+
+        The files of a session with the same sess_uid filed in another day directory are deleted.
+        """
+
+        previous_parts = self._location(sess.sess_uid)
+        if previous_parts is not None and tuple(previous_parts) != tuple(parts):
+            self._remove_entry(tuple(previous_parts), sess.sess_uid)
+        manifest = self.manifest(*parts)
+        previous = manifest['sessions'].get(sess.sess_uid)
+        if previous is not None:
+            files = set(files) | set(previous['files'])
+        manifest['sessions'][sess.sess_uid] = session_entry(sess, files)
+        self._save_manifest(parts, manifest)
+        if previous is None:
+            self._update_counts(parts, len(manifest['sessions']))
+        if previous_parts is None or tuple(previous_parts) != tuple(parts):
+            self._set_location(sess.sess_uid, parts)
+
+    def add_files(self, paths, move=False):
+        """ File existing metadata files (e.g. <sess_uid>_metadata.pb written in a working directory) into the layout
+
+        Parameters
+        ----------
+        paths : iterable of str
+            .pb and .json metadata files
+        move : bool
+            Move the files instead of copying them
+
+        Returns
+        -------
+        list of (str, str)
+            (source, destination) of every filed file
+        """
+
+        filed = []
+        for path in paths:
+            sess = load_session(path)
+            parts = session_parts(sess)
+            directory = os.path.join(self.root, *parts)
+            name = _component(sess.sess_uid, 'unknown_session') + METADATA_SUFFIX + os.path.splitext(path)[1]
+            destination = os.path.join(directory, name)
+            with self._locked():
+                os.makedirs(directory, exist_ok=True)
+                if move:
+                    shutil.move(path, destination)
+                else:
+                    shutil.copy2(path, destination + '.tmp')
+                    os.replace(destination + '.tmp', destination)
+                self._add_entry(parts, sess, [name])
+            filed.append((path, destination))
+        return filed
+
+    def _location_path(self, sess_uid):
+        shard = zlib.crc32(sess_uid.encode()) % _LOCATION_SHARDS
+        return os.path.join(self.root, LOCATIONS, '%03x' % shard)
+
+    def _location(self, sess_uid):
+        """ Private method: path components of the day directory of a sess_uid (None when not filed) """
+
+        return _read_json(self._location_path(sess_uid), {}).get(sess_uid)
+
+    def _set_location(self, sess_uid, parts):
+        """ Private method: records the day directory of a sess_uid (None forgets it) """
+
+        path = self._location_path(sess_uid)
+        locations = _read_json(path, {})
+        if parts is None:
+            locations.pop(sess_uid, None)
+        else:
+            locations[sess_uid] = list(parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomically(path, json.dumps(locations, sort_keys=True).encode())
+
+    def _remove_entry(self, parts, sess_uid):
+        """ Private method: deletes the files and the manifest entry of a session of a day directory """
+
+        manifest = self.manifest(*parts)
+        entry = manifest['sessions'].pop(sess_uid, None)
+        if entry is None:
+            return False
+        for name in entry['files']:
+            try:
+                os.remove(os.path.join(self.root, *parts, name))
+            except FileNotFoundError:
+                pass
+        self._save_manifest(parts, manifest)
+        self._update_counts(parts, len(manifest['sessions']))
+        return True
+
+    def remove(self, sess):
+        """ Delete the files of a session from the layout. Returns False if it was not there """
+
+        with self._locked():
+            parts = tuple(self._location(sess.sess_uid) or session_parts(sess))
+            if not self._remove_entry(parts, sess.sess_uid):
+                return False
+            self._set_location(sess.sess_uid, None)
+        return True
+
+    '''Listing'''
+
+    def birds(self):
+        """ {bird directory: number of sessions} """
+
+        return dict(self.manifest()['children'])
+
+    def softwares(self, bird):
+        """ {software directory: number of sessions} of a bird """
+
+        return dict(self.manifest(bird)['children'])
+
+    def dates(self, bird, software=None):
+        """ Sorted day directories of a bird (of one software, or of all of them) """
+
+        softwares = [software] if software is not None else self.softwares(bird)
+        return sorted({date for s in softwares for date in self.manifest(bird, s)['children']})
+
+    def sessions(self, bird, software=None, start=None, end=None):
+        """ Sessions of a bird, read from the manifests only
+
+        Parameters
+        ----------
+        bird : str
+            Bird directory (the bird_uid)
+        software : str
+            Only this software directory (all when None)
+        start, end : str
+            Inclusive range of dates (YYYY-MM-DD); day directories outside it are not read
+
+        Returns
+        -------
+        list of dict
+            Manifest entries, plus 'sess_uid', 'software', 'date' and 'paths', sorted by date and time
+        """
+
+        softwares = [software] if software is not None else sorted(self.softwares(bird))
+        found = []
+        for s in softwares:
+            for date in sorted(self.manifest(bird, s)['children']):
+                if (start is not None and date < start) or (end is not None and date > end):
+                    continue
+                directory = os.path.join(self.root, bird, s, date)
+                for sess_uid, entry in self.manifest(bird, s, date)['sessions'].items():
+                    found.append(dict(entry, sess_uid=sess_uid, software=s, date=date,
+                                      paths=[os.path.join(directory, name) for name in entry['files']]))
+        found.sort(key=lambda e: (e['date'], e['time'], e['sess_uid']))
+        return found
+
+    def load(self, entry):
+        """ Session of an entry returned by sessions() (its .pb file when there is one) """
+
+        paths = sorted(entry['paths'], key=lambda p: not p.endswith('.pb'))
+        return load_session(paths[0])
+
+    '''Recovery'''
+
+    def rebuild(self):
+        """ Regenerate every manifest from the files in the tree (after manual edits or a crash)
+
+        Files of day directories that are not sessions are left out and listed in self.errors.
+
+        Returns
+        -------
+        int
+            Number of sessions found
+        """
+
+        with self._locked():
+            self.errors = []
+            days = {}
+            for root, dirs, files in os.walk(self.root):
+                dirs.sort()
+                parts = tuple(os.path.relpath(root, self.root).split(os.sep))
+                if parts[0] == LOCATIONS:
+                    dirs[:] = []
+                if len(parts) != 3:
+                    continue
+                sessions = {}
+                for name in sorted(files):
+                    if not name.endswith(('.pb', '.json')):
+                        continue
+                    try:
+                        sess = load_session(os.path.join(root, name))
+                    except (ParseError, DecodeError, ValueError) as e:
+                        self.errors.append((os.path.join(root, name), '%s: %s' % (type(e).__name__, e)))
+                        continue
+                    previous = sessions.get(sess.sess_uid)
+                    names = [name] + (previous['files'] if previous else [])
+                    sessions[sess.sess_uid] = session_entry(sess, names)
+                days[parts] = sessions
+
+            counts = {}
+            for parts, sessions in days.items():
+                self._save_manifest(parts, {'version': _MANIFEST_VERSION, 'sessions': sessions})
+                for depth in range(3):
+                    children = counts.setdefault(parts[:depth], {})
+                    children[parts[depth]] = children.get(parts[depth], 0) + len(sessions)
+            counts.setdefault((), {})
+            for parts, children in counts.items():
+                self._save_manifest(parts, {'version': _MANIFEST_VERSION, 'children': children})
+            shards = {}
+            for parts, sessions in days.items():
+                for sess_uid in sessions:
+                    shards.setdefault(self._location_path(sess_uid), {})[sess_uid] = list(parts)
+            shutil.rmtree(os.path.join(self.root, LOCATIONS), ignore_errors=True)
+            os.makedirs(os.path.join(self.root, LOCATIONS))
+            for path, locations in shards.items():
+                _write_atomically(path, json.dumps(locations, sort_keys=True).encode())
+        return sum(len(s) for s in days.values())
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Bird / software / date layout of session files')
+    parser.add_argument('root')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='file existing metadata files into the layout')
+    add.add_argument('files', nargs='+')
+    add.add_argument('--move', action='store_true', help='move instead of copying')
+    listing = commands.add_parser('list', help='birds, or the sessions of a bird')
+    listing.add_argument('bird', nargs='?')
+    commands.add_parser('rebuild', help='regenerate the manifests from the files')
+    args = parser.parse_args(argv)
+
+    layout = SessionLayout(args.root)
+    if args.command == 'add':
+        for source, destination in layout.add_files(args.files, move=args.move):
+            print('%s -> %s' % (source, destination))
+    elif args.command == 'list' and args.bird is None:
+        for bird, n in sorted(layout.birds().items()):
+            print('%-20s %6d sessions' % (bird, n))
+    elif args.command == 'list':
+        for entry in layout.sessions(args.bird):
+            print('%s %-15s %-12s %-18s %s' % (entry['date'], entry['time'], entry['software'], entry['condition'],
+                                               entry['sess_uid']))
+    else:
+        print('%d sessions' % layout.rebuild())
+        for path, error in layout.errors:
+            print('    FAILED %s: %s' % (path, error))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+"""Message classes for the legacy layouts of Birdsong Project metadata
+
+Three layouts of the Session message have been written to disk:
+
+    version 0   deprecated/metadata_tutorial.proto (bird, cuervecito_box, procedure/probes)
+                e.g. deprecated/eg_meta_habituation.pb
+    version 1   early metadata.proto, before dummy_implant / dummy_implant_date were inserted as
+                fields 14 and 15 (condition ... acquisitions were numbered 14 ... 18)
+                e.g. deprecated/metadata.pb
+    version 2   current metadata.proto (metadata_pb2)
+
+The legacy classes are built at import time from descriptors in private descriptor pools, so they
+do not clash with metadata_pb2 and no generated code needs to be kept for them.
+"""
+
+from google.protobuf import descriptor_pb2
+from google.protobuf import descriptor_pool
+from google.protobuf import message_factory
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.message import DecodeError
+import metadata_pb2
+from metadata_wire import check_message, WireError
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+CURRENT_VERSION = 2
+
+_F = descriptor_pb2.FieldDescriptorProto
+_TYPES = {'string': _F.TYPE_STRING, 'int32': _F.TYPE_INT32, 'float': _F.TYPE_FLOAT, 'bool': _F.TYPE_BOOL}
+
+
+def message_class(file_proto, name):
+    """ Builds the class of a message declared in a FileDescriptorProto, in a private pool """
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    descriptor = pool.FindMessageTypeByName(name)
+    if hasattr(message_factory, 'GetMessageClass'):
+        return message_factory.GetMessageClass(descriptor)
+    return message_factory.MessageFactory(pool).GetPrototype(descriptor)
+
+
+def _add_enum(message, name, values):
+    enum = message.enum_type.add(name=name)
+    for number, value in enumerate(values):
+        enum.value.add(name=value, number=number)
+
+
+def _add_field(message, name, number, type_name, repeated=False, enum=False):
+    """ Private helper: adds a field; type_name is a scalar type or the full name of an enum / message """
+
+    field = message.field.add(name=name, number=number,
+                              label=_F.LABEL_REPEATED if repeated else _F.LABEL_OPTIONAL)
+    if type_name in _TYPES:
+        field.type = _TYPES[type_name]
+    else:
+        field.type_name = type_name
+        field.type = _F.TYPE_ENUM if enum else _F.TYPE_MESSAGE
+
+
+def _tutorial_file(as_written=False):
+    """ Private helper: FileDescriptorProto of deprecated/metadata_tutorial.proto (version 0)
+
+    The example files deprecated/eg_meta_*.pb were written before the last edit of that .proto: their
+    Probe.manufacturer is an enum and Probe.tip_depth_microns an int32. as_written=True builds that layout.
+    """
+
+    f = descriptor_pb2.FileDescriptorProto(name='metadata_tutorial.proto', package='tnel.birdsong', syntax='proto3')
+    session = f.message_type.add(name='Session')
+    prefix = '.tnel.birdsong.Session.'
+
+    probe = session.nested_type.add(name='Probe')
+    _add_enum(probe, 'BrainNucleus', ['UNKNOWN_BRAINNUCLEUS', 'HVC', 'RA', 'HVC_RA'])
+    _add_enum(probe, 'BrainHemisphere', ['UNKNOWN_BRAINHEMISPHERE', 'RIGHT', 'LEFT'])
+    if as_written:
+        _add_enum(probe, 'Manufacturer', ['UNKNOWN_MANUFACTURER', 'NEURONEXUS', 'NEUROPIXEL', 'MASMANIDIS', 'INHOUSE'])
+        _add_field(probe, 'manufacturer', 1, prefix + 'Probe.Manufacturer', enum=True)
+    else:
+        _add_field(probe, 'manufacturer', 1, 'string')
+    _add_field(probe, 'serial_number', 2, 'string')
+    _add_field(probe, 'num_channels', 3, 'int32')
+    _add_field(probe, 'tip_depth_microns', 4, 'int32' if as_written else 'float')
+    _add_field(probe, 'hemisphere', 5, prefix + 'Probe.BrainHemisphere', enum=True)
+    _add_field(probe, 'brain_nucleus', 6, prefix + 'Probe.BrainNucleus', enum=True)
+
+    stimulus = session.nested_type.add(name='Stimulus')
+    _add_enum(stimulus, 'StimulusType', ['UNKNOWN_STIMULUS', 'UNDIRECTED', 'DIRECTED', 'VIDEO_RECORDED',
+                                         'VIDEO_LIVE', 'SONG_REPLAY'])
+    _add_field(stimulus, 'stimulus_type', 1, prefix + 'Stimulus.StimulusType', enum=True)
+    _add_field(stimulus, 'details', 2, 'string', repeated=True)
+
+    procedure = session.nested_type.add(name='Procedure')
+    _add_enum(procedure, 'ExperimentType', ['UNKNOWN_EXPERYMENTTYPE', 'HABITUATION', 'CHRONIC_HVC', 'CHRONIC_RA',
+                                            'CHRONIC_HVCRA', 'ACUTE_HVC', 'ACUTE_RA', 'ACUTE_HVCRA'])
+    _add_enum(procedure, 'EphysHardware', ['UNKNOWN_EPHYSHARDWARE', 'OPENEPHYS', 'INTAN', 'NI'])
+    _add_enum(procedure, 'EphysSoftware', ['UNKNOWN_EPHYSSOFTWARE', 'SPIKEGLX', 'OPEPHYS', 'OPEPHYS_PLUS'])
+    _add_field(procedure, 'experiment_type', 1, prefix + 'Procedure.ExperimentType', enum=True)
+    _add_field(procedure, 'stimuli', 2, prefix + 'Stimulus', repeated=True)
+    _add_field(procedure, 'ephys_harware', 3, prefix + 'Procedure.EphysHardware', enum=True)
+    _add_field(procedure, 'ephys_software', 4, prefix + 'Procedure.EphysSoftware', enum=True)
+    _add_field(procedure, 'headstage', 5, 'string')
+    _add_field(procedure, 'probes', 6, prefix + 'Probe', repeated=True)
+
+    _add_enum(session, 'BirdType', ['UNKNOWN_BIRDTYPE', 'ZEBRA', 'STARLING', 'BENGALESE'])
+    _add_field(session, 'bird', 1, prefix + 'BirdType', enum=True)
+    for number, (name, type_name) in enumerate([('bird_uid', 'string'), ('date', 'string'), ('weight_grams', 'float'),
+                                                ('testosterone', 'bool'), ('cuervecito_box', 'int32')], 2):
+        _add_field(session, name, number, type_name)
+    _add_field(session, 'details', 7, 'string', repeated=True)
+    _add_field(session, 'procedure', 8, prefix + 'Procedure', repeated=True)
+    return f
+
+
+def _early_file():
+    """ Private helper: FileDescriptorProto of the early metadata.proto (version 1)
+
+    Reconstructed from deprecated/metadata.pb: same messages as today, without dummy_implant and
+    dummy_implant_date, so that condition, sess_uid, box, details and acquisitions are fields 14 to 18.
+    """
+
+    f = descriptor_pb2.FileDescriptorProto()
+    metadata_pb2.DESCRIPTOR.CopyToProto(f)
+    f.name = 'metadata_v1.proto'
+    session = f.message_type[0]
+    fields = [field for field in session.field if field.name not in ('dummy_implant', 'dummy_implant_date')]
+    del session.field[:]
+    for number, field in enumerate(fields, 1):
+        field.number = number
+        session.field.add().CopyFrom(field)
+    return f
+
+
+# (version, message class) of every known layout, tried newest first by detect_pb_version
+SESSION_LAYOUTS = [
+    (CURRENT_VERSION, metadata_pb2.Session),
+    (1, message_class(_early_file(), 'tnel.birdsong.Session')),
+    (0, message_class(_tutorial_file(), 'tnel.birdsong.Session')),
+    (0, message_class(_tutorial_file(as_written=True), 'tnel.birdsong.Session')),
+]
+
+_CONDITIONS = tuple(metadata_pb2.Session.Condition.keys())
+
+
+def _plausible(version, msg):
+    """ Private helper: semantic sanity checks telling layouts with compatible wire types apart """
+
+    if version == CURRENT_VERSION:
+        # A version 1 session read with the current layout has its sess_uid (field 15) in dummy_implant_date,
+        # and sess_uids of version 1 always start with the condition name, e.g. HABITUATION-z_m10g8_20-...
+        return msg.dummy_implant_date.split('-', 1)[0] not in _CONDITIONS
+    if version == 0:
+        return True
+    return msg.sess_uid == '' or msg.sess_uid.split('-', 1)[0] in _CONDITIONS
+
+
+def detect_pb_version(data):
+    """ Detect the layout a serialized session was written with
+
+    The current layout is tried first and accepts fields it does not declare (e.g. fields added by a newer
+    metadata.proto), as ParseFromString does; the legacy layouts must match exactly.
+
+    Parameters
+    ----------
+    data : bytes
+        Contents of a .pb file or archive record
+
+    Returns
+    -------
+    (int, class)
+        The version (0, 1 or CURRENT_VERSION, see the module docstring) and the message class of the layout
+
+    Raises
+    ------
+    ValueError
+        If the bytes do not match any known layout
+    """
+
+    for version, cls in SESSION_LAYOUTS:
+        try:
+            check_message(data, cls.DESCRIPTOR, allow_unknown=version == CURRENT_VERSION)
+            msg = cls()
+            msg.ParseFromString(data)
+        except (WireError, DecodeError, UnicodeDecodeError):
+            continue
+        if _plausible(version, msg):
+            return version, cls
+    raise ValueError('Serialized bytes do not match any known Session layout')
+
+
+def legacy_pb_to_dict(data):
+    """ Decode a serialized session of any layout into a dictionary keyed by that layout's field names
+
+    Parameters
+    ----------
+    data : bytes
+        Contents of a .pb file or archive record
+
+    Returns
+    -------
+    (int, dict)
+        The layout version and the decoded dictionary (enums as names, default values omitted)
+    """
+
+    version, cls = detect_pb_version(data)
+    msg = cls()
+    msg.ParseFromString(data)
+    return version, MessageToDict(msg, preserving_proto_field_name=True)
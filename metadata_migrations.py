@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+
+"""Versioned migrations of stored Birdsong Project metadata
+
+Every change of the Session layout gets a registered migration that upgrades a session dictionary (the
+form written to .json files) from one layout version to the next. Files of any version are decoded to a
+dictionary (.pb files through the matching class in metadata_legacy), run through the chain of migrations
+up to CURRENT_VERSION and written back atomically in the current layout.
+
+    version 0 -> 1   metadata_tutorial.proto to metadata.proto: renames (bird -> bird_type), enum remaps
+                     (experiment_type -> condition) and moved fields (procedure -> acquisitions, headstage
+                     from the procedure into every probe)
+    version 1 -> 2   dummy_implant / dummy_implant_date inserted as fields 14 and 15. Field names did not
+                     change, so the dictionary migration is empty; only the binary layout differs
+
+Usage:
+    python metadata_migrations.py SOURCE [SOURCE ...] [--workers N] [--checkpoint FILE] [--dry-run]
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import metadata_pb2
+from google.protobuf.json_format import ParseDict
+from metadata_API import session_to_dict
+from metadata_legacy import CURRENT_VERSION, legacy_pb_to_dict
+from metadata_archive import is_archive, iter_archive_records, SessionArchiveWriter
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+_MIGRATIONS = {}    # from_version -> (to_version, function, description)
+
+
+def register_migration(from_version, to_version, description=''):
+    """ Decorator registering a function that upgrades a session dictionary between two layout versions
+
+    The function receives the dictionary of a session in from_version and returns it in to_version
+    (modifying it in place is fine).
+
+    Parameters
+    ----------
+    from_version : int
+        Version of the input dictionary
+    to_version : int
+        Version of the returned dictionary
+    description : str
+        One line summary of the layout change
+    """
+
+    def decorator(function):
+        if from_version in _MIGRATIONS:
+            raise ValueError('A migration from version %d is already registered' % from_version)
+        _MIGRATIONS[from_version] = (to_version, function, description)
+        return function
+    return decorator
+
+
+'''Transform helpers'''
+
+def _walk(doc, path):
+    """ Private helper: yields (container, key) for every match of a path like 'procedure[].probes[].headstage' """
+
+    parts = path.split('.')
+    nodes = [doc]
+    for part in parts[:-1]:
+        name, repeated = (part[:-2], True) if part.endswith('[]') else (part, False)
+        children = []
+        for node in nodes:
+            if name in node:
+                children.extend(node[name] if repeated else [node[name]])
+        nodes = children
+    for node in nodes:
+        yield node, parts[-1]
+
+
+def rename_field(doc, path, new_name):
+    """ Rename a field everywhere it appears, e.g. rename_field(doc, 'acquisitions[].stimuli[].x', 'y') """
+
+    for node, key in _walk(doc, path):
+        if key in node:
+            node[new_name] = node.pop(key)
+    return doc
+
+
+def remap_enum(doc, path, mapping, default=None):
+    """ Replace the values of a field through a mapping (values missing from the mapping become default,
+    or are kept when default is None) """
+
+    for node, key in _walk(doc, path):
+        if key in node:
+            value = node[key]
+            node[key] = mapping.get(value, value if default is None else default)
+    return doc
+
+
+def move_field(doc, src, dst):
+    """ Move a top-level field to another top-level name, or into a nested path (created when missing) """
+
+    if src not in doc:
+        return doc
+    value = doc.pop(src)
+    node = doc
+    parts = dst.split('.')
+    for part in parts[:-1]:
+        node = node.setdefault(part, {})
+    node[parts[-1]] = value
+    return doc
+
+
+'''Registered migrations'''
+
+_EXPERIMENT_TO_CONDITION = {'HABITUATION': 'HABITUATION', 'CHRONIC_HVC': 'CHRONIC', 'CHRONIC_RA': 'CHRONIC',
+                            'CHRONIC_HVCRA': 'CHRONIC', 'ACUTE_HVC': 'ACUTE', 'ACUTE_RA': 'ACUTE',
+                            'ACUTE_HVCRA': 'ACUTE'}
+_HARDWARE = {'OPENEPHYS': 'openephys', 'INTAN': 'intan', 'NI': 'ni', 'UNKNOWN_EPHYSHARDWARE': ''}
+_SOFTWARE = {'SPIKEGLX': 'spikeglx', 'OPEPHYS': 'openephys', 'OPEPHYS_PLUS': 'openephys++',
+             'UNKNOWN_EPHYSSOFTWARE': ''}
+_NUCLEUS = {'HVC': ['hvc'], 'RA': ['ra'], 'HVC_RA': ['hvc', 'ra'], 'UNKNOWN_BRAINNUCLEUS': []}
+_HEMISPHERE = {'RIGHT': 'right', 'LEFT': 'left', 'UNKNOWN_BRAINHEMISPHERE': ''}
+_STIMULUS = {'UNDIRECTED': 'undirected', 'DIRECTED': 'female', 'VIDEO_RECORDED': 'video',
+             'VIDEO_LIVE': 'video_live', 'SONG_REPLAY': 'song_replay', 'UNKNOWN_STIMULUS': ''}
+_MANUFACTURER = {'NEURONEXUS': 'neuronexus', 'NEUROPIXEL': 'neuropixel', 'MASMANIDIS': 'masmanidis',
+                 'INHOUSE': 'inhouse', 'UNKNOWN_MANUFACTURER': ''}
+
+
+@register_migration(0, 1, 'metadata_tutorial.proto -> metadata.proto')
+def _tutorial_to_metadata(doc):
+
+    rename_field(doc, 'bird', 'bird_type')
+    if 'cuervecito_box' in doc:
+        doc['box'] = 'cuervecito%d' % doc.pop('cuervecito_box')
+
+    # The experiment type of the first procedure becomes the session condition, the exact type is kept in details
+    procedures = doc.pop('procedure', [])
+    experiment_types = [p['experiment_type'] for p in procedures if 'experiment_type' in p]
+    if experiment_types:
+        doc['condition'] = _EXPERIMENT_TO_CONDITION.get(experiment_types[0], 'UNKNOWN_CONDITION')
+        doc.setdefault('details', []).extend('experiment_type: %s' % t for t in experiment_types)
+
+    # Every procedure becomes an acquisition, its headstage moves into each of its probes
+    remap_enum({'procedure': procedures}, 'procedure[].ephys_harware', _HARDWARE)
+    remap_enum({'procedure': procedures}, 'procedure[].ephys_software', _SOFTWARE)
+    acquisitions = []
+    for procedure in procedures:
+        acquisition = {}
+        rename_field(procedure, 'ephys_harware', 'acquisition_hardware')
+        rename_field(procedure, 'ephys_software', 'acquisition_software')
+        for key in ('acquisition_hardware', 'acquisition_software'):
+            if procedure.get(key):
+                acquisition[key] = procedure[key]
+        probes = procedure.get('probes', [])
+        for probe in probes:
+            probe['acquisition_signal'] = 'neural'
+            if 'headstage' in procedure:
+                probe['headstage'] = procedure['headstage']
+        container = {'probes': probes, 'stimuli': procedure.get('stimuli', [])}
+        remap_enum(container, 'probes[].manufacturer', _MANUFACTURER)
+        remap_enum(container, 'probes[].hemisphere', _HEMISPHERE)
+        remap_enum(container, 'probes[].brain_nucleus', _NUCLEUS)
+        remap_enum(container, 'stimuli[].stimulus_type', _STIMULUS)
+        rename_field(container, 'stimuli[].stimulus_type', 'stimulus_signal')
+        if probes:
+            acquisition['neuralprobes'] = probes
+        if container['stimuli']:
+            acquisition['stimuli'] = container['stimuli']
+        acquisitions.append(acquisition)
+    if acquisitions:
+        doc['acquisitions'] = acquisitions
+
+    # sess_uid did not exist yet: rebuild it the way ProtobufMetadata does, from the information available
+    if 'sess_uid' not in doc:
+        doc['sess_uid'] = '%s-%s-%s' % (doc.get('condition', 'UNKNOWN_CONDITION'), doc.get('bird_uid', ''),
+                                        doc.get('date', ''))
+    return doc
+
+
+@register_migration(1, 2, 'dummy_implant / dummy_implant_date inserted as fields 14 and 15')
+def _insert_dummy_implant(doc):
+
+    return doc
+
+
+'''Upgrading'''
+
+_LEGACY_KEYS = ('bird', 'cuervecito_box', 'procedure')
+
+
+def detect_dict_version(doc):
+    """ Detect the layout version of a session dictionary (versions 1 and 2 share field names: 2 is returned) """
+
+    if any(key in doc for key in _LEGACY_KEYS):
+        return 0
+    return CURRENT_VERSION
+
+
+def upgrade_dict(doc, version=None):
+    """ Run a session dictionary through the registered migrations up to CURRENT_VERSION
+
+    Parameters
+    ----------
+    doc : dict
+        Session dictionary, modified in place
+    version : int
+        Version of doc. Detected when None
+
+    Returns
+    -------
+    dict
+        The dictionary in the current layout
+    """
+
+    version = detect_dict_version(doc) if version is None else version
+    while version < CURRENT_VERSION:
+        if version not in _MIGRATIONS:
+            raise ValueError('No migration registered from version %d' % version)
+        version, function, _ = _MIGRATIONS[version]
+        doc = function(doc)
+    return doc
+
+
+def upgrade_serialized(data):
+    """ Upgrade a serialized session of any layout
+
+    Parameters
+    ----------
+    data : bytes
+        Contents of a .pb file or archive record
+
+    Returns
+    -------
+    (int, metadata_pb2.Session)
+        The version the data was written with and the session in the current layout
+    """
+
+    version, doc = legacy_pb_to_dict(data)
+    sess = metadata_pb2.Session()
+    if version == CURRENT_VERSION:
+        sess.ParseFromString(data)
+    else:
+        ParseDict(upgrade_dict(doc, version), sess)
+    return version, sess
+
+
+def _replace_atomically(path, write):
+    """ Private helper: writes to a temporary file with `write(f)` and renames it over path """
+
+    tmp = path + '.migrating'
+    with open(tmp, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def upgrade_file(path, dry_run=False):
+    """ Upgrade a .pb file, .json file or session archive to the current layout, in place and atomically
+
+    Parameters
+    ----------
+    path : str
+        File to upgrade
+    dry_run : bool
+        Only report what would be done
+
+    Returns
+    -------
+    dict
+        {'path', 'upgraded': number of sessions rewritten, 'sessions': number of sessions, 'versions': {version: count}}
+    """
+
+    report = {'path': path, 'upgraded': 0, 'sessions': 0, 'versions': {}}
+
+    def count(version):
+        report['sessions'] += 1
+        report['versions'][version] = report['versions'].get(version, 0) + 1
+        if version != CURRENT_VERSION:
+            report['upgraded'] += 1
+
+    if is_archive(path):
+        if dry_run:
+            for _, payload in iter_archive_records(path):
+                count(upgrade_serialized(payload)[0])
+            return report
+        # Records are upgraded and written one at a time; the copy replaces the archive only if it differs
+        tmp = path + '.migrating'
+        try:
+            with SessionArchiveWriter(tmp, truncate=True) as writer:
+                for _, payload in iter_archive_records(path):
+                    version, sess = upgrade_serialized(payload)
+                    count(version)
+                    writer.append(payload if version == CURRENT_VERSION else sess.SerializeToString())
+                writer.flush(fsync=True)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        if report['upgraded']:
+            os.replace(tmp, path)
+        else:
+            os.remove(tmp)
+    elif path.endswith('.json'):
+        with open(path) as f:
+            doc = json.load(f)
+        version = detect_dict_version(doc)
+        count(version)
+        sess = metadata_pb2.Session()
+        ParseDict(upgrade_dict(doc, version), sess)
+        if version != CURRENT_VERSION and not dry_run:
+            _replace_atomically(path, lambda f: f.write(json.dumps(session_to_dict(sess), indent=5).encode()))
+    else:
+        with open(path, 'rb') as f:
+            data = f.read()
+        version, sess = upgrade_serialized(data)
+        count(version)
+        if version != CURRENT_VERSION and not dry_run:
+            _replace_atomically(path, lambda f: f.write(sess.SerializeToString()))
+    return report
+
+
+def _upgrade_worker(path, dry_run):
+    """ Private helper run in worker processes: upgrades one file, turning errors into reports """
+
+    try:
+        report = upgrade_file(path, dry_run)
+    except Exception as e:
+        report = {'path': path, 'error': '%s: %s' % (type(e).__name__, e)}
+    st = os.stat(path)
+    report['signature'] = [st.st_mtime_ns, st.st_size]
+    return report
+
+
+def _iter_files(sources, skip=()):
+    """ Private helper: metadata files and archives in the sources (directories are walked recursively) """
+
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    if path not in skip and (name.endswith(('.pb', '.json')) or is_archive(path)):
+                        yield path
+        elif source not in skip:
+            yield source
+
+
+def upgrade_archive(sources, workers=None, checkpoint=None, dry_run=False):
+    """ Upgrade every metadata file and session archive found in the sources, in parallel
+
+    Parameters
+    ----------
+    sources : list of str
+        Files, session archives and directories (walked recursively)
+    workers : int
+        Worker processes (None or 1 upgrades in the calling process)
+    checkpoint : str
+        JSON file recording the files already handled. An interrupted run started again with the same
+        checkpoint skips them (unless they changed since)
+    dry_run : bool
+        Only report what would be done
+
+    Returns
+    -------
+    dict
+        {'files', 'skipped', 'sessions', 'upgraded', 'versions', 'errors': [(path, message)], 'seconds'}
+    """
+
+    done = {}
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            done = json.load(f)['done']
+    skip = set() if checkpoint is None else {os.path.abspath(checkpoint), checkpoint}
+
+    def save():
+        if checkpoint is not None and not dry_run:
+            tmp = checkpoint + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'done': done}, f)
+            os.replace(tmp, checkpoint)
+
+    summary = {'files': 0, 'skipped': 0, 'sessions': 0, 'upgraded': 0, 'versions': {}, 'errors': []}
+    todo = []
+    for path in _iter_files(sources, skip):
+        st = os.stat(path)
+        if done.get(path) == [st.st_mtime_ns, st.st_size]:
+            summary['skipped'] += 1
+        else:
+            todo.append(path)
+
+    def collect(report):
+        summary['files'] += 1
+        if 'error' in report:
+            summary['errors'].append((report['path'], report['error']))
+            return
+        summary['sessions'] += report['sessions']
+        summary['upgraded'] += report['upgraded']
+        for version, n in report['versions'].items():
+            summary['versions'][version] = summary['versions'].get(version, 0) + n
+        done[report['path']] = report['signature']
+        if summary['files'] % 100 == 0:
+            save()
+
+    start = time.time()
+    if not workers or workers <= 1:
+        for path in todo:
+            collect(_upgrade_worker(path, dry_run))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in as_completed([pool.submit(_upgrade_worker, path, dry_run) for path in todo]):
+                collect(future.result())
+    save()
+    summary['seconds'] = time.time() - start
+    return summary
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Upgrade stored session metadata to the current layout')
+    parser.add_argument('sources', nargs='+', help='metadata files, session archives and directories')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--checkpoint', default=None, help='resumable progress file')
+    parser.add_argument('--dry-run', action='store_true', help='report without rewriting anything')
+    args = parser.parse_args(argv)
+
+    summary = upgrade_archive(args.sources, workers=args.workers, checkpoint=args.checkpoint, dry_run=args.dry_run)
+    print('%(files)d files (%(skipped)d skipped), %(sessions)d sessions, %(upgraded)d upgraded '
+          'in %(seconds).1f s' % summary)
+    for version, n in sorted(summary['versions'].items()):
+        print('    version %d: %d sessions' % (version, n))
+    for path, error in summary['errors']:
+        print('    ERROR %s: %s' % (path, error))
+
+
+if __name__ == '__main__':
+    main()
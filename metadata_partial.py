@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+"""Partial (field-masked) and lazy parsing of serialized Sessions
+
+Most consumers only need the bird header of a session (bird_uid, date, condition, box, ...) while most of
+the bytes of a large session are in its nested acquisitions. parse_masked keeps only the fields named by a
+FieldMask-style list of paths, skipping everything else at the wire level, and LazySession decodes the
+header eagerly but the acquisitions only when they are first accessed.
+
+Usage:
+    python metadata_partial.py      # header-only parse vs full ParseFromString benchmark
+"""
+
+import timeit
+import metadata_pb2
+from metadata_fixtures import benchmark_session
+from metadata_wire import iter_fields, encode_tag, encode_varint, WIRETYPE_LENGTH_DELIMITED
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+HEADER_FIELDS = tuple(f.name for f in metadata_pb2.Session.DESCRIPTOR.fields if f.name != 'acquisitions')
+_ACQUISITIONS_NUMBER = metadata_pb2.Session.DESCRIPTOR.fields_by_name['acquisitions'].number
+# Attributes a LazySession serves without decoding the acquisitions: header fields, nested enums and types
+_HEADER_ATTRIBUTES = frozenset(
+    list(HEADER_FIELDS)
+    + [e.name for e in metadata_pb2.Session.DESCRIPTOR.enum_types]
+    + [v.name for e in metadata_pb2.Session.DESCRIPTOR.enum_types for v in e.values]
+    + [t.name for t in metadata_pb2.Session.DESCRIPTOR.nested_types])
+
+
+def _mask_tree(paths, descriptor):
+    """ Private helper: turns ['a', 'b.c', 'b.d'] into {number_a: None, number_b: {number_c: None, number_d: None}}
+
+    None marks a field that is kept entirely. Unknown paths raise a ValueError.
+    """
+
+    tree = {}
+    for path in paths:
+        node, desc = tree, descriptor
+        names = path.split('.')
+        for i, name in enumerate(names):
+            field = desc.fields_by_name.get(name)
+            if field is None:
+                raise ValueError('Unknown field "%s" in path "%s"' % (name, path))
+            last = i == len(names) - 1
+            if last:
+                node[field.number] = None
+                break
+            if field.message_type is None:
+                raise ValueError('Field "%s" in path "%s" is not a message' % (name, path))
+            child = node.get(field.number, {})
+            if child is None:
+                break       # A shorter path already keeps the whole field
+            node[field.number] = child
+            node, desc = child, field.message_type
+    return tree
+
+
+def _filter(data, start, end, tree, out):
+    """ Private helper: appends to `out` the wire bytes of the fields of data[start:end] selected by tree """
+
+    for number, wire_type, tag_pos, value_pos, field_end in iter_fields(data, start, end):
+        if number not in tree:
+            continue
+        subtree = tree[number]
+        if subtree is None:
+            out.append(data[tag_pos:field_end])
+        else:
+            sub = []
+            _filter(data, value_pos, field_end, subtree, sub)
+            payload = b''.join(sub)
+            out.append(encode_tag(number, WIRETYPE_LENGTH_DELIMITED) + encode_varint(len(payload)) + payload)
+
+
+def filter_serialized(data, paths, descriptor=metadata_pb2.Session.DESCRIPTOR):
+    """ Strip a serialized message down to the fields selected by a field mask, without parsing it
+
+    Parameters
+    ----------
+    data : bytes
+        Serialized message
+    paths : list of str or google.protobuf.field_mask_pb2.FieldMask
+        Dotted field paths to keep, e.g. ['bird_uid', 'acquisitions.acquisition_software']
+    descriptor : google.protobuf.descriptor.Descriptor
+        Message type of data, Session by default
+
+    Returns
+    -------
+    bytes
+        Serialized message holding only the selected fields
+    """
+
+    paths = getattr(paths, 'paths', paths)
+    data = memoryview(data)
+    out = []
+    _filter(data, 0, len(data), _mask_tree(paths, descriptor), out)
+    return b''.join(out)
+
+
+def parse_masked(data, paths=HEADER_FIELDS):
+    """ Parse only the fields of a serialized Session selected by a field mask
+
+    Fields outside the mask (e.g. all the acquisitions, in the default header-only mode) are skipped on the
+    wire and never decoded.
+
+    Parameters
+    ----------
+    data : bytes
+        Serialized Session, e.g. the contents of a .pb file
+    paths : list of str or google.protobuf.field_mask_pb2.FieldMask
+        Dotted field paths to keep. Defaults to every top-level field except acquisitions
+
+    Returns
+    -------
+    metadata_pb2.Session
+        A session with only the selected fields set
+    """
+
+    sess = metadata_pb2.Session()
+    sess.ParseFromString(filter_serialized(data, paths))
+    return sess
+
+
+def parse_masked_file(filename, paths=HEADER_FIELDS):
+    """ parse_masked applied to a serialized (.pb) file
+
+    Parameters
+    ----------
+    filename : str
+        Path to the .pb file
+    paths : list of str or google.protobuf.field_mask_pb2.FieldMask
+        Dotted field paths to keep. Defaults to every top-level field except acquisitions
+    """
+
+    with open(filename, 'rb') as f:
+        return parse_masked(f.read(), paths)
+
+
+class LazySession:
+
+    """ Read access to a serialized Session that defers decoding the acquisitions until first accessed
+
+    Every attribute of the Session is available (sess.bird_uid, sess.acquisitions, ...). The header fields
+    are decoded on construction, the acquisitions the first time they are read. Any other attribute, e.g.
+    the message methods (SerializeToString, ByteSize, ListFields, ...), decodes the acquisitions first, so
+    it always sees the whole session.
+
+    Parameters
+    ----------
+    data : bytes
+        Serialized Session
+    """
+
+    def __init__(self, data):
+
+        header = []
+        acquisitions = []
+        for number, _, tag_pos, _, field_end in iter_fields(memoryview(data)):
+            (acquisitions if number == _ACQUISITIONS_NUMBER else header).append((tag_pos, field_end))
+        self._data = data
+        self._acquisition_spans = acquisitions
+        self._sess = metadata_pb2.Session()
+        self._sess.ParseFromString(b''.join(data[s:e] for s, e in header))
+
+    @classmethod
+    def from_file(cls, filename):
+        """ Build a LazySession from a serialized (.pb) file """
+
+        with open(filename, 'rb') as f:
+            return cls(f.read())
+
+    @property
+    def acquisitions_loaded(self):
+        """ True once the acquisitions have been decoded """
+
+        return self._acquisition_spans is None
+
+    @property
+    def acquisitions(self):
+        """ The repeated Acquisition field, decoded on first access """
+
+        if self._acquisition_spans is not None:
+            self._sess.MergeFromString(b''.join(self._data[s:e] for s, e in self._acquisition_spans))
+            self._acquisition_spans = None
+            self._data = None
+        return self._sess.acquisitions
+
+    def session(self):
+        """ Return the fully decoded metadata_pb2.Session """
+
+        self.acquisitions
+        return self._sess
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)      # Own attributes not set yet (e.g. while copying or unpickling)
+        if name in _HEADER_ATTRIBUTES:
+            return getattr(self._sess, name)
+        return getattr(self.session(), name)
+
+
+'''Benchmark'''
+
+def benchmark_header_parse(n_acquisitions=20, n_items=10, number=200):
+    """ Time a header-only parse against a full ParseFromString on a large session
+
+    Parameters
+    ----------
+    n_acquisitions : int
+        Acquisitions in the benchmark session
+    n_items : int
+        Neural probes, sensors and stimuli per acquisition
+    number : int
+        Parses per timing
+
+    Returns
+    -------
+    dict
+        Microseconds per parse for each method, plus the size of the serialized session
+    """
+
+    data = benchmark_session(n_acquisitions, n_items).SerializeToString()
+
+    def full():
+        metadata_pb2.Session().ParseFromString(data)
+
+    results = {'bytes': len(data)}
+    for name, fn in [('full ParseFromString', full),
+                     ('parse_masked(HEADER_FIELDS)', lambda: parse_masked(data)),
+                     ('LazySession (header only)', lambda: LazySession(data).bird_uid)]:
+        results[name] = min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+    return results
+
+
+if __name__ == '__main__':
+    for n in (1, 10, 50):
+        results = benchmark_header_parse(n_acquisitions=n)
+        print('%d acquisitions, %d bytes' % (n, results.pop('bytes')))
+        for name, usec in results.items():
+            print('    %-30s %10.1f us' % (name, usec))
@@ -2,9 +2,9 @@
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: metadata.proto
 """Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
 from google.protobuf import descriptor as _descriptor
-from google.protobuf import message as _message
-from google.protobuf import reflection as _reflection
+from google.protobuf import descriptor_pool as _descriptor_pool
 from google.protobuf import symbol_database as _symbol_database
 # @@protoc_insertion_point(imports)
 
@@ -13,688 +13,29 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor.FileDescriptor(
-  name='metadata.proto',
-  package='tnel.birdsong',
-  syntax='proto3',
-  serialized_options=None,
-  create_key=_descriptor._internal_create_key,
-  serialized_pb=b'\n\x0emetadata.proto\x12\rtnel.birdsong\"\xa9\r\n\x07Session\x12\x32\n\tbird_type\x18\x01 \x01(\x0e\x32\x1f.tnel.birdsong.Session.BirdType\x12\x30\n\x08\x62ird_sex\x18\x02 \x01(\x0e\x32\x1e.tnel.birdsong.Session.BirdSex\x12\x10\n\x08\x62ird_uid\x18\x03 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x04 \x01(\t\x12\x0c\n\x04time\x18\x05 \x01(\t\x12\x14\n\x0cweight_grams\x18\x06 \x01(\x02\x12\x14\n\x0ctestosterone\x18\x07 \x01(\x08\x12\x19\n\x11testosterone_date\x18\x08 \x01(\t\x12\x14\n\x0c\x64ummy_weight\x18\t \x01(\x08\x12\x1a\n\x12\x64ummy_weight_grams\x18\n \x01(\x02\x12\x19\n\x11\x64ummy_weight_date\x18\x0b \x01(\t\x12\x14\n\x0c\x64ummy_tether\x18\x0c \x01(\x08\x12\x19\n\x11\x64ummy_tether_date\x18\r \x01(\t\x12\x15\n\rdummy_implant\x18\x0e \x01(\x08\x12\x1a\n\x12\x64ummy_implant_date\x18\x0f \x01(\t\x12\x33\n\tcondition\x18\x10 \x01(\x0e\x32 .tnel.birdsong.Session.Condition\x12\x10\n\x08sess_uid\x18\x11 \x01(\t\x12\x0b\n\x03\x62ox\x18\x12 \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\x13 \x03(\t\x12\x38\n\x0c\x61\x63quisitions\x18\x14 \x03(\x0b\x32\".tnel.birdsong.Session.Acquisition\x1a\xb3\x02\n\x0bNeuralProbe\x12\x1a\n\x12\x61\x63quisition_signal\x18\x01 \x01(\t\x12\x14\n\x0cmanufacturer\x18\x02 \x01(\t\x12\r\n\x05model\x18\x03 \x01(\t\x12\x15\n\rserial_number\x18\x04 \x01(\t\x12\x14\n\x0cnum_channels\x18\x05 \x01(\x05\x12\x19\n\x11tip_depth_microns\x18\x06 \x01(\x02\x12#\n\x1bimplant_coordinates_microns\x18\x07 \x01(\t\x12\x12\n\nhemisphere\x18\x08 \x01(\t\x12\x15\n\rbrain_nucleus\x18\t \x03(\t\x12\x11\n\theadstage\x18\n \x01(\t\x12\x15\n\rchannel_group\x18\x0b \x01(\t\x12\x10\n\x08\x63hannels\x18\x0c \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\r \x03(\t\x1a\xd5\x01\n\x06Sensor\x12\x1a\n\x12\x61\x63quisition_signal\x18\x01 \x01(\t\x12\x14\n\x0cmanufacturer\x18\x02 \x01(\t\x12\r\n\x05model\x18\x03 \x01(\t\x12\x15\n\rserial_number\x18\x04 \x01(\t\x12\x13\n\x0bsignal_name\x18\x05 \x01(\t\x12\x11\n\theadstage\x18\x06 \x01(\t\x12\x15\n\rchannel_group\x18\x07 \x01(\t\x12\x10\n\x08\x63hannels\x18\x08 \x01(\t\x12\x11\n\tlocations\x18\t \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\n \x03(\t\x1a\xaf\x01\n\x08Stimulus\x12\x17\n\x0fstimulus_signal\x18\x01 \x01(\t\x12\x14\n\x0cmanufacturer\x18\x02 \x01(\t\x12\r\n\x05model\x18\x03 \x01(\t\x12\x15\n\rserial_number\x18\x04 \x01(\t\x12\x13\n\x0bsignal_name\x18\x05 \x01(\t\x12\x16\n\x0e\x63hannel_gropup\x18\x06 \x01(\t\x12\x10\n\x08\x63hannels\x18\x07 \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\x08 \x03(\t\x1a\xe5\x01\n\x0b\x41\x63quisition\x12\x1c\n\x14\x61\x63quisition_hardware\x18\x01 \x01(\t\x12\x1c\n\x14\x61\x63quisition_software\x18\x02 \x01(\t\x12\x38\n\x0cneuralprobes\x18\r \x03(\x0b\x32\".tnel.birdsong.Session.NeuralProbe\x12.\n\x07sensors\x18\x0e \x03(\x0b\x32\x1d.tnel.birdsong.Session.Sensor\x12\x30\n\x07stimuli\x18\x0f \x03(\x0b\x32\x1f.tnel.birdsong.Session.Stimulus\"H\n\x08\x42irdType\x12\x14\n\x10UNKNOWN_BIRDTYPE\x10\x00\x12\t\n\x05ZEBRA\x10\x01\x12\x0c\n\x08STARLING\x10\x02\x12\r\n\tBENGALESE\x10\x03\"4\n\x07\x42irdSex\x12\x13\n\x0fUNKNOWN_BIRDSEX\x10\x00\x12\x08\n\x04MALE\x10\x01\x12\n\n\x06\x46\x45MALE\x10\x02\"K\n\tCondition\x12\x15\n\x11UNKNOWN_CONDITION\x10\x00\x12\x0f\n\x0bHABITUATION\x10\x01\x12\x0b\n\x07\x43HRONIC\x10\x02\x12\t\n\x05\x41\x43UTE\x10\x03\x62\x06proto3'
-)
-
-
-
-_SESSION_BIRDTYPE = _descriptor.EnumDescriptor(
-  name='BirdType',
-  full_name='tnel.birdsong.Session.BirdType',
-  filename=None,
-  file=DESCRIPTOR,
-  create_key=_descriptor._internal_create_key,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='UNKNOWN_BIRDTYPE', index=0, number=0,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='ZEBRA', index=1, number=1,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='STARLING', index=2, number=2,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='BENGALESE', index=3, number=3,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-  ],
-  containing_type=None,
-  serialized_options=None,
-  serialized_start=1536,
-  serialized_end=1608,
-)
-_sym_db.RegisterEnumDescriptor(_SESSION_BIRDTYPE)
-
-_SESSION_BIRDSEX = _descriptor.EnumDescriptor(
-  name='BirdSex',
-  full_name='tnel.birdsong.Session.BirdSex',
-  filename=None,
-  file=DESCRIPTOR,
-  create_key=_descriptor._internal_create_key,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='UNKNOWN_BIRDSEX', index=0, number=0,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='MALE', index=1, number=1,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='FEMALE', index=2, number=2,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-  ],
-  containing_type=None,
-  serialized_options=None,
-  serialized_start=1610,
-  serialized_end=1662,
-)
-_sym_db.RegisterEnumDescriptor(_SESSION_BIRDSEX)
-
-_SESSION_CONDITION = _descriptor.EnumDescriptor(
-  name='Condition',
-  full_name='tnel.birdsong.Session.Condition',
-  filename=None,
-  file=DESCRIPTOR,
-  create_key=_descriptor._internal_create_key,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='UNKNOWN_CONDITION', index=0, number=0,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='HABITUATION', index=1, number=1,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='CHRONIC', index=2, number=2,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-    _descriptor.EnumValueDescriptor(
-      name='ACUTE', index=3, number=3,
-      serialized_options=None,
-      type=None,
-      create_key=_descriptor._internal_create_key),
-  ],
-  containing_type=None,
-  serialized_options=None,
-  serialized_start=1664,
-  serialized_end=1739,
-)
-_sym_db.RegisterEnumDescriptor(_SESSION_CONDITION)
-
-
-_SESSION_NEURALPROBE = _descriptor.Descriptor(
-  name='NeuralProbe',
-  full_name='tnel.birdsong.Session.NeuralProbe',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='acquisition_signal', full_name='tnel.birdsong.Session.NeuralProbe.acquisition_signal', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='manufacturer', full_name='tnel.birdsong.Session.NeuralProbe.manufacturer', index=1,
-      number=2, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='model', full_name='tnel.birdsong.Session.NeuralProbe.model', index=2,
-      number=3, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='serial_number', full_name='tnel.birdsong.Session.NeuralProbe.serial_number', index=3,
-      number=4, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='num_channels', full_name='tnel.birdsong.Session.NeuralProbe.num_channels', index=4,
-      number=5, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='tip_depth_microns', full_name='tnel.birdsong.Session.NeuralProbe.tip_depth_microns', index=5,
-      number=6, type=2, cpp_type=6, label=1,
-      has_default_value=False, default_value=float(0),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='implant_coordinates_microns', full_name='tnel.birdsong.Session.NeuralProbe.implant_coordinates_microns', index=6,
-      number=7, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='hemisphere', full_name='tnel.birdsong.Session.NeuralProbe.hemisphere', index=7,
-      number=8, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='brain_nucleus', full_name='tnel.birdsong.Session.NeuralProbe.brain_nucleus', index=8,
-      number=9, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='headstage', full_name='tnel.birdsong.Session.NeuralProbe.headstage', index=9,
-      number=10, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='channel_group', full_name='tnel.birdsong.Session.NeuralProbe.channel_group', index=10,
-      number=11, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='channels', full_name='tnel.birdsong.Session.NeuralProbe.channels', index=11,
-      number=12, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='details', full_name='tnel.birdsong.Session.NeuralProbe.details', index=12,
-      number=13, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=601,
-  serialized_end=908,
-)
-
-_SESSION_SENSOR = _descriptor.Descriptor(
-  name='Sensor',
-  full_name='tnel.birdsong.Session.Sensor',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='acquisition_signal', full_name='tnel.birdsong.Session.Sensor.acquisition_signal', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='manufacturer', full_name='tnel.birdsong.Session.Sensor.manufacturer', index=1,
-      number=2, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='model', full_name='tnel.birdsong.Session.Sensor.model', index=2,
-      number=3, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='serial_number', full_name='tnel.birdsong.Session.Sensor.serial_number', index=3,
-      number=4, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='signal_name', full_name='tnel.birdsong.Session.Sensor.signal_name', index=4,
-      number=5, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='headstage', full_name='tnel.birdsong.Session.Sensor.headstage', index=5,
-      number=6, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='channel_group', full_name='tnel.birdsong.Session.Sensor.channel_group', index=6,
-      number=7, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='channels', full_name='tnel.birdsong.Session.Sensor.channels', index=7,
-      number=8, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='locations', full_name='tnel.birdsong.Session.Sensor.locations', index=8,
-      number=9, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='details', full_name='tnel.birdsong.Session.Sensor.details', index=9,
-      number=10, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=911,
-  serialized_end=1124,
-)
-
-_SESSION_STIMULUS = _descriptor.Descriptor(
-  name='Stimulus',
-  full_name='tnel.birdsong.Session.Stimulus',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='stimulus_signal', full_name='tnel.birdsong.Session.Stimulus.stimulus_signal', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='manufacturer', full_name='tnel.birdsong.Session.Stimulus.manufacturer', index=1,
-      number=2, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='model', full_name='tnel.birdsong.Session.Stimulus.model', index=2,
-      number=3, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='serial_number', full_name='tnel.birdsong.Session.Stimulus.serial_number', index=3,
-      number=4, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='signal_name', full_name='tnel.birdsong.Session.Stimulus.signal_name', index=4,
-      number=5, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='channel_gropup', full_name='tnel.birdsong.Session.Stimulus.channel_gropup', index=5,
-      number=6, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='channels', full_name='tnel.birdsong.Session.Stimulus.channels', index=6,
-      number=7, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='details', full_name='tnel.birdsong.Session.Stimulus.details', index=7,
-      number=8, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=1127,
-  serialized_end=1302,
-)
-
-_SESSION_ACQUISITION = _descriptor.Descriptor(
-  name='Acquisition',
-  full_name='tnel.birdsong.Session.Acquisition',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='acquisition_hardware', full_name='tnel.birdsong.Session.Acquisition.acquisition_hardware', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='acquisition_software', full_name='tnel.birdsong.Session.Acquisition.acquisition_software', index=1,
-      number=2, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='neuralprobes', full_name='tnel.birdsong.Session.Acquisition.neuralprobes', index=2,
-      number=13, type=11, cpp_type=10, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='sensors', full_name='tnel.birdsong.Session.Acquisition.sensors', index=3,
-      number=14, type=11, cpp_type=10, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='stimuli', full_name='tnel.birdsong.Session.Acquisition.stimuli', index=4,
-      number=15, type=11, cpp_type=10, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=1305,
-  serialized_end=1534,
-)
-
-_SESSION = _descriptor.Descriptor(
-  name='Session',
-  full_name='tnel.birdsong.Session',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='bird_type', full_name='tnel.birdsong.Session.bird_type', index=0,
-      number=1, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='bird_sex', full_name='tnel.birdsong.Session.bird_sex', index=1,
-      number=2, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='bird_uid', full_name='tnel.birdsong.Session.bird_uid', index=2,
-      number=3, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='date', full_name='tnel.birdsong.Session.date', index=3,
-      number=4, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='time', full_name='tnel.birdsong.Session.time', index=4,
-      number=5, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='weight_grams', full_name='tnel.birdsong.Session.weight_grams', index=5,
-      number=6, type=2, cpp_type=6, label=1,
-      has_default_value=False, default_value=float(0),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='testosterone', full_name='tnel.birdsong.Session.testosterone', index=6,
-      number=7, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='testosterone_date', full_name='tnel.birdsong.Session.testosterone_date', index=7,
-      number=8, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='dummy_weight', full_name='tnel.birdsong.Session.dummy_weight', index=8,
-      number=9, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='dummy_weight_grams', full_name='tnel.birdsong.Session.dummy_weight_grams', index=9,
-      number=10, type=2, cpp_type=6, label=1,
-      has_default_value=False, default_value=float(0),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='dummy_weight_date', full_name='tnel.birdsong.Session.dummy_weight_date', index=10,
-      number=11, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='dummy_tether', full_name='tnel.birdsong.Session.dummy_tether', index=11,
-      number=12, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='dummy_tether_date', full_name='tnel.birdsong.Session.dummy_tether_date', index=12,
-      number=13, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='dummy_implant', full_name='tnel.birdsong.Session.dummy_implant', index=13,
-      number=14, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='dummy_implant_date', full_name='tnel.birdsong.Session.dummy_implant_date', index=14,
-      number=15, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='condition', full_name='tnel.birdsong.Session.condition', index=15,
-      number=16, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='sess_uid', full_name='tnel.birdsong.Session.sess_uid', index=16,
-      number=17, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='box', full_name='tnel.birdsong.Session.box', index=17,
-      number=18, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='details', full_name='tnel.birdsong.Session.details', index=18,
-      number=19, type=9, cpp_type=9, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='acquisitions', full_name='tnel.birdsong.Session.acquisitions', index=19,
-      number=20, type=11, cpp_type=10, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[_SESSION_NEURALPROBE, _SESSION_SENSOR, _SESSION_STIMULUS, _SESSION_ACQUISITION, ],
-  enum_types=[
-    _SESSION_BIRDTYPE,
-    _SESSION_BIRDSEX,
-    _SESSION_CONDITION,
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=34,
-  serialized_end=1739,
-)
-
-_SESSION_NEURALPROBE.containing_type = _SESSION
-_SESSION_SENSOR.containing_type = _SESSION
-_SESSION_STIMULUS.containing_type = _SESSION
-_SESSION_ACQUISITION.fields_by_name['neuralprobes'].message_type = _SESSION_NEURALPROBE
-_SESSION_ACQUISITION.fields_by_name['sensors'].message_type = _SESSION_SENSOR
-_SESSION_ACQUISITION.fields_by_name['stimuli'].message_type = _SESSION_STIMULUS
-_SESSION_ACQUISITION.containing_type = _SESSION
-_SESSION.fields_by_name['bird_type'].enum_type = _SESSION_BIRDTYPE
-_SESSION.fields_by_name['bird_sex'].enum_type = _SESSION_BIRDSEX
-_SESSION.fields_by_name['condition'].enum_type = _SESSION_CONDITION
-_SESSION.fields_by_name['acquisitions'].message_type = _SESSION_ACQUISITION
-_SESSION_BIRDTYPE.containing_type = _SESSION
-_SESSION_BIRDSEX.containing_type = _SESSION
-_SESSION_CONDITION.containing_type = _SESSION
-DESCRIPTOR.message_types_by_name['Session'] = _SESSION
-_sym_db.RegisterFileDescriptor(DESCRIPTOR)
-
-Session = _reflection.GeneratedProtocolMessageType('Session', (_message.Message,), {
-
-  'NeuralProbe' : _reflection.GeneratedProtocolMessageType('NeuralProbe', (_message.Message,), {
-    'DESCRIPTOR' : _SESSION_NEURALPROBE,
-    '__module__' : 'metadata_pb2'
-    # @@protoc_insertion_point(class_scope:tnel.birdsong.Session.NeuralProbe)
-    })
-  ,
-
-  'Sensor' : _reflection.GeneratedProtocolMessageType('Sensor', (_message.Message,), {
-    'DESCRIPTOR' : _SESSION_SENSOR,
-    '__module__' : 'metadata_pb2'
-    # @@protoc_insertion_point(class_scope:tnel.birdsong.Session.Sensor)
-    })
-  ,
-
-  'Stimulus' : _reflection.GeneratedProtocolMessageType('Stimulus', (_message.Message,), {
-    'DESCRIPTOR' : _SESSION_STIMULUS,
-    '__module__' : 'metadata_pb2'
-    # @@protoc_insertion_point(class_scope:tnel.birdsong.Session.Stimulus)
-    })
-  ,
-
-  'Acquisition' : _reflection.GeneratedProtocolMessageType('Acquisition', (_message.Message,), {
-    'DESCRIPTOR' : _SESSION_ACQUISITION,
-    '__module__' : 'metadata_pb2'
-    # @@protoc_insertion_point(class_scope:tnel.birdsong.Session.Acquisition)
-    })
-  ,
-  'DESCRIPTOR' : _SESSION,
-  '__module__' : 'metadata_pb2'
-  # @@protoc_insertion_point(class_scope:tnel.birdsong.Session)
-  })
-_sym_db.RegisterMessage(Session)
-_sym_db.RegisterMessage(Session.NeuralProbe)
-_sym_db.RegisterMessage(Session.Sensor)
-_sym_db.RegisterMessage(Session.Stimulus)
-_sym_db.RegisterMessage(Session.Acquisition)
-
-
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0emetadata.proto\x12\rtnel.birdsong\"\xf8\x0e\n\x07Session\x12\x32\n\tbird_type\x18\x01 \x01(\x0e\x32\x1f.tnel.birdsong.Session.BirdType\x12\x30\n\x08\x62ird_sex\x18\x02 \x01(\x0e\x32\x1e.tnel.birdsong.Session.BirdSex\x12\x10\n\x08\x62ird_uid\x18\x03 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x04 \x01(\t\x12\x0c\n\x04time\x18\x05 \x01(\t\x12\x14\n\x0cweight_grams\x18\x06 \x01(\x02\x12\x14\n\x0ctestosterone\x18\x07 \x01(\x08\x12\x19\n\x11testosterone_date\x18\x08 \x01(\t\x12\x14\n\x0c\x64ummy_weight\x18\t \x01(\x08\x12\x1a\n\x12\x64ummy_weight_grams\x18\n \x01(\x02\x12\x19\n\x11\x64ummy_weight_date\x18\x0b \x01(\t\x12\x14\n\x0c\x64ummy_tether\x18\x0c \x01(\x08\x12\x19\n\x11\x64ummy_tether_date\x18\r \x01(\t\x12\x15\n\rdummy_implant\x18\x0e \x01(\x08\x12\x1a\n\x12\x64ummy_implant_date\x18\x0f \x01(\t\x12\x33\n\tcondition\x18\x10 \x01(\x0e\x32 .tnel.birdsong.Session.Condition\x12\x10\n\x08sess_uid\x18\x11 \x01(\t\x12\x0b\n\x03\x62ox\x18\x12 \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\x13 \x03(\t\x12\x38\n\x0c\x61\x63quisitions\x18\x14 \x03(\x0b\x32\".tnel.birdsong.Session.Acquisition\x1a\xb3\x02\n\x0bNeuralProbe\x12\x1a\n\x12\x61\x63quisition_signal\x18\x01 \x01(\t\x12\x14\n\x0cmanufacturer\x18\x02 \x01(\t\x12\r\n\x05model\x18\x03 \x01(\t\x12\x15\n\rserial_number\x18\x04 \x01(\t\x12\x14\n\x0cnum_channels\x18\x05 \x01(\x05\x12\x19\n\x11tip_depth_microns\x18\x06 \x01(\x02\x12#\n\x1bimplant_coordinates_microns\x18\x07 \x01(\t\x12\x12\n\nhemisphere\x18\x08 \x01(\t\x12\x15\n\rbrain_nucleus\x18\t \x03(\t\x12\x11\n\theadstage\x18\n \x01(\t\x12\x15\n\rchannel_group\x18\x0b \x01(\t\x12\x10\n\x08\x63hannels\x18\x0c \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\r \x03(\t\x1a\xd5\x01\n\x06Sensor\x12\x1a\n\x12\x61\x63quisition_signal\x18\x01 \x01(\t\x12\x14\n\x0cmanufacturer\x18\x02 \x01(\t\x12\r\n\x05model\x18\x03 \x01(\t\x12\x15\n\rserial_number\x18\x04 \x01(\t\x12\x13\n\x0bsignal_name\x18\x05 \x01(\t\x12\x11\n\theadstage\x18\x06 \x01(\t\x12\x15\n\rchannel_group\x18\x07 \x01(\t\x12\x10\n\x08\x63hannels\x18\x08 \x01(\t\x12\x11\n\tlocations\x18\t \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\n \x03(\t\x1a\xaf\x01\n\x08Stimulus\x12\x17\n\x0fstimulus_signal\x18\x01 \x01(\t\x12\x14\n\x0cmanufacturer\x18\x02 \x01(\t\x12\r\n\x05model\x18\x03 \x01(\t\x12\x15\n\rserial_number\x18\x04 \x01(\t\x12\x13\n\x0bsignal_name\x18\x05 \x01(\t\x12\x16\n\x0e\x63hannel_gropup\x18\x06 \x01(\t\x12\x10\n\x08\x63hannels\x18\x07 \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\x08 \x03(\t\x1a\x98\x01\n\x08\x44\x61taFile\x12\x0c\n\x04path\x18\x01 \x01(\t\x12\x0c\n\x04size\x18\x02 \x01(\x04\x12\x13\n\x0bmodified_ns\x18\x03 \x01(\x03\x12\x10\n\x08\x63hecksum\x18\x04 \x01(\t\x12\x0e\n\x06signal\x18\x05 \x01(\t\x12\r\n\x05\x64type\x18\x06 \x01(\t\x12\x14\n\x0cnum_channels\x18\x07 \x01(\x05\x12\x14\n\x0cheader_bytes\x18\x08 \x01(\x04\x1a\x99\x02\n\x0b\x41\x63quisition\x12\x1c\n\x14\x61\x63quisition_hardware\x18\x01 \x01(\t\x12\x1c\n\x14\x61\x63quisition_software\x18\x02 \x01(\t\x12\x38\n\x0cneuralprobes\x18\r \x03(\x0b\x32\".tnel.birdsong.Session.NeuralProbe\x12.\n\x07sensors\x18\x0e \x03(\x0b\x32\x1d.tnel.birdsong.Session.Sensor\x12\x30\n\x07stimuli\x18\x0f \x03(\x0b\x32\x1f.tnel.birdsong.Session.Stimulus\x12\x32\n\tdatafiles\x18\x10 \x03(\x0b\x32\x1f.tnel.birdsong.Session.DataFile\"H\n\x08\x42irdType\x12\x14\n\x10UNKNOWN_BIRDTYPE\x10\x00\x12\t\n\x05ZEBRA\x10\x01\x12\x0c\n\x08STARLING\x10\x02\x12\r\n\tBENGALESE\x10\x03\"4\n\x07\x42irdSex\x12\x13\n\x0fUNKNOWN_BIRDSEX\x10\x00\x12\x08\n\x04MALE\x10\x01\x12\n\n\x06\x46\x45MALE\x10\x02\"K\n\tCondition\x12\x15\n\x11UNKNOWN_CONDITION\x10\x00\x12\x0f\n\x0bHABITUATION\x10\x01\x12\x0b\n\x07\x43HRONIC\x10\x02\x12\t\n\x05\x41\x43UTE\x10\x03\x62\x06proto3')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'metadata_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _SESSION._serialized_start=34
+  _SESSION._serialized_end=1946
+  _SESSION_NEURALPROBE._serialized_start=601
+  _SESSION_NEURALPROBE._serialized_end=908
+  _SESSION_SENSOR._serialized_start=911
+  _SESSION_SENSOR._serialized_end=1124
+  _SESSION_STIMULUS._serialized_start=1127
+  _SESSION_STIMULUS._serialized_end=1302
+  _SESSION_DATAFILE._serialized_start=1305
+  _SESSION_DATAFILE._serialized_end=1457
+  _SESSION_ACQUISITION._serialized_start=1460
+  _SESSION_ACQUISITION._serialized_end=1741
+  _SESSION_BIRDTYPE._serialized_start=1743
+  _SESSION_BIRDTYPE._serialized_end=1815
+  _SESSION_BIRDSEX._serialized_start=1817
+  _SESSION_BIRDSEX._serialized_end=1869
+  _SESSION_CONDITION._serialized_start=1871
+  _SESSION_CONDITION._serialized_end=1946
 # @@protoc_insertion_point(module_scope)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""Read-only dictionary views of Birdsong Project messages
+
+MessageToDict(including_default_value_fields=True) converts a whole Session, acquisitions and all, even when
+the caller reads a handful of top-level keys. MessageProxy wraps a Session (or any submessage) in a
+collections.abc.Mapping with the keys and values of that dictionary (proto field names, every field, enums as
+names, floats as MessageToDict writes them), but converts a value only when it is accessed: submessages
+become MessageProxy objects and repeated fields RepeatedProxy sequences, themselves converted on access.
+
+A proxy reads the message it wraps every time, so it reflects later changes of the message. to_dict()
+returns the full plain dictionary (equal to session_to_dict for a Session) when one is really needed,
+e.g. for json.dump.
+"""
+
+import time
+from collections.abc import Mapping, Sequence
+from google.protobuf.descriptor import FieldDescriptor
+import metadata_generated
+from metadata_codegen import snake_case
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+_CONVERTERS = {}    # message descriptor -> {field name: value converter, None for values returned as is}
+
+
+def _value_converter(field):
+    """ Private helper: function converting one (non-repeated) value of a field as MessageToDict does """
+
+    if field.message_type is not None:
+        return MessageProxy
+    if field.enum_type is not None:
+        names = {v.number: v.name for v in field.enum_type.values}
+        return lambda value: names.get(value, value)
+    if field.cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+        return metadata_generated.json_float32
+    if field.cpp_type == FieldDescriptor.CPPTYPE_DOUBLE:
+        return metadata_generated.json_float64
+    if field.cpp_type in (FieldDescriptor.CPPTYPE_INT64, FieldDescriptor.CPPTYPE_UINT64):
+        return str
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        return metadata_generated.json_bytes
+    return None
+
+
+def _converters(desc):
+    """ Private helper: cached {field name: (repeated, converter)} of a message type """
+
+    converters = _CONVERTERS.get(desc)
+    if converters is None:
+        converters = {f.name: (f.label == f.LABEL_REPEATED, _value_converter(f)) for f in desc.fields}
+        _CONVERTERS[desc] = converters
+    return converters
+
+
+class RepeatedProxy(Sequence):
+
+    """ Read-only list view of a repeated field: elements are converted when they are accessed """
+
+    __slots__ = ('_values', '_convert')
+
+    def __init__(self, values, convert=None):
+
+        self._values = values
+        self._convert = convert
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._values)))]
+        value = self._values[index]
+        return value if self._convert is None else self._convert(value)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, RepeatedProxy)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'RepeatedProxy(%r)' % list(self)
+
+    def to_list(self):
+        """ Plain list of the converted elements (submessages as dictionaries) """
+
+        if self._convert is None:
+            return list(self._values)
+        if self._convert is MessageProxy:
+            return [_to_dict(value) for value in self._values]
+        return [self._convert(value) for value in self._values]
+
+
+class MessageProxy(Mapping):
+
+    """ Read-only dictionary view of a message, converting field values lazily
+
+    Parameters
+    ----------
+    msg : metadata_pb2.Session or one of its nested messages
+        Message to expose
+    """
+
+    __slots__ = ('_msg', '_fields')
+
+    def __init__(self, msg):
+
+        self._msg = msg
+        self._fields = _converters(msg.DESCRIPTOR)
+
+    @property
+    def message(self):
+        """ The wrapped message """
+
+        return self._msg
+
+    def __getitem__(self, key):
+        try:
+            repeated, convert = self._fields[key]
+        except (KeyError, TypeError):
+            raise KeyError(key) from None
+        value = getattr(self._msg, key)
+        if repeated:
+            return RepeatedProxy(value, convert)
+        return value if convert is None else convert(value)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return 'MessageProxy(%s)' % self._msg.DESCRIPTOR.full_name
+
+    def to_dict(self):
+        """ Plain dictionary of the whole message (as session_to_dict / MessageToDict with all fields) """
+
+        return _to_dict(self._msg)
+
+
+def _to_dict(msg):
+    """ Private helper: full conversion of a message by the generated exporters of metadata_generated """
+
+    return getattr(metadata_generated, snake_case(msg.DESCRIPTOR.name) + '_to_dict')(msg)
+
+
+def as_mapping(obj):
+    """ obj itself if it is already a mapping, else a MessageProxy of the message obj """
+
+    return obj if isinstance(obj, Mapping) else MessageProxy(obj)
+
+
+'''Benchmark'''
+
+def benchmark_proxy(keys=('bird_type', 'bird_sex', 'bird_uid', 'condition', 'box', 'details'), n_acquisitions=20,
+                    n_items=10, repeat=200):
+    """ Time to read a few top-level keys through MessageToDict and through a MessageProxy
+
+    Parameters
+    ----------
+    keys : sequence of str
+        Keys read from every conversion
+    n_acquisitions : int
+        Acquisitions of the benchmark session
+    n_items : int
+        Neural probes, sensors and stimuli per acquisition
+    repeat : int
+        Conversions timed
+
+    Returns
+    -------
+    dict
+        {method: seconds}
+    """
+
+    from metadata_API import session_to_dict
+    from metadata_fixtures import benchmark_session
+    sess = benchmark_session(n_acquisitions, n_items)
+
+    results = {}
+    for name, convert in [('MessageToDict', session_to_dict), ('MessageProxy', MessageProxy)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            doc = convert(sess)
+            [doc[key] for key in keys if key in doc]
+        results[name] = time.perf_counter() - start
+    return results
+
+
+if __name__ == '__main__':
+    for name, seconds in benchmark_proxy().items():
+        print('%-15s %8.3f s' % (name, seconds))
@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+
+"""Randomized round trips of Birdsong Project sessions through every export / import path
+
+Random sessions, biased towards edge cases (empty repeated fields and submessages, unicode and control
+characters in strings, float32 extremes and non-finite floats, int32 and 64 bit integer limits, enum
+numbers without a name), are sent through each path of the package and compared with the original:
+
+    pb                  SerializeToString / ParseFromString
+    json                session_to_dict (MessageToDict) / ParseDict, through json text
+    json generated      metadata_generated session_to_dict / fill_session, through json text
+    json stream         metadata_json_stream.parse_json_stream of the json text, in tiny chunks
+    jsonl               metadata_jsonl export_sessions_to_jsonl / iter_sessions_from_jsonl
+    archive             SessionArchiveWriter / iter_archive_sessions
+    views               metadata_views to_view (with a StringPool) / from_view
+    proxy               metadata_proxy.MessageProxy, compared with session_to_dict
+    dict agreement      metadata_generated session_to_dict, compared with session_to_dict
+    columnar            metadata_history columns, compared field by field
+    defaults ...        ProtobufMetadata.parse_metadata_from_json (plain, cache=True, stream=True) of the json
+                        file into a default-filled session, compared with ParseDict into the same session
+
+Sessions are compared on their deterministic serialization, so NaN compares equal to itself. Every path
+is timed over the whole batch, so one run reports correctness failures and performance regressions.
+The import paths must also all reject json with an enum name that does not exist, and agree with ParseDict
+on documents with null fields and quoted numbers.
+
+write_corpus stores sessions as .pb / .json pairs with an index, a fixture corpus that implementations in
+other languages can load and compare; check_corpus verifies a corpus against this package.
+
+Usage:
+    python metadata_roundtrip.py [-n SESSIONS] [--seed SEED]        round trips and timings
+    python metadata_roundtrip.py --write-corpus DIR [-n SESSIONS]   write a fixture corpus
+    python metadata_roundtrip.py --check-corpus DIR                 check a fixture corpus
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import struct
+import hashlib
+import argparse
+import tempfile
+import functools
+import numpy as np
+import metadata_pb2
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.json_format import ParseDict
+import metadata_generated
+from metadata_API import ProtobufMetadata, session_to_dict
+from metadata_archive import SessionArchiveWriter, iter_archive_sessions
+from metadata_codegen import fingerprint
+from metadata_history import COLUMNS, columns_from_sessions
+from metadata_intern import StringPool
+from metadata_json_stream import parse_json_stream
+from metadata_jsonl import export_sessions_to_jsonl, iter_sessions_from_jsonl
+from metadata_proxy import MessageProxy
+from metadata_time import parse_dates
+from metadata_views import to_view, from_view
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+_STRINGS = ['', 'z_m10g8_20', 'openephys', 'YYYY-MM-DD', '2021-03-10', 'ñandú', 'Γειά σου', '鳥の歌', '🐦 song',
+            'tab\tnew\nline\r', 'quote " backslash \\ slash /', 'line separator', '\x00leading nul', 'x' * 300,
+            ' padded ', '{"not": "json"}']
+# Not the largest float32: json_format.ParseDict rejects its shortest repr (3.4028235e+38) as out of range
+_FLOATS = [0.0, -0.0, 17.1, 1e-45, 1.1754943508222875e-38, 3.0e38, -3.0e38, 0.1, 1 / 3.0, 123456.789]
+_NON_FINITE = [float('inf'), float('-inf'), float('nan')]
+_INTS = [0, 1, 32, 384, -1, 2 ** 31 - 1, -2 ** 31]
+# Beyond 2 ** 53 json numbers lose precision: MessageToDict writes 64 bit integers as strings
+_INT64S = [0, -1, 2 ** 53 + 1, 2 ** 63 - 1, -2 ** 63, 1615387321754603000]
+_UINT64S = [0, 1, 2 ** 53 + 1, 2 ** 63, 2 ** 64 - 1]
+
+
+def _float32(value):
+    """ Private helper: value rounded to the nearest float32, as a float field stores it """
+
+    return struct.unpack('<f', struct.pack('<f', value))[0]
+
+
+def _random_value(rng, field):
+    """ Private helper: random value of a non-message field, biased towards edge cases """
+
+    if field.enum_type is not None:
+        numbers = [v.number for v in field.enum_type.values]
+        return rng.choice(numbers) if rng.random() < 0.9 else max(numbers) + rng.randint(1, 100)
+    if field.cpp_type == field.CPPTYPE_STRING:
+        return rng.choice(_STRINGS) if rng.random() < 0.7 else ''.join(
+            chr(rng.choice((rng.randint(32, 126), rng.randint(0xa0, 0x2fff), rng.randint(0x1f300, 0x1f6ff))))
+            for _ in range(rng.randint(1, 20)))
+    if field.cpp_type == field.CPPTYPE_BOOL:
+        return rng.random() < 0.5
+    if field.cpp_type == field.CPPTYPE_FLOAT:
+        if rng.random() < 0.05:
+            return rng.choice(_NON_FINITE)
+        return _float32(rng.choice(_FLOATS) if rng.random() < 0.5 else rng.uniform(-1e4, 1e4))
+    if field.cpp_type == field.CPPTYPE_INT32:
+        return rng.choice(_INTS) if rng.random() < 0.5 else rng.randint(-10 ** 6, 10 ** 6)
+    if field.cpp_type == field.CPPTYPE_INT64:
+        return rng.choice(_INT64S) if rng.random() < 0.5 else rng.randint(-2 ** 63, 2 ** 63 - 1)
+    if field.cpp_type == field.CPPTYPE_UINT64:
+        return rng.choice(_UINT64S) if rng.random() < 0.5 else rng.randint(0, 2 ** 64 - 1)
+    raise TypeError('No generator for field %s' % field.full_name)
+
+
+def _fill_random(rng, msg, depth=0):
+    """ Private helper: sets random values on about half of the fields of a message, recursively """
+
+    for field in msg.DESCRIPTOR.fields:
+        if rng.random() < 0.4:
+            continue                        # Left at its default
+        if field.message_type is not None:
+            container = getattr(msg, field.name)
+            for _ in range(rng.choice((0, 1, 1, 2, 3))):
+                _fill_random(rng, container.add(), depth + 1)
+        elif field.label == field.LABEL_REPEATED:
+            getattr(msg, field.name).extend(_random_value(rng, field) for _ in range(rng.choice((0, 1, 2, 5))))
+        else:
+            setattr(msg, field.name, _random_value(rng, field))
+    return msg
+
+
+def random_sessions(n_sessions, seed=0):
+    """ Random sessions covering edge cases of every field type (reproducible from the seed) """
+
+    rng = random.Random(seed)
+    return [_fill_random(rng, metadata_pb2.Session()) for _ in range(n_sessions)]
+
+
+def _canonical(sess):
+    return sess.SerializeToString(deterministic=True)
+
+
+'''Paths'''
+
+def _each(fn, items):
+    """ Private helper: [fn(x) for x in items], with the exception raised in place of a failing result """
+
+    out = []
+    for x in items:
+        try:
+            out.append(fn(x))
+        except Exception as e:
+            out.append(e)
+    return out
+
+
+def _parse_pb(data):
+    sess = metadata_pb2.Session()
+    sess.ParseFromString(data)
+    return sess
+
+
+def _json_texts(sessions):
+    return [json.dumps(session_to_dict(s)) for s in sessions]
+
+
+def _path_pb(sessions, workdir):
+    return _each(_parse_pb, [s.SerializeToString() for s in sessions])
+
+
+def _path_json(sessions, workdir):
+    return _each(lambda text: ParseDict(json.loads(text), metadata_pb2.Session()), _json_texts(sessions))
+
+
+def _path_json_generated(sessions, workdir):
+    texts = [json.dumps(metadata_generated.session_to_dict(s)) for s in sessions]
+    return _each(lambda text: metadata_generated.fill_session(json.loads(text), metadata_pb2.Session()), texts)
+
+
+def _path_json_stream(sessions, workdir):
+    return _each(lambda text: parse_json_stream(io.StringIO(text), chunk_size=7), _json_texts(sessions))
+
+
+def _path_jsonl(sessions, workdir):
+    path = os.path.join(workdir, 'roundtrip.jsonl')
+    export_sessions_to_jsonl(sessions, path)
+    return list(iter_sessions_from_jsonl(path))
+
+
+def _path_archive(sessions, workdir):
+    path = os.path.join(workdir, 'roundtrip.pb')
+    with SessionArchiveWriter(path, truncate=True) as writer:
+        for sess in sessions:
+            writer.append(sess)
+    return list(iter_archive_sessions(path))
+
+
+def _path_views(sessions, workdir):
+    pool = StringPool()
+    return _each(from_view, _each(lambda s: to_view(s, pool), sessions))
+
+
+def _path_proxy(sessions, workdir):
+    return _each(lambda s: MessageProxy(s).to_dict(), sessions)
+
+
+def _path_dict_agreement(sessions, workdir):
+    return _each(metadata_generated.session_to_dict, sessions)
+
+
+@functools.lru_cache(maxsize=1)
+def _default_bytes():
+    """ Private helper: serialized default-filled session of ProtobufMetadata (one clock reading per process) """
+
+    return ProtobufMetadata().sess.SerializeToString()
+
+
+def _parse_dict_into_defaults(doc):
+    """ Private helper: reference result, ParseDict of a json document into a default-filled session """
+
+    return ParseDict(doc, _parse_pb(_default_bytes()))
+
+
+def _expected_into_defaults(sess):
+    return _canonical(_parse_dict_into_defaults(json.loads(json.dumps(session_to_dict(sess)))))
+
+
+def _parse_file_into_defaults(path, **kwargs):
+    """ Private helper: parse_metadata_from_json of a file into a default-filled session """
+
+    pm = ProtobufMetadata()
+    pm.sess.ParseFromString(_default_bytes())
+    pm.parse_metadata_from_json(path, **kwargs)
+    return pm.sess
+
+
+def _json_files(sessions, workdir):
+    """ Private helper: writes the json text of every session to its own file, returns the paths """
+
+    paths = []
+    for i, text in enumerate(_json_texts(sessions)):
+        paths.append(os.path.join(workdir, 'defaults_%d.json' % i))
+        with open(paths[-1], 'w') as f:
+            f.write(text)
+    return paths
+
+
+def _path_into_defaults(**kwargs):
+    return lambda sessions, workdir: _each(lambda path: _parse_file_into_defaults(path, **kwargs),
+                                           _json_files(sessions, workdir))
+
+
+def _path_columnar(sessions, workdir):
+    columns = columns_from_sessions(sessions, [''] * len(sessions), [-1] * len(sessions))
+    return [{name: columns[name][i] for name in COLUMNS} for i in range(len(sessions))]
+
+
+def _expected_columns(sess):
+    """ Private helper: values of the columns of a session, as numpy stores them """
+
+    expected = {}
+    for name, dtype in COLUMNS.items():
+        value = getattr(sess, name)
+        if dtype.kind == 'M':
+            expected[name] = parse_dates([value])[0]
+        elif dtype.kind == 'U':
+            expected[name] = value.rstrip('\x00')       # numpy strings cannot end with NUL characters
+        else:
+            expected[name] = np.array(value, dtype=dtype)[()]
+    return expected
+
+
+def _same_columns(a, b):
+    return all((a[k] == b[k]) or (a[k] != a[k] and b[k] != b[k]) or (np.isnat(a[k]) and np.isnat(b[k]))
+               if isinstance(a[k], (np.floating, np.datetime64)) else a[k] == b[k] for k in a)
+
+
+# name -> (run over a batch, expected value of one session, comparison)
+PATHS = {
+    'pb': (_path_pb, _canonical, None),
+    'json': (_path_json, _canonical, None),
+    'json generated': (_path_json_generated, _canonical, None),
+    'json stream': (_path_json_stream, _canonical, None),
+    'jsonl': (_path_jsonl, _canonical, None),
+    'archive': (_path_archive, _canonical, None),
+    'views': (_path_views, _canonical, None),
+    'proxy': (_path_proxy, session_to_dict, None),
+    'dict agreement': (_path_dict_agreement, session_to_dict, None),
+    'columnar': (_path_columnar, _expected_columns, _same_columns),
+    'defaults json': (_path_into_defaults(), _expected_into_defaults, None),
+    'defaults json cache': (_path_into_defaults(cache=True), _expected_into_defaults, None),
+    'defaults json stream': (_path_into_defaults(stream=True), _expected_into_defaults, None),
+}
+
+
+def _rejects(parse, doc):
+    """ Private helper: True if parse raises on a document """
+
+    try:
+        parse(doc)
+    except Exception:
+        return True
+    return False
+
+
+# name -> parse of a json document that must raise on an enum name that does not exist
+REJECTING_PATHS = {
+    'ParseDict': lambda doc: ParseDict(doc, metadata_pb2.Session()),
+    'fill_session': lambda doc: metadata_generated.fill_session(doc, metadata_pb2.Session()),
+    'validate_session': lambda doc: metadata_generated.validate_session(doc) and 1 / 0,
+    'parse_json_stream': lambda doc: parse_json_stream(io.StringIO(json.dumps(doc))),
+}
+
+
+_NUMBER_TYPES = frozenset(getattr(FieldDescriptor, name) for name in
+                          ('TYPE_INT32', 'TYPE_INT64', 'TYPE_UINT32', 'TYPE_UINT64', 'TYPE_SINT32', 'TYPE_SINT64',
+                           'TYPE_FIXED32', 'TYPE_FIXED64', 'TYPE_SFIXED32', 'TYPE_SFIXED64', 'TYPE_FLOAT',
+                           'TYPE_DOUBLE'))
+
+
+def _edge_document(rng, desc, doc):
+    """ Private helper: copy of a json document with some fields null and some numbers quoted """
+
+    out = {}
+    for name, value in doc.items():
+        field = desc.fields_by_name.get(name)
+        if field is None or rng.random() < 0.2:
+            out[name] = None if field is not None else value
+        elif field.message_type is not None:
+            out[name] = ([_edge_document(rng, field.message_type, v) for v in value]
+                         if field.label == field.LABEL_REPEATED else _edge_document(rng, field.message_type, value))
+        elif field.type in _NUMBER_TYPES and rng.random() < 0.5:
+            quote = lambda v: v if isinstance(v, str) else repr(v)
+            out[name] = [quote(v) for v in value] if field.label == field.LABEL_REPEATED else quote(value)
+        else:
+            out[name] = value
+    return out
+
+
+def _into_defaults(parse):
+    """ Private helper: parse of a document into a default-filled session, through a json file """
+
+    def run(doc):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'edge.json')
+            with open(path, 'w') as f:
+                json.dump(doc, f)
+            return parse(path)
+    return run
+
+
+# name -> parse of a json document (null fields, quoted numbers) into a default-filled session, which must
+# give the same session as ParseDict
+EDGE_DOCUMENT_PATHS = {
+    'parse_json_cached': _into_defaults(lambda path: _parse_file_into_defaults(path, cache=True)),
+    'parse_json_stream': _into_defaults(lambda path: _parse_file_into_defaults(path, stream=True)),
+}
+
+
+def run_roundtrips(n_sessions=500, seed=0, paths=None):
+    """ Round trip random sessions through every path
+
+    Parameters
+    ----------
+    n_sessions : int
+        Sessions generated
+    seed : int
+        Seed of the generator (failures are reproducible from it)
+    paths : list of str
+        Names of PATHS to run (all when None)
+
+    Returns
+    -------
+    dict
+        {path: {'seconds': time of the batch, 'failures': [(session index, problem)]}}, plus one entry per
+        REJECTING_PATHS name (prefixed with 'reject unknown enum: ') and per EDGE_DOCUMENT_PATHS name
+        (prefixed with 'null and quoted numbers: ')
+    """
+
+    sessions = random_sessions(n_sessions, seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in paths or PATHS:
+            run, expected, same = PATHS[name]
+            start = time.perf_counter()
+            try:
+                outputs = run(sessions, workdir)
+                failures = []
+            except Exception as e:
+                outputs, failures = [], [(None, '%s: %s' % (type(e).__name__, e))]
+            seconds = time.perf_counter() - start
+            if not failures and len(outputs) != len(sessions):
+                failures.append((None, '%d sessions out of %d' % (len(outputs), len(sessions))))
+            for i, (sess, output) in enumerate(zip(sessions, outputs)):
+                if isinstance(output, Exception):
+                    failures.append((i, '%s: %s' % (type(output).__name__, output)))
+                    continue
+                want = expected(sess)
+                got = _canonical(output) if isinstance(output, metadata_pb2.Session) else output
+                if not (same(want, got) if same is not None else want == got):
+                    failures.append((i, 'differs after the round trip'))
+            results[name] = {'seconds': seconds, 'failures': failures}
+
+    enum_field = next(f for f in metadata_pb2.Session.DESCRIPTOR.fields if f.enum_type is not None)
+    for name, parse in REJECTING_PATHS.items():
+        failures = []
+        for i, sess in enumerate(sessions[:50]):
+            doc = dict(session_to_dict(sess), **{enum_field.name: 'NOT_A_%s' % enum_field.enum_type.name})
+            if not _rejects(parse, doc):
+                failures.append((i, 'accepted %s=%r' % (enum_field.name, doc[enum_field.name])))
+        results['reject unknown enum: ' + name] = {'seconds': 0.0, 'failures': failures}
+
+    rng = random.Random(seed)
+    docs = [_edge_document(rng, metadata_pb2.Session.DESCRIPTOR, session_to_dict(sess)) for sess in sessions[:50]]
+    for name, parse in EDGE_DOCUMENT_PATHS.items():
+        failures = []
+        start = time.perf_counter()
+        for i, doc in enumerate(docs):
+            want, got = _each(_parse_dict_into_defaults, [doc]) + _each(parse, [doc])
+            if isinstance(want, Exception) != isinstance(got, Exception):
+                failures.append((i, 'ParseDict %s, %s %s' % ('raised' if isinstance(want, Exception) else 'passed', name,
+                                                            'raised' if isinstance(got, Exception) else 'passed')))
+            elif not isinstance(want, Exception) and _canonical(want) != _canonical(got):
+                failures.append((i, 'differs from ParseDict'))
+        results['null and quoted numbers: ' + name] = {'seconds': time.perf_counter() - start, 'failures': failures}
+    return results
+
+
+'''Fixture corpus'''
+
+CORPUS_INDEX = 'corpus.json'
+
+
+def write_corpus(directory, n_sessions=100, seed=0):
+    """ Write random sessions as a fixture corpus: NNNN.pb, NNNN.json and corpus.json (index)
+
+    Returns
+    -------
+    dict
+        The index: {'seed', 'proto_fingerprint', 'sessions': [{'pb', 'json', 'sha256'}]}
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    index = {'seed': seed, 'proto_fingerprint': fingerprint(), 'sessions': []}
+    for i, sess in enumerate(random_sessions(n_sessions, seed)):
+        data = _canonical(sess)
+        stem = '%04d' % i
+        with open(os.path.join(directory, stem + '.pb'), 'wb') as f:
+            f.write(data)
+        with open(os.path.join(directory, stem + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(session_to_dict(sess), f, indent=1, ensure_ascii=False)
+        index['sessions'].append({'pb': stem + '.pb', 'json': stem + '.json',
+                                  'sha256': hashlib.sha256(data).hexdigest()})
+    with open(os.path.join(directory, CORPUS_INDEX), 'w') as f:
+        json.dump(index, f, indent=1)
+    return index
+
+
+def check_corpus(directory):
+    """ Check that the .pb and .json of every session of a corpus decode to the same session
+
+    Returns
+    -------
+    list of (str, str)
+        (file, problem) for every mismatch (empty when the corpus agrees with this package)
+    """
+
+    with open(os.path.join(directory, CORPUS_INDEX)) as f:
+        index = json.load(f)
+    problems = []
+    if index['proto_fingerprint'] != fingerprint():
+        problems.append((CORPUS_INDEX, 'written for another metadata.proto'))
+    for entry in index['sessions']:
+        with open(os.path.join(directory, entry['pb']), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != entry['sha256']:
+            problems.append((entry['pb'], 'sha256 mismatch'))
+        sess = metadata_pb2.Session()
+        sess.ParseFromString(data)
+        if _canonical(sess) != data:
+            problems.append((entry['pb'], 'does not re-serialize to the same bytes'))
+        with open(os.path.join(directory, entry['json']), encoding='utf-8') as f:
+            doc = json.load(f)
+        if _canonical(ParseDict(doc, metadata_pb2.Session())) != data:
+            problems.append((entry['json'], 'differs from ' + entry['pb']))
+        if session_to_dict(sess) != doc:
+            problems.append((entry['json'], 'is not the json export of ' + entry['pb']))
+    return problems
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Round trip random sessions through every export / import path')
+    parser.add_argument('-n', '--sessions', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--write-corpus', metavar='DIR', default=None)
+    parser.add_argument('--check-corpus', metavar='DIR', default=None)
+    args = parser.parse_args(argv)
+
+    if args.write_corpus is not None:
+        index = write_corpus(args.write_corpus, args.sessions, args.seed)
+        print('%d sessions written to %s' % (len(index['sessions']), args.write_corpus))
+        return 0
+    if args.check_corpus is not None:
+        problems = check_corpus(args.check_corpus)
+        for path, problem in problems:
+            print('%s: %s' % (path, problem))
+        print('%d problems' % len(problems))
+        return 1 if problems else 0
+
+    results = run_roundtrips(args.sessions, args.seed)
+    failed = 0
+    print('%d random sessions, seed %d' % (args.sessions, args.seed))
+    for name, result in results.items():
+        failures = result['failures']
+        failed += len(failures)
+        print('    %-46s %8.3f s   %s' % (name, result['seconds'], 'ok' if not failures else '%d FAILED' % len(failures)))
+        for i, problem in failures[:5]:
+            print('        session %s: %s' % (i, problem))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
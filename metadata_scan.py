@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+"""Parallel scans of Birdsong Project session archives
+
+Whole-archive operations are bound by ParseFromString. scan() splits archives into contiguous ranges of
+records (by record offset, from the record headers only) and parses every range in a worker process. The
+per-session results never travel back as pickled objects:
+
+    columns mode    fn(sess) returns a tuple of values for the columns of a numpy dtype; every worker
+                    writes its rows straight into one multiprocessing.shared_memory block allocated by the
+                    caller, so the result is a structured array in archive record order. String columns
+                    without a size ('U', 'S') are sized from the data: their values are returned by the
+                    workers instead, and the column is as wide as its longest value
+    reduce mode     fn(sess) returns a value folded with combine(accumulator, value) inside the worker;
+                    only the per-range accumulators (small) are returned and combined by the caller
+
+fn and combine must be picklable (module-level functions). With paths, sessions are parsed through
+metadata_partial.parse_masked, so fields outside the mask (e.g. all the acquisitions) are never decoded.
+
+Usage:
+    python metadata_scan.py ARCHIVE [ARCHIVE ...] [--workers N]     scan of the header columns of archives
+"""
+
+import os
+import sys
+import copy
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import metadata_pb2
+from metadata_archive import archive_record_offsets, iter_archive_records
+from metadata_partial import parse_masked
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+SPLITS_PER_WORKER = 4       # More ranges than workers, so that uneven ranges balance out
+
+
+def split_archives(archives, n_splits):
+    """ Contiguous ranges of records of archives, of about the same number of records
+
+    Parameters
+    ----------
+    archives : list of str
+        Session archives
+    n_splits : int
+        Wanted number of ranges (a range never spans two archives)
+
+    Returns
+    -------
+    (list of (str, int, int, int, int), int)
+        (archive, start offset, stop offset, index of the first record in the scan, records) of every range,
+        and the total number of records
+    """
+
+    offsets = {}
+    sizes = {}
+    for archive in archives:
+        offsets[archive] = archive_record_offsets(archive)
+        sizes[archive] = os.path.getsize(archive)
+    total = sum(len(o) for o in offsets.values())
+    per_split = max(1, -(-total // max(1, n_splits)))
+
+    splits = []
+    row = 0
+    for archive in archives:
+        records = offsets[archive]
+        for i in range(0, len(records), per_split):
+            j = min(i + per_split, len(records))
+            stop = records[j] if j < len(records) else sizes[archive]
+            splits.append((archive, records[i], stop, row, j - i))
+            row += j - i
+    return splits, total
+
+
+def _parse(payload, paths):
+    """ Private helper: Session of a record payload (only the masked fields when paths is not None) """
+
+    if paths is not None:
+        return parse_masked(payload, paths)
+    sess = metadata_pb2.Session()
+    sess.ParseFromString(payload)
+    return sess
+
+
+def _split_columns(dtype):
+    """ Private helper: (dtype of the fixed-size columns, their indices, indices of the strings sized from the data) """
+
+    fixed, variable = [], []
+    for i, name in enumerate(dtype.names):
+        column = dtype.fields[name][0]
+        (variable if column.kind in 'SU' and column.itemsize == 0 else fixed).append(i)
+    return np.dtype([(dtype.names[i], dtype.fields[dtype.names[i]][0]) for i in fixed]), fixed, variable
+
+
+def _scan_columns(split, fn, paths, shm_name, dtype, total):
+    """ Private helper run in worker processes: writes the rows of a range into the shared result
+
+    Returns the values of the columns sized from the data, which are not in the shared result.
+    """
+
+    fixed_dtype, fixed, variable = _split_columns(dtype)
+    shm = shared_memory.SharedMemory(name=shm_name)     # Workers share the caller's resource tracker
+    try:
+        out = np.ndarray((total,), dtype=fixed_dtype, buffer=shm.buf)
+        strings = _fill_rows(out, split, fn, paths, fixed, variable)
+        del out                 # Releases the buffer so that the block can be closed
+    finally:
+        shm.close()
+    return strings
+
+
+def _fill_rows(out, split, fn, paths, fixed, variable):
+    """ Private helper: out[row:row + count] = fn of the sessions of a range
+
+    out only has the fixed columns when some are sized from the data (variable): their values are returned,
+    as a list of tuples.
+    """
+
+    archive, start, stop, row, count = split
+    strings = []
+    for i, (_, payload) in enumerate(iter_archive_records(archive, start, stop)):
+        values = fn(_parse(payload, paths))
+        if variable:
+            strings.append(tuple(values[j] for j in variable))
+            values = tuple(values[j] for j in fixed)
+        out[row + i] = values
+    return strings
+
+
+def _sized_result(dtype, out, strings):
+    """ Private helper: structured array of the fixed columns of out and the strings sized from the data """
+
+    fixed_dtype, fixed, variable = _split_columns(dtype)
+    columns = {name: out[name] for name in fixed_dtype.names}
+    for k, i in enumerate(variable):
+        columns[dtype.names[i]] = np.array([values[k] for values in strings], dtype=dtype.fields[dtype.names[i]][0])
+    result = np.empty(len(out), dtype=[(name, columns[name].dtype) for name in dtype.names])
+    for name in dtype.names:
+        result[name] = columns[name]
+    return result
+
+
+def _scan_reduce(split, fn, combine, initial, paths):
+    """ Private helper run in worker processes: fold of fn over the sessions of a range """
+
+    archive, start, stop, _, _ = split
+    accumulator = copy.deepcopy(initial)
+    for _, payload in iter_archive_records(archive, start, stop):
+        accumulator = combine(accumulator, fn(_parse(payload, paths)))
+    return accumulator
+
+
+def scan(archives, fn, columns=None, combine=None, initial=None, paths=None, workers=None):
+    """ Apply fn to every session of archives in worker processes
+
+    Parameters
+    ----------
+    archives : str or list of str
+        Session archives
+    fn : callable
+        Module-level function of a metadata_pb2.Session
+    columns : numpy dtype specification
+        Columns mode: fields of the result, e.g. [('bird_uid', 'U'), ('condition', 'i1')]; fn returns
+        one tuple of values per session. Strings without a size ('U', 'S') are as wide as their longest value
+    combine : callable
+        Reduce mode (when columns is None): module-level function (accumulator, fn(sess)) -> accumulator
+    initial : object
+        Initial accumulator of every range in reduce mode (copied, so combine may update it in place)
+    paths : list of str
+        Field mask of the parsed sessions (see metadata_partial.parse_masked). None parses every field
+    workers : int
+        Worker processes (None uses every CPU, 1 scans in the calling process)
+
+    Returns
+    -------
+    numpy.ndarray or object
+        Columns mode: structured array with one row per session, in archive record order (the order of
+        archive_record_offsets over the archives). Reduce mode: the combined accumulator of all the ranges
+    """
+
+    archives = [archives] if isinstance(archives, str) else list(archives)
+    if columns is None and combine is None:
+        raise ValueError('scan needs columns (one row per session) or combine (reduction)')
+    workers = workers or os.cpu_count()
+    splits, total = split_archives(archives, workers * SPLITS_PER_WORKER if workers > 1 else 1)
+
+    if columns is None:
+        if workers == 1:
+            partials = [_scan_reduce(split, fn, combine, initial, paths) for split in splits]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_scan_reduce, split, fn, combine, initial, paths) for split in splits]
+                partials = [future.result() for future in futures]
+        accumulator = copy.deepcopy(initial)
+        for partial in partials:
+            accumulator = combine(accumulator, partial)
+        return accumulator
+
+    dtype = np.dtype(columns)
+    fixed_dtype, fixed, variable = _split_columns(dtype)
+    strings = []
+    if workers == 1 or total == 0:
+        out = np.zeros(total, dtype=fixed_dtype)
+        for split in splits:
+            strings.extend(_fill_rows(out, split, fn, paths, fixed, variable))
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, total * fixed_dtype.itemsize))
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_scan_columns, split, fn, paths, shm.name, dtype, total) for split in splits]
+                for future in futures:
+                    strings.extend(future.result())
+            out = np.ndarray((total,), dtype=fixed_dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+    return _sized_result(dtype, out, strings) if variable else out
+
+
+'''Common scans'''
+
+HEADER_COLUMNS = [('bird_uid', 'U'), ('date', 'U10'), ('condition', 'i1'), ('bird_type', 'i1'),
+                  ('weight_grams', 'f4'), ('box', 'U')]
+HEADER_PATHS = [name for name, _ in HEADER_COLUMNS]
+
+
+def header_row(sess):
+    """ Row of HEADER_COLUMNS of a session """
+
+    return sess.bird_uid, sess.date, sess.condition, sess.bird_type, sess.weight_grams, sess.box
+
+
+def count_by_condition(sess):
+    """ {condition: 1} of a session: a reduce-mode fn for combine=merge_counts, initial={} """
+
+    return {sess.condition: 1}
+
+
+def merge_counts(a, b):
+    """ Sum of two {key: count} dictionaries (a is updated in place) """
+
+    for key, n in b.items():
+        a[key] = a.get(key, 0) + n
+    return a
+
+
+'''Benchmark'''
+
+def benchmark_scan(archive='/tmp/metadata_scan_benchmark.pb', n_sessions=20000, workers=None):
+    """ Time of a header scan of a synthetic archive with 1 worker and with every CPU
+
+    Returns
+    -------
+    dict
+        {workers: seconds}
+    """
+
+    from metadata_archive import SessionArchiveWriter
+    from metadata_fixtures import realistic_sessions
+    with SessionArchiveWriter(archive, truncate=True) as writer:
+        for payload in realistic_sessions(n_sessions):
+            writer.append(payload)
+
+    results = {}
+    for n in sorted({1, workers or os.cpu_count()}):
+        start = time.perf_counter()
+        scan(archive, header_row, columns=HEADER_COLUMNS, paths=HEADER_PATHS, workers=n)
+        results[n] = time.perf_counter() - start
+    return results
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Parallel scan of the header fields of session archives')
+    parser.add_argument('archives', nargs='*', help='session archives (a synthetic benchmark when none)')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if not args.archives:
+        for n, seconds in benchmark_scan(workers=args.workers).items():
+            print('%3d workers %8.2f s' % (n, seconds))
+        return
+    start = time.perf_counter()
+    rows = scan(args.archives, header_row, columns=HEADER_COLUMNS, paths=HEADER_PATHS, workers=args.workers)
+    print('%d sessions in %.2f s' % (len(rows), time.perf_counter() - start))
+    for condition, n in zip(*np.unique(rows['condition'], return_counts=True)):
+        print('    %-18s %d' % (metadata_pb2.Session.Condition.Name(int(condition)), n))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
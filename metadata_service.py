@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+
+"""Local HTTP service serving Birdsong Project session metadata
+
+Sessions are indexed once from directories of `.pb`/`.json` files and/or session archives, and served
+over a localhost socket so that several processes share one parsed copy:
+
+    GET  /sessions/<sess_uid>                           one session
+    POST /sessions/batch_get   {"sess_uids": [...]}     several sessions, streamed
+    GET  /birds/<bird_uid>/sessions?start=&end=         sessions of a bird in a date range, streamed
+    GET  /sessions?start=&end=                          sessions of every bird in a date range, streamed
+
+Sessions are returned as JSON (the same dictionaries written by export_metadata_to_json), streamed results
+as JSON lines. Add `?format=pb` to receive serialized Session messages instead, streamed results being
+framed by a little endian uint32 length
+(0xFFFFFFFF for an unknown sess_uid). Only the Python standard library is used.
+
+Usage:
+    python metadata_service.py SOURCE [SOURCE ...] [--port 8765]
+"""
+
+import os
+import json
+import struct
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, parse_qs, quote, unquote, urlencode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bisect import bisect_left, bisect_right, insort
+import metadata_pb2
+from google.protobuf.json_format import ParseError
+from google.protobuf.message import DecodeError
+from metadata_API import load_session, session_to_dict
+from metadata_cache import SessionLRU
+from metadata_archive import is_archive, iter_archive_records, read_archive_session
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+_FRAME = struct.Struct('<I')
+_MISSING = 0xFFFFFFFF        # Frame length marking an unknown sess_uid in a pb stream
+
+
+class SessionStore:
+
+    """ Index of sessions by sess_uid, bird_uid and date, backed by files and an LRU cache of parsed messages
+
+    Parameters
+    ----------
+    sources : list of str
+        Directories of metadata files (.pb / .json) and/or session archives
+    cache_bytes : int
+        Size bound of the parsed session cache, in serialized bytes
+
+    Attributes
+    ----------
+    errors : list of (str, str)
+        (path, error) of the files of source directories that are not sessions (e.g. a manifest or a
+        checkpoint .json); they are skipped
+    """
+
+    def __init__(self, sources=(), cache_bytes=256 * 1024 * 1024):
+
+        self.cache = SessionLRU(cache_bytes)
+        self._locations = {}    # sess_uid -> (path, archive offset or None)
+        self._by_bird = {}      # bird_uid -> sorted [(date, time, sess_uid)]
+        self._by_date = []      # sorted [(date, time, sess_uid)]
+        self._lock = threading.Lock()
+        self.errors = []
+        for source in sources:
+            self.add_source(source)
+
+    def _index(self, sess, path, offset):
+        """ Private method: registers a parsed session in the indexes """
+
+        key = (sess.date, sess.time, sess.sess_uid)
+        with self._lock:
+            if sess.sess_uid in self._locations:
+                return
+            self._locations[sess.sess_uid] = (path, offset)
+            insort(self._by_bird.setdefault(sess.bird_uid, []), key)
+            insort(self._by_date, key)
+
+    def add_source(self, source):
+        """ Index every session of a directory, metadata file or session archive
+
+        Parameters
+        ----------
+        source : str
+            Directory of metadata files, single metadata file or session archive
+        """
+
+        if os.path.isdir(source):
+            names = sorted(n for n in os.listdir(source) if os.path.isfile(os.path.join(source, n)))
+            stems = set(os.path.splitext(n)[0] for n in names if n.endswith('.pb'))
+            for name in names:
+                path = os.path.join(source, name)
+                if name.endswith('.json') and os.path.splitext(name)[0] in stems:
+                    continue    # The .pb twin carries the same session
+                if is_archive(path):
+                    self.add_source(path)
+                elif name.endswith(('.pb', '.json')):
+                    try:
+                        sess = load_session(path)
+                    except (ParseError, DecodeError, ValueError) as e:
+                        self.errors.append((path, '%s: %s' % (type(e).__name__, e)))
+                        continue
+                    self._index(sess, path, None)
+        elif is_archive(source):
+            for offset, payload in iter_archive_records(source):
+                sess = metadata_pb2.Session()
+                sess.ParseFromString(payload)
+                self._index(sess, source, offset)
+        else:
+            self._index(load_session(source), source, None)
+
+    def get(self, sess_uid):
+        """ Return the session with a given sess_uid, or None. The returned message is shared: do not modify it """
+
+        sess = self.cache.get(sess_uid)
+        if sess is not None:
+            return sess
+        location = self._locations.get(sess_uid)
+        if location is None:
+            return None
+        path, offset = location
+        sess = load_session(path) if offset is None else read_archive_session(path, offset)
+        self.cache.put(sess_uid, sess)
+        return sess
+
+    def get_many(self, sess_uids):
+        """ Yield (sess_uid, Session or None) for every requested sess_uid """
+
+        for sess_uid in sess_uids:
+            yield sess_uid, self.get(sess_uid)
+
+    def find(self, bird_uid=None, start=None, end=None):
+        """ List the sess_uids of a bird (or of every bird) whose date lies in [start, end], sorted by date and time
+
+        Parameters
+        ----------
+        bird_uid : str
+            Bird to look up. None for all birds
+        start : str
+            First date, e.g. 2021-03-10 (inclusive). None for no lower bound
+        end : str
+            Last date, e.g. 2021-03-31 (inclusive). None for no upper bound
+        """
+
+        with self._lock:
+            keys = self._by_date if bird_uid is None else self._by_bird.get(bird_uid, [])
+            lo = 0 if start is None else bisect_left(keys, (start,))
+            hi = len(keys) if end is None else bisect_right(keys, (end, '\U0010ffff'))
+            return [key[2] for key in keys[lo:hi]]
+
+    def __len__(self):
+        return len(self._locations)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    """ Private request handler, the store is reached through self.server.store """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({'error': message}).encode(), 'application/json')
+
+    def _stream(self, sessions, binary):
+        """ Private method: streams sessions with chunked transfer encoding, one chunk per session """
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream' if binary else 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for sess in sessions:
+            if sess is None:
+                data = _FRAME.pack(_MISSING) if binary else b'null\n'
+            elif binary:
+                payload = sess.SerializeToString()
+                data = _FRAME.pack(len(payload)) + payload
+            else:
+                data = json.dumps(session_to_dict(sess)).encode() + b'\n'
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        binary = query.get('format', ['json'])[0] == 'pb'
+        start = query.get('start', [None])[0]
+        end = query.get('end', [None])[0]
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        store = self.server.store
+
+        if len(parts) == 2 and parts[0] == 'sessions':
+            sess = store.get(parts[1])
+            if sess is None:
+                return self._error(404, 'Unknown sess_uid %s' % parts[1])
+            if binary:
+                return self._send(200, sess.SerializeToString(), 'application/octet-stream')
+            return self._send(200, json.dumps(session_to_dict(sess)).encode(), 'application/json')
+        if len(parts) == 1 and parts[0] == 'sessions':
+            uids = store.find(None, start, end)
+        elif len(parts) == 3 and parts[0] == 'birds' and parts[2] == 'sessions':
+            uids = store.find(parts[1], start, end)
+        else:
+            return self._error(404, 'Unknown endpoint %s' % url.path)
+        self._stream((sess for _, sess in store.get_many(uids)), binary)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        binary = parse_qs(url.query).get('format', ['json'])[0] == 'pb'
+        if url.path.rstrip('/') != '/sessions/batch_get':
+            return self._error(404, 'Unknown endpoint %s' % url.path)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            uids = list(body['sess_uids'])
+        except (ValueError, KeyError, TypeError):
+            return self._error(400, 'Expected a JSON body {"sess_uids": [...]}')
+        self._stream((sess for _, sess in self.server.store.get_many(uids)), binary)
+
+
+class MetadataServer:
+
+    """ Serve a SessionStore over HTTP on a local socket
+
+    Parameters
+    ----------
+    store : SessionStore
+        The indexed sessions to serve
+    host : str
+        Interface to bind, localhost by default
+    port : int
+        Port to bind, 0 picks a free port (see self.address)
+    verbose : bool
+        Log every request to stderr
+    """
+
+    def __init__(self, store, host='127.0.0.1', port=0, verbose=False):
+
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.store = store
+        self.httpd.verbose = verbose
+        self.address = self.httpd.server_address
+        self._thread = None
+
+    def start(self):
+        """ Serve requests from a background thread (useful to run the service in-process) """
+
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """ Serve requests from the calling thread until stop() is called """
+
+        self.httpd.serve_forever()
+
+    def stop(self):
+        """ Stop serving and close the socket """
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class MetadataClient:
+
+    """ Client of a MetadataServer, returning parsed Session messages
+
+    Parameters
+    ----------
+    host : str
+        Host of the service
+    port : int
+        Port of the service
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, timeout=60):
+
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        conn.request(method, path, body=body, headers=headers)
+        return conn, conn.getresponse()
+
+    def _iter_frames(self, method, path, body=None):
+        """ Private method: yields the sessions of a streamed, pb formatted response """
+
+        conn, resp = self._request(method, path, body)
+        try:
+            if resp.status != 200:
+                raise KeyError(json.loads(resp.read())['error'])
+            while True:
+                header = resp.read(_FRAME.size)
+                if len(header) < _FRAME.size:
+                    break
+                length, = _FRAME.unpack(header)
+                if length == _MISSING:
+                    yield None
+                    continue
+                sess = metadata_pb2.Session()
+                sess.ParseFromString(resp.read(length))
+                yield sess
+        finally:
+            conn.close()
+
+    def get_session(self, sess_uid):
+        """ Fetch one session. Raises KeyError if the sess_uid is unknown """
+
+        conn, resp = self._request('GET', '/sessions/%s?format=pb' % quote(sess_uid, safe=''))
+        try:
+            data = resp.read()
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise KeyError(sess_uid)
+        sess = metadata_pb2.Session()
+        sess.ParseFromString(data)
+        return sess
+
+    def batch_get(self, sess_uids):
+        """ Fetch several sessions in one request. Yields one Session (None if unknown) per sess_uid, in order """
+
+        return self._iter_frames('POST', '/sessions/batch_get?format=pb', json.dumps({'sess_uids': list(sess_uids)}))
+
+    def find_sessions(self, bird_uid=None, start=None, end=None):
+        """ Stream the sessions of a bird (or of every bird) whose date lies in [start, end] """
+
+        query = {'format': 'pb'}
+        if start is not None:
+            query['start'] = start
+        if end is not None:
+            query['end'] = end
+        path = '/sessions' if bird_uid is None else '/birds/%s/sessions' % quote(bird_uid, safe='')
+        return self._iter_frames('GET', path + '?' + urlencode(query))
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Serve session metadata over a local HTTP socket')
+    parser.add_argument('sources', nargs='+', help='directories of metadata files and/or session archives')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-mb', type=int, default=256, help='parsed session cache size (MB)')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    store = SessionStore(args.sources, cache_bytes=args.cache_mb * 1024 * 1024)
+    server = MetadataServer(store, host=args.host, port=args.port, verbose=args.verbose)
+    print('Serving %d sessions on http://%s:%d' % ((len(store),) + server.address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
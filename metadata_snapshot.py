@@ -0,0 +1,579 @@
+#!/usr/bin/env python
+
+"""Memory-mapped snapshots of indexed Birdsong Project sessions, for fast cold starts
+
+A SessionStore (metadata_service) parses every session of its sources before it can answer a query. A
+snapshot is one binary file holding the serialized sessions together with their sess_uid, bird_uid and
+date indexes. Snapshot maps it read-only and wraps its tables in numpy arrays, so opening it costs the same
+whatever the number of sessions; lookups are binary searches over the mapped indexes and only the
+requested sessions are parsed.
+
+    build_snapshot('/data/sessions.snapshot', ['/data/archive.pb', '/data/sessions'])
+    snapshot = Snapshot('/data/sessions.snapshot')
+    snapshot.find('z_m10g8_20', '2021-03-01', '2021-03-31')
+    snapshot.get(sess_uid)
+
+File layout (little-endian, sections aligned to 8 bytes):
+
+    header      magic 'BSMSNAP1', version, metadata.proto fingerprint, number of sessions, and the
+                (offset, length) of every section
+    table       one TABLE_DTYPE row per session: payload offset / length, source file and archive offset,
+                and the (offset, length) in strings of its sess_uid, bird_uid, date and time
+    by_uid      int32 row numbers sorted by sess_uid
+    by_bird     int32 row numbers sorted by (bird_uid, date, time, sess_uid)
+    by_date     int32 row numbers sorted by (date, time, sess_uid)
+    strings     utf-8 keys
+    payloads    serialized sessions
+    sources     json: the sources and the signature of every file read (see refresh_snapshot)
+
+Snapshots are immutable: refresh_snapshot writes a new file (renamed over the old one) but only parses the
+files added or modified since the snapshot, and only the records appended to archives. As in SessionStore,
+the first session of a sess_uid wins; the later ones are not stored, so the files holding them are read
+again on every refresh.
+
+Usage:
+    python metadata_snapshot.py build SNAPSHOT SOURCE [SOURCE ...]
+    python metadata_snapshot.py refresh SNAPSHOT [SOURCE ...]
+    python metadata_snapshot.py info SNAPSHOT
+    python metadata_snapshot.py benchmark
+"""
+
+import os
+import sys
+import mmap
+import json
+import time
+import struct
+import argparse
+import numpy as np
+import metadata_pb2
+from google.protobuf.json_format import ParseError
+from google.protobuf.message import DecodeError
+from metadata_API import load_session
+from metadata_archive import ARCHIVE_MAGIC, RECORD_HEADER, ArchiveError, is_archive, iter_archive_records
+from metadata_codegen import fingerprint
+from metadata_partial import parse_masked
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+SNAPSHOT_MAGIC = b'BSMSNAP1'
+SNAPSHOT_VERSION = 1
+SECTIONS = ('table', 'by_uid', 'by_bird', 'by_date', 'strings', 'payloads', 'sources')
+HEADER = struct.Struct('<8sI40sI' + 'QQ' * len(SECTIONS))
+KEYS = ('sess_uid', 'bird_uid', 'date', 'time')
+TABLE_DTYPE = np.dtype([('payload', '<u8'), ('length', '<u4'), ('source', '<i4'), ('record', '<i8'),
+                        ('keys', '<u4', (len(KEYS), 2))])
+_UID, _BIRD, _DATE, _TIME = range(len(KEYS))
+_LAST = '\U0010ffff'        # Sorts after any key
+_FINGERPRINT = fingerprint()
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+'''Reading'''
+
+class Snapshot:
+
+    """ Read-only, memory-mapped snapshot of indexed sessions
+
+    Parameters
+    ----------
+    path : str
+        Snapshot file (see build_snapshot). Raises a ValueError if it is not a snapshot of this version of
+        metadata.proto: rebuild it then
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mm) < HEADER.size:
+                raise ValueError('%s is not a session snapshot' % path)
+            magic, version, proto, n, *sections = HEADER.unpack_from(self._mm)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError('%s is not a session snapshot' % path)
+            if version != SNAPSHOT_VERSION:
+                raise ValueError('%s is a version %d snapshot (expected %d)' % (path, version, SNAPSHOT_VERSION))
+            if proto.decode() != _FINGERPRINT:
+                raise ValueError('%s was written for another metadata.proto' % path)
+        except ValueError:
+            self._mm.close()
+            raise
+        self._sections = {name: (sections[2 * i], sections[2 * i + 1]) for i, name in enumerate(SECTIONS)}
+        self._table = np.frombuffer(self._mm, TABLE_DTYPE, count=n, offset=self._sections['table'][0])
+        self._by = {name: np.frombuffer(self._mm, np.int32, count=n, offset=self._sections[name][0])
+                    for name in ('by_uid', 'by_bird', 'by_date')}
+        self._strings = self._sections['strings'][0]
+        self._payloads = self._sections['payloads'][0]
+        self._sources = None
+
+    def close(self):
+        if self._mm is not None:
+            self._table = self._by = None       # Releases the buffers exported by the map
+            self._mm.close()
+            self._mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._table)
+
+    def __contains__(self, sess_uid):
+        return self._find_uid(sess_uid) is not None
+
+    def __repr__(self):
+        return 'Snapshot(%r, %d sessions)' % (self.path, len(self))
+
+    @property
+    def sources(self):
+        """ {'sources': [paths given to build_snapshot], 'files': [{'path', 'signature', ...}]} (read lazily) """
+
+        if self._sources is None:
+            offset, length = self._sections['sources']
+            self._sources = json.loads(self._mm[offset:offset + length].decode())
+        return self._sources
+
+    @property
+    def errors(self):
+        """ [(path, error)] of the source files that could not be read (entirely) when the snapshot was written """
+
+        return [(state['path'], state['error']) for state in self.sources['files'] if 'error' in state]
+
+    def _key(self, row, key):
+        """ Private method: one of the KEYS of a row """
+
+        offset, length = self._table['keys'][row, key]
+        offset = self._strings + int(offset)
+        return self._mm[offset:offset + int(length)].decode()
+
+    def _search(self, index, below):
+        """ Private method: first position of an index whose row is not below(row) """
+
+        lo, hi = 0, len(index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if below(int(index[mid])):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find_uid(self, sess_uid):
+        """ Private method: row of a sess_uid, or None """
+
+        index = self._by['by_uid']
+        i = self._search(index, lambda row: self._key(row, _UID) < sess_uid)
+        if i < len(index) and self._key(int(index[i]), _UID) == sess_uid:
+            return int(index[i])
+        return None
+
+    def _keys(self, row):
+        """ Private method: the KEYS of a row """
+
+        return tuple(self._key(row, k) for k in range(len(KEYS)))
+
+    def payload(self, row):
+        """ Serialized session of a row of the table (a bytes copy) """
+
+        entry = self._table[row]
+        offset = self._payloads + int(entry['payload'])
+        return self._mm[offset:offset + int(entry['length'])]
+
+    def session(self, row):
+        """ Parsed session of a row of the table """
+
+        sess = metadata_pb2.Session()
+        sess.ParseFromString(self.payload(row))
+        return sess
+
+    def get(self, sess_uid):
+        """ Return the session with a given sess_uid, or None """
+
+        row = self._find_uid(sess_uid)
+        return None if row is None else self.session(row)
+
+    def location(self, sess_uid):
+        """ (source file, archive offset or None) of a sess_uid, or None """
+
+        row = self._find_uid(sess_uid)
+        if row is None:
+            return None
+        entry = self._table[row]
+        record = int(entry['record'])
+        return self.sources['files'][int(entry['source'])]['path'], (None if record < 0 else record)
+
+    def find(self, bird_uid=None, start=None, end=None):
+        """ List the sess_uids of a bird (or of every bird) whose date lies in [start, end], sorted by date and time
+
+        Parameters
+        ----------
+        bird_uid : str
+            Bird to look up. None for all birds
+        start : str
+            First date, e.g. 2021-03-10 (inclusive). None for no lower bound
+        end : str
+            Last date, e.g. 2021-03-31 (inclusive). None for no upper bound
+        """
+
+        if bird_uid is None:
+            index = self._by['by_date']
+            prefix = ()
+            key = lambda row: (self._key(row, _DATE), self._key(row, _TIME), self._key(row, _UID))
+        else:
+            index = self._by['by_bird']
+            prefix = (bird_uid,)
+            key = lambda row: (self._key(row, _BIRD), self._key(row, _DATE), self._key(row, _TIME),
+                               self._key(row, _UID))
+        low = prefix + ((start,) if start is not None else ())
+        high = prefix + ((end, _LAST) if end is not None else (_LAST,))
+        lo = self._search(index, lambda row: key(row) < low) if low else 0
+        hi = self._search(index, lambda row: key(row) <= high) if high != (_LAST,) else len(index)
+        return [self._key(int(row), _UID) for row in index[lo:hi]]
+
+    def sess_uids(self):
+        """ Sorted list of the sess_uids of the snapshot """
+
+        return [self._key(int(row), _UID) for row in self._by['by_uid']]
+
+    def __iter__(self):
+        """ Sessions in snapshot (source) order """
+
+        for row in range(len(self)):
+            yield self.session(row)
+
+    def is_stale(self):
+        """ True if a file of the sources was added, modified or removed since the snapshot """
+
+        known = {entry['path']: entry['signature'] for entry in self.sources['files']}
+        seen = 0
+        for path in _iter_files(self.sources['sources']):
+            if not os.path.exists(path):
+                return True
+            st = os.stat(path)
+            if known.get(path) != [st.st_mtime_ns, st.st_size]:
+                return True
+            seen += 1
+        return seen != len(known)
+
+
+'''Writing'''
+
+def _iter_files(sources):
+    """ Private helper: the archives and metadata files of sources (files and directories) """
+
+    for source in sources:
+        if not os.path.isdir(source):
+            yield source
+            continue
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if name.endswith(('.pb', '.json')) or is_archive(path):
+                    yield path
+
+
+def _keys(payload):
+    """ Private helper: KEYS of a serialized session """
+
+    sess = parse_masked(bytes(payload), KEYS)
+    return tuple(getattr(sess, key) for key in KEYS)
+
+
+def _read_file(path, state, previous, old):
+    """ Private helper: entries of a file, reusing those of the old snapshot for what did not change
+
+    Parameters
+    ----------
+    path : str
+        Archive or metadata file
+    state : dict
+        Signature of the file in the new snapshot, filled here
+    previous : dict
+        Its signature in the old snapshot (None when new)
+    old : (Snapshot, list of int)
+        The old snapshot and the rows of the file in it (None, None when new)
+
+    Returns
+    -------
+    (list of (payload, keys, record offset), int, int)
+        The entries of the file, and how many were reused / parsed. A file that is not a session (or an
+        archive damaged part way) gives the entries read before the problem, and state['error']
+    """
+
+    st = os.stat(path)
+    state['signature'] = [st.st_mtime_ns, st.st_size]
+    archive = is_archive(path)
+    if archive:
+        with open(path, 'rb') as f:
+            state['head'] = f.read(len(ARCHIVE_MAGIC) + RECORD_HEADER.size).hex()
+        state['end'] = st.st_size
+    unchanged = previous is not None and previous['signature'] == state['signature']
+    # Archives only grow: resume after the last record read, unless the first record changed (or was unread)
+    appended = (not unchanged and archive and previous is not None and previous.get('head') == state['head']
+                and previous.get('end', st.st_size + 1) <= st.st_size and 'error' not in previous)
+    snapshot, rows = old
+    entries = [(snapshot.payload(row), snapshot._keys(row), int(snapshot._table['record'][row]))
+               for row in (rows if unchanged or appended else ())]
+    if unchanged:
+        if 'error' in previous:
+            state['error'] = previous['error']
+        return entries, len(entries), 0
+
+    parsed = 0
+    try:
+        if archive:
+            start = previous['end'] if appended else None
+            for offset, payload in iter_archive_records(path, start=start, stop=st.st_size):
+                entries.append((payload, _keys(payload), offset))
+                parsed += 1
+        else:
+            if path.endswith('.json'):
+                payload = load_session(path).SerializeToString()
+            else:
+                with open(path, 'rb') as f:
+                    payload = f.read()
+            entries.append((payload, _keys(payload), -1))
+            parsed += 1
+    except (ParseError, DecodeError, ValueError, ArchiveError) as e:
+        state['error'] = '%s: %s' % (type(e).__name__, e)
+    return entries, len(entries) - parsed, parsed
+
+
+def _write(path, entries, sources_json):
+    """ Private helper: writes a snapshot of (payload, keys, source, record offset) entries atomically """
+
+    n = len(entries)
+    table = np.zeros(n, dtype=TABLE_DTYPE)
+    lengths = [len(payload) for payload, _, _, _ in entries]
+    table['length'] = lengths
+    table['payload'][1:] = np.cumsum(lengths[:-1], dtype=np.uint64)
+    table['source'] = [source for _, _, source, _ in entries]
+    table['record'] = [record for _, _, _, record in entries]
+    strings = bytearray()
+    spans = []
+    keys = [entry_keys for _, entry_keys, _, _ in entries]
+    for entry_keys in keys:
+        for value in entry_keys:
+            data = value.encode()
+            spans.append((len(strings), len(data)))
+            strings += data
+    if n:
+        table['keys'] = np.array(spans, dtype=np.uint32).reshape(n, len(KEYS), 2)
+    payload_offset = sum(lengths)
+
+    order = lambda key: np.array(sorted(range(n), key=key), dtype=np.int32)
+    sections = {
+        'table': table.tobytes(),
+        'by_uid': order(lambda row: keys[row][_UID]).tobytes(),
+        'by_bird': order(lambda row: (keys[row][_BIRD], keys[row][_DATE], keys[row][_TIME], keys[row][_UID])).tobytes(),
+        'by_date': order(lambda row: (keys[row][_DATE], keys[row][_TIME], keys[row][_UID])).tobytes(),
+        'strings': bytes(strings),
+        'payloads': None,                   # Streamed from the entries
+        'sources': json.dumps(sources_json).encode(),
+    }
+    positions = []
+    offset = _align(HEADER.size)
+    for name in SECTIONS:
+        length = payload_offset if name == 'payloads' else len(sections[name])
+        positions += [offset, length]
+        offset = _align(offset + length)
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, _FINGERPRINT.encode(), n, *positions))
+        for i, name in enumerate(SECTIONS):
+            f.write(b'\0' * (positions[2 * i] - f.tell()))
+            if name == 'payloads':
+                for payload, _, _, _ in entries:
+                    f.write(payload)
+            else:
+                f.write(sections[name])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def refresh_snapshot(path, sources=None):
+    """ Write or update the snapshot of sources, parsing only what changed since the existing snapshot
+
+    Parameters
+    ----------
+    path : str
+        Snapshot file (built from scratch if missing, unreadable or written for another metadata.proto)
+    sources : list of str
+        Archives, metadata files and directories of them (searched recursively, stored as absolute paths).
+        None keeps the sources of the existing snapshot
+
+    Returns
+    -------
+    dict
+        {'sessions': sessions in the snapshot, 'reused': sessions copied from the old snapshot,
+         'parsed': sessions read from the sources, 'removed': files no longer in the sources,
+         'errors': [(path, error)] of the files that could not be read, as Snapshot.errors}
+    """
+
+    try:
+        old = Snapshot(path)
+    except (FileNotFoundError, ValueError):
+        if sources is None:
+            raise
+        old = None
+    try:
+        sources = old.sources['sources'] if sources is None else [os.path.abspath(s) for s in sources]
+        known = {}
+        if old is not None:
+            rows = {}
+            for row, source in enumerate(old._table['source']):
+                rows.setdefault(int(source), []).append(row)
+            for i, state in enumerate(old.sources['files']):
+                known[state['path']] = (state, rows.get(i, []))
+
+        files, entries, seen = [], [], set()
+        counts = {'reused': 0, 'parsed': 0}
+        for file_path in _iter_files(sources):
+            state = {'path': file_path}
+            previous, rows = known.get(file_path, (None, None))
+            if previous is not None and previous.get('shadowed'):
+                # Its duplicates of earlier sess_uids are not in the old snapshot: they may win now
+                previous, rows = None, None
+            file_entries, reused, parsed = _read_file(file_path, state, previous, (old, rows))
+            counts['reused'] += reused
+            counts['parsed'] += parsed
+            for payload, keys, record in file_entries:
+                if keys[_UID] not in seen:
+                    seen.add(keys[_UID])
+                    entries.append((payload, keys, len(files), record))
+                else:
+                    state['shadowed'] = True
+            files.append(state)
+
+        _write(path, entries, {'sources': list(sources), 'files': files})
+        counts['sessions'] = len(entries)
+        counts['removed'] = len(set(known) - set(f['path'] for f in files))
+        counts['errors'] = [(f['path'], f['error']) for f in files if 'error' in f]
+        return counts
+    finally:
+        if old is not None:
+            old.close()
+
+
+def build_snapshot(path, sources):
+    """ Write the snapshot of sources from scratch (see refresh_snapshot). Returns the number of sessions """
+
+    if os.path.exists(path):
+        os.remove(path)
+    return refresh_snapshot(path, sources)['sessions']
+
+
+def open_snapshot(path, sources=None):
+    """ Open a snapshot, refreshing it first if its sources changed (or building it when missing) """
+
+    if os.path.exists(path):
+        try:
+            with Snapshot(path) as snapshot:
+                stale = snapshot.is_stale() or (sources is not None and
+                                                [os.path.abspath(s) for s in sources] != snapshot.sources['sources'])
+        except ValueError:
+            stale = True
+        if not stale:
+            return Snapshot(path)
+    refresh_snapshot(path, sources)
+    return Snapshot(path)
+
+
+'''Benchmark'''
+
+def benchmark_snapshot(directory='/tmp/metadata_snapshot_benchmark', n_sessions=20000):
+    """ Cold start of a SessionStore and of a snapshot on the same archive, and refresh after an append
+
+    Returns
+    -------
+    dict
+        {operation: seconds}
+    """
+
+    from metadata_archive import SessionArchiveWriter
+    from metadata_fixtures import realistic_sessions
+    from metadata_service import SessionStore
+    os.makedirs(directory, exist_ok=True)
+    archive = os.path.join(directory, 'archive.pb')
+    path = os.path.join(directory, 'sessions.snapshot')
+    payloads = realistic_sessions(n_sessions + 100)
+    with SessionArchiveWriter(archive, truncate=True) as writer:
+        for payload in payloads[:n_sessions]:
+            writer.append(payload)
+
+    results = {}
+    start = time.perf_counter()
+    store = SessionStore([archive])
+    store.find(store.get(store.find()[0]).bird_uid)
+    results['SessionStore start'] = time.perf_counter() - start
+    start = time.perf_counter()
+    build_snapshot(path, [archive])
+    results['build snapshot'] = time.perf_counter() - start
+    start = time.perf_counter()
+    with Snapshot(path) as snapshot:
+        snapshot.find(snapshot.get(snapshot.find()[0]).bird_uid)
+        if sorted(snapshot.sess_uids()) != sorted(store._locations):
+            raise AssertionError('snapshot and SessionStore sessions differ')
+    results['snapshot start'] = time.perf_counter() - start
+    with SessionArchiveWriter(archive) as writer:
+        for payload in payloads[n_sessions:]:
+            writer.append(payload)
+    start = time.perf_counter()
+    refresh_snapshot(path)
+    results['refresh (+100 sessions)'] = time.perf_counter() - start
+    return results
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Memory-mapped snapshots of indexed sessions')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='write the snapshot of sources from scratch')
+    build.add_argument('snapshot')
+    build.add_argument('sources', nargs='+')
+    refresh = commands.add_parser('refresh', help='update a snapshot with what changed in its sources')
+    refresh.add_argument('snapshot')
+    refresh.add_argument('sources', nargs='*')
+    info = commands.add_parser('info', help='sessions, birds and staleness of a snapshot')
+    info.add_argument('snapshot')
+    commands.add_parser('benchmark', help='cold start of a SessionStore against a snapshot')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        print('%d sessions' % build_snapshot(args.snapshot, args.sources))
+    elif args.command == 'refresh':
+        counts = refresh_snapshot(args.snapshot, args.sources or None)
+        print('%(sessions)d sessions (%(reused)d reused, %(parsed)d parsed, %(removed)d files removed)' % counts)
+        for path, error in counts['errors']:
+            print('    FAILED %s: %s' % (path, error))
+    elif args.command == 'info':
+        with Snapshot(args.snapshot) as snapshot:
+            print('%d sessions from %d files%s' % (len(snapshot), len(snapshot.sources['files']),
+                                                   ' (stale)' if snapshot.is_stale() else ''))
+    else:
+        for operation, seconds in benchmark_snapshot().items():
+            print('%-26s %8.3f s' % (operation, seconds))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+
+"""Streaming group-by statistics over Birdsong Project session archives
+
+A GroupBy maps every session to one or more group keys (a key function returns a list of keys, so e.g. a
+session counts once for every neural probe it used) and keeps a few aggregates per group:
+
+    Count()             number of sessions (or keys) in the group
+    Sum(value)          sum of value(sess)
+    Mean(value)         mean of value(sess)
+    Distinct(value)     approximate number of distinct value(sess), with a HyperLogLog sketch
+
+value functions return None for sessions they skip (e.g. weight_grams of a bird that was not weighed).
+Sessions are folded one at a time, so memory grows with the number of groups, never with the number of
+sessions: a Distinct sketch is 2 ** precision bytes whatever the number of distinct values. Every aggregate
+(and so every GroupBy) can merge a partial result of the same GroupBy, which is how aggregate() combines
+the ranges of archives scanned in parallel by metadata_scan.scan.
+
+Key and value functions must be module-level functions, so that GroupBys can be sent to worker processes.
+
+Usage:
+    python metadata_stats.py ARCHIVE [ARCHIVE ...] [--workers N]     lab report of archives
+    python metadata_stats.py                                        synthetic benchmark
+"""
+
+import os
+import sys
+import math
+import time
+import hashlib
+import argparse
+import datetime
+import functools
+import numpy as np
+import metadata_pb2
+from metadata_scan import scan
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+'''Aggregates'''
+
+class Count:
+    """ Number of sessions (keys) of a group """
+
+    def __init__(self):
+        self.n = 0
+
+    def empty(self):
+        return Count()
+
+    def add(self, sess):
+        self.n += 1
+
+    def merge(self, other):
+        self.n += other.n
+
+    def result(self):
+        return self.n
+
+
+class Sum:
+    """ Sum of value(sess) over the sessions of a group (None values are skipped) """
+
+    def __init__(self, value):
+        self.value = value
+        self.total = 0
+
+    def empty(self):
+        return Sum(self.value)
+
+    def add(self, sess):
+        v = self.value(sess)
+        if v is not None:
+            self.total += v
+
+    def merge(self, other):
+        self.total += other.total
+
+    def result(self):
+        return self.total
+
+
+class Mean:
+    """ Mean of value(sess) over the sessions of a group (None values are skipped, nan when all are) """
+
+    def __init__(self, value):
+        self.value = value
+        self.total = 0.0
+        self.n = 0
+
+    def empty(self):
+        return Mean(self.value)
+
+    def add(self, sess):
+        v = self.value(sess)
+        if v is not None:
+            self.total += v
+            self.n += 1
+
+    def merge(self, other):
+        self.total += other.total
+        self.n += other.n
+
+    def result(self):
+        return self.total / self.n if self.n else math.nan
+
+
+class Distinct:
+    """ Approximate number of distinct value(sess) of a group (HyperLogLog)
+
+    Parameters
+    ----------
+    value : callable
+        Module-level function of a session returning a str (None and '' are skipped)
+    precision : int
+        log2 of the number of registers (4..16): the sketch takes 2 ** precision bytes and its relative
+        standard error is 1.04 / sqrt(2 ** precision), e.g. 1.6 % for 12
+    """
+
+    def __init__(self, value, precision=12):
+        if not 4 <= precision <= 16:
+            raise ValueError('precision must be between 4 and 16, got %d' % precision)
+        self.value = value
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def empty(self):
+        return Distinct(self.value, self.precision)
+
+    def add(self, sess):
+        v = self.value(sess)
+        if v:
+            self.add_value(v)
+
+    def add_value(self, v):
+        """ Adds one value (str) to the sketch """
+
+        h = int.from_bytes(hashlib.blake2b(v.encode(), digest_size=8).digest(), 'little')
+        p = self.precision
+        index = h >> (64 - p)
+        rest = h & ((1 << (64 - p)) - 1)
+        rank = 64 - p - rest.bit_length() + 1       # Position of the first 1 bit of the remaining bits
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches of precision %d and %d' % (self.precision, other.precision))
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def result(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)      # Linear counting, more accurate for small cardinalities
+        return int(round(estimate))
+
+
+class GroupBy:
+    """ Aggregates of the sessions of every group
+
+    Parameters
+    ----------
+    key : callable
+        Module-level function of a session returning a list of hashable group keys (one per group the
+        session belongs to, none to skip it)
+    **aggregates
+        name=aggregate prototype (Count(), Mean(weight_grams), ...), copied for every new group
+    """
+
+    def __init__(self, key, **aggregates):
+        if not aggregates:
+            raise ValueError('GroupBy needs at least one aggregate')
+        self.key = key
+        self.aggregates = aggregates
+        self.groups = {}
+
+    def _group(self, key):
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {name: a.empty() for name, a in self.aggregates.items()}
+        return group
+
+    def add(self, sess):
+        """ Folds one session into its groups """
+
+        for key in self.key(sess):
+            for aggregate in self._group(key).values():
+                aggregate.add(sess)
+
+    def update(self, sessions):
+        """ Folds sessions into their groups. Returns self """
+
+        for sess in sessions:
+            self.add(sess)
+        return self
+
+    def merge(self, other):
+        """ Folds the partial result of another GroupBy (same key and aggregates) into this one. Returns self """
+
+        for key, other_group in other.groups.items():
+            group = self._group(key)
+            for name, aggregate in other_group.items():
+                group[name].merge(aggregate)
+        return self
+
+    def results(self):
+        """ {group key: {aggregate name: value}}, sorted by key """
+
+        return {key: {name: a.result() for name, a in self.groups[key].items()}
+                for key in sorted(self.groups, key=repr)}
+
+
+def _update(groupbys, value):
+    """ Private helper: scan() combine of {name: GroupBy} with a session (in workers) or a partial result """
+
+    if isinstance(value, metadata_pb2.Session):
+        for groupby in groupbys.values():
+            groupby.add(value)
+    else:
+        for name, groupby in value.items():
+            groupbys[name].merge(groupby)
+    return groupbys
+
+
+def _identity(sess):
+    return sess
+
+
+def aggregate(archives, groupbys, paths=None, workers=None):
+    """ Single pass of GroupBys over session archives, in parallel worker processes
+
+    Parameters
+    ----------
+    archives : str or list of str
+        Session archives
+    groupbys : dict
+        {name: GroupBy} (left empty: copies are filled and merged)
+    paths : list of str
+        Fields used by the key and value functions (see metadata_partial.parse_masked), so that the other
+        fields are never decoded. None parses every field
+    workers : int
+        Worker processes (None uses every CPU, 1 aggregates in the calling process)
+
+    Returns
+    -------
+    dict
+        {name: GroupBy} with the groups of all the sessions of archives
+    """
+
+    return scan(archives, _identity, combine=_update, initial=groupbys, paths=paths, workers=workers)
+
+
+'''Keys and values'''
+
+def everything(sess):
+    """ Single group of all sessions """
+
+    return [()]
+
+
+def condition_box(sess):
+    """ (condition name, box) group of a session """
+
+    return [(metadata_pb2.Session.Condition.Name(sess.condition) if sess.condition in _CONDITIONS
+             else str(sess.condition), sess.box)]
+
+
+_CONDITIONS = frozenset(metadata_pb2.Session.Condition.values())
+
+
+@functools.lru_cache(maxsize=4096)
+def _iso_week(date):
+    """ Private helper: 'YYYY-Www' of a 'YYYY-MM-DD' date ('' when the date cannot be parsed) """
+
+    try:
+        year, week, _ = datetime.date.fromisoformat(date).isocalendar()
+    except ValueError:
+        return ''
+    return '%04d-W%02d' % (year, week)
+
+
+def week(sess):
+    """ ISO week ('2021-W10') group of a session """
+
+    return [_iso_week(sess.date)]
+
+
+def probe_model(sess):
+    """ (manufacturer, model) group of every neural probe of a session """
+
+    return [(probe.manufacturer, probe.model) for acq in sess.acquisitions for probe in acq.neuralprobes]
+
+
+def weight_grams(sess):
+    """ Weight of the bird (None when it was not weighed) """
+
+    return sess.weight_grams or None
+
+
+def bird_uid(sess):
+    return sess.bird_uid
+
+
+def lab_report():
+    """ GroupBys of the routine lab report, and the fields they use
+
+    Returns
+    -------
+    (dict, list of str)
+        {name: GroupBy} and the paths argument of aggregate()
+    """
+
+    groupbys = {
+        'sessions': GroupBy(everything, sessions=Count(), birds=Distinct(bird_uid)),
+        'condition and box': GroupBy(condition_box, sessions=Count(), birds=Distinct(bird_uid)),
+        'week': GroupBy(week, sessions=Count(), mean_weight_grams=Mean(weight_grams)),
+        'probe model': GroupBy(probe_model, probes=Count(), birds=Distinct(bird_uid)),
+    }
+    paths = ['bird_uid', 'date', 'weight_grams', 'condition', 'box',
+             'acquisitions.neuralprobes.manufacturer', 'acquisitions.neuralprobes.model']
+    return groupbys, paths
+
+
+def print_report(groupbys):
+    for name, groupby in groupbys.items():
+        print(name)
+        for key, values in groupby.results().items():
+            print('    %-40s %s' % (', '.join(map(str, key)) if isinstance(key, tuple) else key,
+                                    '  '.join('%s=%s' % (k, '%.2f' % v if isinstance(v, float) else v)
+                                              for k, v in values.items())))
+
+
+'''Benchmark'''
+
+def benchmark_stats(archive='/tmp/metadata_stats_benchmark.pb', n_sessions=20000, workers=None):
+    """ Time of the lab report of a synthetic archive, and error of its distinct bird counts
+
+    Returns
+    -------
+    dict
+        {workers: seconds}, plus 'distinct error': relative error of Distinct on 100000 distinct values
+    """
+
+    from metadata_archive import SessionArchiveWriter
+    from metadata_fixtures import realistic_sessions
+    with SessionArchiveWriter(archive, truncate=True) as writer:
+        for payload in realistic_sessions(n_sessions):
+            writer.append(payload)
+
+    results = {}
+    for n in sorted({1, workers or os.cpu_count()}):
+        groupbys, paths = lab_report()
+        start = time.perf_counter()
+        aggregate(archive, groupbys, paths=paths, workers=n)
+        results[n] = time.perf_counter() - start
+
+    sketch = Distinct(bird_uid)
+    for i in range(100000):
+        sketch.add_value('bird_%d' % i)
+    results['distinct error'] = abs(sketch.result() - 100000) / 100000
+    return results
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Lab report statistics of session archives')
+    parser.add_argument('archives', nargs='*', help='session archives (a synthetic benchmark when none)')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if not args.archives:
+        for n, value in benchmark_stats(workers=args.workers).items():
+            print('%-16s %8.3f' % (n if isinstance(n, str) else '%d workers' % n, value))
+        return
+    groupbys, paths = lab_report()
+    start = time.perf_counter()
+    groupbys = aggregate(args.archives, groupbys, paths=paths, workers=args.workers)
+    print_report(groupbys)
+    print('%.2f s' % (time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
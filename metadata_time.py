@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+"""Canonical timestamps of Birdsong Project sessions
+
+Sessions store their moment as strings in the local time of the lab (US/Pacific), in several formats:
+
+    date                                    2021-03-10
+    time                                    14:42:01.754603 (no fraction when the microseconds are 0)
+    sess_uid (update_date_and_time)         HABITUATION-z_m10g8_20-2021-03-10-14:42:01.754603
+    sess_uid (read_bird_metadata)           HABITUATION-z_m10g8_20-20210310-14:42:01
+    testosterone_date, dummy_*_date         2021-03-10, or the YYYY-MM-DD placeholder
+
+The functions below turn batches of those strings into numpy arrays at once: local datetime64 values,
+then UTC datetime64[us] whose int64 view is the canonical epoch (microseconds since 1970-01-01 UTC), so
+that sorting and range filtering of many sessions are integer operations. Missing or malformed strings
+become NaT (int64 minimum in the epoch view, MISSING_EPOCH).
+"""
+
+import re
+from datetime import datetime, timedelta
+import numpy as np
+import pytz
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+TIMEZONE = pytz.timezone('US/Pacific')
+MISSING_EPOCH = np.iinfo(np.int64).min      # Epoch of NaT
+
+_SESS_UID_TIME = re.compile(r'(\d{4})-?(\d{2})-?(\d{2})(?:-(\d{2}:\d{2}:\d{2}(?:\.\d+)?))?$')
+_US = timedelta(microseconds=1)
+
+
+def local_now():
+    """ Current moment in the lab's timezone (one clock reading for all the strings derived from it) """
+
+    return datetime.now(TIMEZONE)
+
+
+def to_datetime64(strings, unit='us'):
+    """ Vectorized parse of ISO 8601 strings
+
+    Parameters
+    ----------
+    strings : sequence of str
+        e.g. ['2021-03-10', '2021-03-10T14:42:01.754603']
+    unit : str
+        numpy datetime unit of the result, e.g. 'D' or 'us'
+
+    Returns
+    -------
+    numpy.ndarray of datetime64
+        Empty or malformed strings (e.g. YYYY-MM-DD) are NaT
+    """
+
+    array = np.asarray(strings, dtype=str)
+    try:
+        return array.astype('datetime64[%s]' % unit)
+    except ValueError:
+        # Some strings are not dates: parse what can be parsed, element by element
+        out = np.empty(array.shape, dtype='datetime64[%s]' % unit)
+        for i, s in enumerate(array.flat):
+            try:
+                out.flat[i] = np.datetime64(s, unit) if s else np.datetime64('NaT')
+            except ValueError:
+                out.flat[i] = np.datetime64('NaT')
+        return out
+
+
+def parse_dates(strings):
+    """ datetime64[D] of date strings (testosterone_date, dummy_*_date, date); placeholders are NaT """
+
+    return to_datetime64(strings, 'D')
+
+
+def parse_local_times(dates, times):
+    """ Naive local datetime64[us] of the date and time fields of sessions (a missing time means midnight) """
+
+    return to_datetime64([d + 'T' + t if d and t else d for d, t in zip(dates, times)], 'us')
+
+
+def parse_sess_uid_times(sess_uids):
+    """ Naive local datetime64[us] embedded in sess_uids, in either of the formats in use
+
+    Parameters
+    ----------
+    sess_uids : sequence of str
+
+    Returns
+    -------
+    numpy.ndarray of datetime64[us]
+        NaT for sess_uids without a recognizable timestamp
+    """
+
+    iso = []
+    for uid in sess_uids:
+        match = _SESS_UID_TIME.search(uid)
+        if match is None:
+            iso.append('')
+        else:
+            year, month, day, time = match.groups()
+            iso.append('%s-%s-%sT%s' % (year, month, day, time) if time else '%s-%s-%s' % (year, month, day))
+    return to_datetime64(iso, 'us')
+
+
+def local_to_utc(local, tz=TIMEZONE):
+    """ Convert naive local datetime64 values to UTC, vectorized
+
+    The UTC offset is computed once per distinct local hour, so the cost is independent of the number of
+    values sharing an hour. Ambiguous times (the repeated hour when daylight saving time ends) are taken
+    as standard time, non-existent ones (the skipped hour) are shifted like standard time.
+
+    Parameters
+    ----------
+    local : array_like of datetime64
+        Naive local times
+    tz : pytz timezone
+        Timezone of the local times
+
+    Returns
+    -------
+    numpy.ndarray of datetime64[us]
+        UTC times (NaT stays NaT)
+    """
+
+    local = np.asarray(local, dtype='datetime64[us]')
+    out = np.full(local.shape, np.datetime64('NaT'), dtype='datetime64[us]')
+    valid = ~np.isnat(local)
+    hours, inverse = np.unique(local[valid].astype('datetime64[h]'), return_inverse=True)
+    offsets = np.array([tz.localize(h.item(), is_dst=False).utcoffset() // _US for h in hours], dtype=np.int64)
+    out[valid] = local[valid] - offsets[inverse.reshape(-1)].astype('timedelta64[us]')
+    return out
+
+
+def utc_to_local(utc, tz=TIMEZONE):
+    """ Convert UTC datetime64 values to naive local times, vectorized (inverse of local_to_utc) """
+
+    utc = np.asarray(utc, dtype='datetime64[us]')
+    out = np.full(utc.shape, np.datetime64('NaT'), dtype='datetime64[us]')
+    valid = ~np.isnat(utc)
+    hours, inverse = np.unique(utc[valid].astype('datetime64[h]'), return_inverse=True)
+    offsets = np.array([pytz.utc.localize(h.item()).astimezone(tz).utcoffset() // _US for h in hours],
+                       dtype=np.int64)
+    out[valid] = utc[valid] + offsets[inverse.reshape(-1)].astype('timedelta64[us]')
+    return out
+
+
+def session_times(dates, times, sess_uids=None, tz=TIMEZONE):
+    """ Canonical UTC datetime64[us] of many sessions from their string fields
+
+    Parameters
+    ----------
+    dates, times : sequence of str
+        date and time fields of the sessions
+    sess_uids : sequence of str
+        sess_uid fields, used for sessions without a parsable date
+    tz : pytz timezone
+        Timezone the strings were written in
+
+    Returns
+    -------
+    numpy.ndarray of datetime64[us]
+    """
+
+    local = parse_local_times(dates, times)
+    if sess_uids is not None:
+        missing = np.isnat(local)
+        if missing.any():
+            local[missing] = parse_sess_uid_times([uid for uid, m in zip(sess_uids, missing) if m])
+    return local_to_utc(local, tz)
+
+
+def session_epochs(sessions, tz=TIMEZONE):
+    """ Canonical epoch of many sessions: microseconds since 1970-01-01 UTC
+
+    Parameters
+    ----------
+    sessions : iterable of metadata_pb2.Session or metadata_views.SessionView
+        Anything with date, time and sess_uid attributes
+    tz : pytz timezone
+        Timezone the strings were written in
+
+    Returns
+    -------
+    numpy.ndarray of int64
+        MISSING_EPOCH for sessions whose moment cannot be parsed
+    """
+
+    dates, times, uids = [], [], []
+    for sess in sessions:
+        dates.append(sess.date)
+        times.append(sess.time)
+        uids.append(sess.sess_uid)
+    return session_times(dates, times, uids, tz).view(np.int64)
+
+
+def session_epoch(sess, tz=TIMEZONE):
+    """ Canonical epoch of one session in microseconds since 1970-01-01 UTC (None if it cannot be parsed) """
+
+    epoch = int(session_epochs([sess], tz)[0])
+    return None if epoch == MISSING_EPOCH else epoch
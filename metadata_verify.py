@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+"""Integrity verification and salvage of Birdsong Project session archives and metadata files
+
+ParseFromString accepts many damaged inputs: a metadata file truncated at a field boundary parses into a
+session with missing fields, and a damaged archive stops iter_archive_records at the first bad record.
+verify() checks every record of archives (and every .pb metadata file) in three steps:
+
+    framing     record headers chain up to the end of the file, lengths are within MAX_RECORD_SIZE
+    checksums   the crc32 of every payload matches its header
+    parsing     every payload is a well-formed Session (metadata_wire.check_message) that ParseFromString
+                accepts
+
+The first two steps are one sequential pass over the memory-mapped file (crc32 runs in C). After a bad
+record the pass resynchronizes on the next offset holding a valid, non-empty record (metadata_archive.
+find_record: a length within the largest record seen so far, a plausible next header and a matching crc32),
+so one damaged region does not hide the records after it. The parsing step, which is
+the slow one, runs over ranges of records in worker processes.
+
+repair_archive() copies the intact records of an archive into a new archive one at a time, so archives
+of any size are salvaged in constant memory.
+
+Usage:
+    python metadata_verify.py PATH [PATH ...] [--workers N] [--strict]     verify archives / .pb files / directories
+    python metadata_verify.py ARCHIVE --repair-to NEW_ARCHIVE              salvage the intact records
+    python metadata_verify.py                                              synthetic benchmark
+"""
+
+import os
+import sys
+import mmap
+import time
+import zlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import metadata_pb2
+from google.protobuf.message import DecodeError
+from metadata_archive import (ARCHIVE_MAGIC, RECORD_HEADER, MAX_RECORD_SIZE, SessionArchiveWriter, find_record,
+                              is_archive)
+from metadata_scan import SPLITS_PER_WORKER
+from metadata_wire import check_message, WireError
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+def _valid_record(mm, offset, size):
+    """ Private helper: length of the record at offset if its framing and crc32 are valid, else None """
+
+    if offset + RECORD_HEADER.size > size:
+        return None
+    length, crc = RECORD_HEADER.unpack_from(mm, offset)
+    end = offset + RECORD_HEADER.size + length
+    if length > MAX_RECORD_SIZE or end > size or zlib.crc32(mm[offset + RECORD_HEADER.size:end]) != crc:
+        return None
+    return length
+
+
+def _problem(mm, offset, size):
+    """ Private helper: why the record at offset is not valid """
+
+    if offset + RECORD_HEADER.size > size:
+        return 'Truncated record header'
+    length, _ = RECORD_HEADER.unpack_from(mm, offset)
+    if length > MAX_RECORD_SIZE:
+        return 'Invalid record length %d' % length
+    if offset + RECORD_HEADER.size + length > size:
+        return 'Truncated record payload'
+    return 'Checksum mismatch'
+
+
+def check_framing(filename):
+    """ Framing and checksums of every record of an archive (one sequential pass)
+
+    Parameters
+    ----------
+    filename : str
+        Session archive
+
+    Returns
+    -------
+    (list of (int, int), list of (int, str))
+        (offset, payload length) of every record with valid framing and crc32, and (offset, problem) of
+        every damaged region (the problem ends with the number of bytes skipped)
+    """
+
+    records, problems = [], []
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < len(ARCHIVE_MAGIC) or f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            return records, [(0, 'Not a session archive')]
+        if size == len(ARCHIVE_MAGIC):
+            return records, problems
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = len(ARCHIVE_MAGIC)
+            largest = 0
+            while offset < size:
+                length = _valid_record(mm, offset, size)
+                if length is not None:
+                    records.append((offset, length))
+                    largest = max(largest, length)
+                    offset += RECORD_HEADER.size + length
+                    continue
+                resumed = find_record(mm, offset + 1, size, largest or MAX_RECORD_SIZE)
+                problems.append((offset, '%s (%d bytes skipped)' % (_problem(mm, offset, size), resumed - offset)))
+                offset = resumed
+    return records, problems
+
+
+def check_payload(payload, strict=False):
+    """ Problem of a serialized Session, or None when it is well-formed
+
+    Parameters
+    ----------
+    payload : bytes
+        Serialized Session
+    strict : bool
+        Reject fields that are not in metadata.proto (by default they are accepted when well-framed, as
+        ParseFromString does: e.g. fields added by a newer metadata.proto)
+    """
+
+    try:
+        check_message(payload, metadata_pb2.Session.DESCRIPTOR, allow_unknown=not strict)
+        metadata_pb2.Session().ParseFromString(payload)
+    except (WireError, DecodeError) as e:
+        return '%s: %s' % (type(e).__name__, e)
+    return None
+
+
+def _check_records(filename, records, strict):
+    """ Private helper run in worker processes: (offset, problem) of the records that do not parse """
+
+    problems = []
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for offset, length in records:
+            start = offset + RECORD_HEADER.size
+            problem = check_payload(mm[start:start + length], strict)
+            if problem is not None:
+                problems.append((offset, problem))
+    return problems
+
+
+def _check_file(filename, strict):
+    """ Private helper run in worker processes: problems of a single-session .pb metadata file """
+
+    with open(filename, 'rb') as f:
+        problem = check_payload(f.read(), strict)
+    return [] if problem is None else [(None, problem)]
+
+
+def _iter_paths(paths):
+    """ Private helper: archives and .pb files of paths (directories are searched recursively) """
+
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.pb') or is_archive(os.path.join(root, name)):
+                    yield os.path.join(root, name)
+
+
+def verify(paths, workers=None, strict=False):
+    """ Check the framing, checksums and parseability of every record of archives and .pb files
+
+    Parameters
+    ----------
+    paths : str or list of str
+        Session archives, .pb metadata files and directories of them
+    workers : int
+        Worker processes of the parsing step (None uses every CPU, 1 checks in the calling process)
+    strict : bool
+        Reject fields that are not in metadata.proto (see check_payload)
+
+    Returns
+    -------
+    dict
+        {'files': files checked, 'records': intact records (a .pb file counts as one),
+         'problems': [(file, offset or None, problem)] sorted by file and offset}
+    """
+
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    workers = workers or os.cpu_count()
+    problems, jobs = [], []
+    files = records = 0
+    for path in _iter_paths(paths):
+        files += 1
+        if not is_archive(path):
+            jobs.append((path, _check_file, (path, strict)))
+            records += 1
+            continue
+        framed, framing_problems = check_framing(path)
+        problems.extend((path, offset, problem) for offset, problem in framing_problems)
+        records += len(framed)
+        per_job = max(1, -(-len(framed) // (workers * SPLITS_PER_WORKER)))
+        for i in range(0, len(framed), per_job):
+            jobs.append((path, _check_records, (path, framed[i:i + per_job], strict)))
+
+    if workers == 1:
+        results = [(path, fn(*args)) for path, fn, args in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(path, pool.submit(fn, *args)) for path, fn, args in jobs]
+            results = [(path, future.result()) for path, future in futures]
+    for path, job_problems in results:
+        problems.extend((path, offset, problem) for offset, problem in job_problems)
+        records -= len(job_problems)
+    problems.sort(key=lambda p: (p[0], -1 if p[1] is None else p[1]))
+    return {'files': files, 'records': records, 'problems': problems}
+
+
+def repair_archive(src, dst, strict=False):
+    """ Copy the intact records of an archive into a new archive, in order
+
+    Records with valid framing and checksum are copied when their payload parses (see check_payload);
+    everything else is left out. Records are read from the memory-mapped source and written one at a time.
+
+    Parameters
+    ----------
+    src : str
+        Damaged session archive
+    dst : str
+        New archive (overwritten; must not be src)
+    strict : bool
+        Also leave out records with fields that are not in metadata.proto
+
+    Returns
+    -------
+    dict
+        {'records': records copied, 'problems': [(offset, problem)] of what was left out}
+    """
+
+    if os.path.abspath(src) == os.path.abspath(dst):
+        raise ValueError('repair_archive writes a new archive: dst must differ from src')
+    records, problems = check_framing(src)
+    if problems and problems[0][0] == 0:
+        raise ValueError('%s is not a session archive' % src)
+    copied = 0
+    with open(src, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            SessionArchiveWriter(dst, truncate=True) as writer:
+        for offset, length in records:
+            start = offset + RECORD_HEADER.size
+            payload = mm[start:start + length]
+            problem = check_payload(payload, strict)
+            if problem is not None:
+                problems.append((offset, problem))
+                continue
+            writer.append(payload)
+            copied += 1
+    problems.sort()
+    return {'records': copied, 'problems': problems}
+
+
+'''Benchmark'''
+
+def benchmark_verify(archive='/tmp/metadata_verify_benchmark.pb', n_sessions=20000, workers=None):
+    """ Time of the verification of a damaged synthetic archive with 1 worker and with every CPU
+
+    The archive gets three kinds of damage: a flipped payload byte, a zero-filled region spanning record
+    boundaries and a truncated last record.
+
+    Returns
+    -------
+    dict
+        {workers: seconds}, plus 'problems': problems found and 'salvaged': records kept by repair_archive
+    """
+
+    from metadata_fixtures import realistic_sessions
+    with SessionArchiveWriter(archive, truncate=True) as writer:
+        for payload in realistic_sessions(n_sessions):
+            writer.append(payload)
+    size = os.path.getsize(archive)
+    with open(archive, 'r+b') as f:
+        f.seek(size // 3)
+        byte = f.read(1)
+        f.seek(size // 3)
+        f.write(bytes([byte[0] ^ 0xff]))
+        f.seek(size // 2)
+        f.write(b'\0' * 5000)
+        f.truncate(size - 10)
+
+    results = {}
+    for n in sorted({1, workers or os.cpu_count()}):
+        start = time.perf_counter()
+        report = verify(archive, workers=n)
+        results[n] = time.perf_counter() - start
+    results['problems'] = len(report['problems'])
+    results['salvaged'] = repair_archive(archive, archive + '.repaired')['records']
+    return results
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Verify (and salvage) session archives and .pb metadata files')
+    parser.add_argument('paths', nargs='*', help='archives, .pb files or directories (a synthetic benchmark when none)')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--strict', action='store_true', help='reject fields that are not in metadata.proto')
+    parser.add_argument('--repair-to', default=None, metavar='NEW_ARCHIVE',
+                        help='copy the intact records of the (single) archive to a new archive')
+    args = parser.parse_args(argv)
+
+    if not args.paths:
+        for key, value in benchmark_verify(workers=args.workers).items():
+            print('%-12s %s' % ('%d workers' % key if isinstance(key, int) else key,
+                                '%8.2f s' % value if isinstance(key, int) else value))
+        return 0
+    if args.repair_to is not None:
+        if len(args.paths) != 1:
+            parser.error('--repair-to takes a single archive')
+        result = repair_archive(args.paths[0], args.repair_to, strict=args.strict)
+        for offset, problem in result['problems']:
+            print('%s @%d: %s' % (args.paths[0], offset, problem))
+        print('%d records copied to %s' % (result['records'], args.repair_to))
+        return 0
+    start = time.perf_counter()
+    report = verify(args.paths, workers=args.workers, strict=args.strict)
+    for path, offset, problem in report['problems']:
+        print('%s%s: %s' % (path, '' if offset is None else ' @%d' % offset, problem))
+    print('%d files, %d intact records, %d problems in %.2f s' % (report['files'], report['records'],
+                                                                   len(report['problems']),
+                                                                   time.perf_counter() - start))
+    return 1 if report['problems'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+"""Read-only lightweight views of Birdsong Project sessions
+
+Every message of metadata.proto gets a namedtuple view (SessionView, AcquisitionView, NeuralProbeView,
+SensorView, StimulusView, DataFileView) with the same field names, in field-number order. Views are plain
+tuples: no per-instance __dict__, attribute access is a C-level index and they are hashable and picklable.
+Repeated fields are tuples and enum fields are kept as ints (e.g. SessionView.condition == 2 for CHRONIC),
+their names being available as <field>_name properties (SessionView.condition_name == 'CHRONIC').
+
+The converters between messages and views are generated from the message descriptors when the module is
+imported, so they follow metadata.proto without any hand-written field list.
+"""
+
+from collections import namedtuple
+import metadata_pb2
+from metadata_API import session_to_dict
+from metadata_fixtures import benchmark_session, measure
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+_MESSAGES = [metadata_pb2.Session.NeuralProbe, metadata_pb2.Session.Sensor, metadata_pb2.Session.Stimulus,
+             metadata_pb2.Session.DataFile, metadata_pb2.Session.Acquisition,
+             metadata_pb2.Session]      # Submessages before their containers
+
+# String fields unique to every session: never worth interning
+UNIQUE_FIELDS = {'Session': ('time', 'sess_uid')}
+
+
+def _default(field):
+    """ Private helper: default value of a field in a view """
+
+    if field.label == field.LABEL_REPEATED:
+        return ()
+    return field.default_value
+
+
+def _enum_property(index, field):
+    """ Private helper: property giving the name of an enum field of a view (cached name lookup) """
+
+    names = {v.number: v.name for v in field.enum_type.values}
+    return property(lambda self: names.get(self[index], self[index]),
+                    doc='Name of the %s enum value (unknown values are returned as ints)' % field.name)
+
+
+def _view_class(desc):
+    """ Private helper: namedtuple view of a message, with a <field>_name property for every enum field """
+
+    name = desc.name + 'View'
+    base = namedtuple(name, [f.name for f in desc.fields], defaults=[_default(f) for f in desc.fields])
+    attributes = {'__slots__': (), '__doc__': 'Read-only view of a %s message' % desc.full_name}
+    for index, f in enumerate(desc.fields):
+        if f.enum_type is not None and f.label != f.LABEL_REPEATED:
+            attributes[f.name + '_name'] = _enum_property(index, f)
+    return type(name, (base,), attributes)
+
+
+def _generate(messages):
+    """ Private helper: source code of the view classes' converters, plus the namespace it runs in
+
+    For every message M this generates:
+        _from_M(msg)                -> MView
+        _from_M_interned(msg, pool) -> MView whose strings went through pool (a callable str -> str)
+        _into_M(view, msg)          fills an empty message from a view
+    """
+
+    namespace = {}
+    lines = []
+    for cls in messages:
+        desc = cls.DESCRIPTOR
+        view = desc.name + 'View'
+        namespace[view] = _view_class(desc)
+        namespace['_new_' + desc.name] = tuple.__new__
+        unique = UNIQUE_FIELDS.get(desc.name, ())
+
+        for suffix, extra in (('', ''), ('_interned', ', pool')):
+            args = []
+            for f in desc.fields:
+                interned = extra and f.type == f.TYPE_STRING and f.name not in unique
+                if f.message_type is not None:
+                    args.append('tuple([_from_%s%s(x%s) for x in msg.%s])' % (f.message_type.name, suffix, extra, f.name))
+                elif f.label == f.LABEL_REPEATED:
+                    args.append('tuple([pool(x) for x in msg.%s])' % f.name if interned else 'tuple(msg.%s)' % f.name)
+                else:
+                    args.append('pool(msg.%s)' % f.name if interned else 'msg.%s' % f.name)
+            lines.append('def _from_%s%s(msg%s):' % (desc.name, suffix, extra))
+            lines.append('    return _new_%s(%s, (%s,))' % (desc.name, view, ', '.join(args)))
+
+        lines.append('def _into_%s(view, msg):' % desc.name)
+        for f in desc.fields:
+            if f.message_type is not None:
+                lines.append('    for x in view.%s: _into_%s(x, msg.%s.add())' % (f.name, f.message_type.name, f.name))
+            elif f.label == f.LABEL_REPEATED:
+                lines.append('    if view.%s: msg.%s.extend(view.%s)' % (f.name, f.name, f.name))
+            else:
+                lines.append('    if view.%s: msg.%s = view.%s' % (f.name, f.name, f.name))
+        lines.append('    return msg')
+    return '\n'.join(lines) + '\n', namespace
+
+
+_SOURCE, _namespace = _generate(_MESSAGES)
+exec(compile(_SOURCE, '<metadata_views generated>', 'exec'), _namespace)
+
+SessionView = _namespace['SessionView']
+AcquisitionView = _namespace['AcquisitionView']
+NeuralProbeView = _namespace['NeuralProbeView']
+SensorView = _namespace['SensorView']
+StimulusView = _namespace['StimulusView']
+DataFileView = _namespace['DataFileView']
+
+_FROM = {cls.DESCRIPTOR: _namespace['_from_' + cls.DESCRIPTOR.name] for cls in _MESSAGES}
+_FROM_INTERNED = {cls.DESCRIPTOR: _namespace['_from_%s_interned' % cls.DESCRIPTOR.name] for cls in _MESSAGES}
+_INTO = {_namespace[cls.DESCRIPTOR.name + 'View']: (cls, _namespace['_into_' + cls.DESCRIPTOR.name])
+         for cls in _MESSAGES}
+
+
+def to_view(msg, pool=None):
+    """ Read-only view of a Session or of any of its submessages
+
+    Parameters
+    ----------
+    msg : metadata_pb2.Session or one of its nested messages
+        Message to convert
+    pool : callable
+        String pool (e.g. metadata_intern.StringPool) every string field except UNIQUE_FIELDS goes through,
+        so equal strings of many views share one object
+
+    Returns
+    -------
+    SessionView, AcquisitionView, NeuralProbeView, SensorView, StimulusView or DataFileView
+        View with the same field values (enums as ints, repeated fields as tuples)
+    """
+
+    if pool is None:
+        return _FROM[msg.DESCRIPTOR](msg)
+    return _FROM_INTERNED[msg.DESCRIPTOR](msg, pool)
+
+
+def from_view(view):
+    """ Message equivalent to a view (the inverse of to_view)
+
+    Parameters
+    ----------
+    view : SessionView, AcquisitionView, NeuralProbeView, SensorView, StimulusView or DataFileView
+        View to convert
+
+    Returns
+    -------
+    metadata_pb2.Session or one of its nested messages
+        New message with the view's field values
+    """
+
+    cls, into = _INTO[type(view)]
+    return into(view, cls())
+
+
+def sessions_to_views(sessions, pool=None):
+    """ Bulk conversion of sessions to views
+
+    Parameters
+    ----------
+    sessions : iterable of metadata_pb2.Session or bytes
+        Sessions, or their serialized bytes (e.g. the payloads of iter_archive_records)
+    pool : callable
+        String pool shared by all the views (see to_view)
+
+    Returns
+    -------
+    list of SessionView
+    """
+
+    convert = _namespace['_from_Session'] if pool is None else _namespace['_from_Session_interned']
+    extra = () if pool is None else (pool,)
+    views = []
+    parsed = metadata_pb2.Session()
+    for sess in sessions:
+        if isinstance(sess, (bytes, bytearray, memoryview)):
+            parsed.Clear()
+            parsed.ParseFromString(sess)
+            sess = parsed
+        views.append(convert(sess, *extra))
+    return views
+
+
+def views_to_sessions(views):
+    """ Bulk conversion of session views back to messages
+
+    Parameters
+    ----------
+    views : iterable of SessionView
+
+    Returns
+    -------
+    list of metadata_pb2.Session
+    """
+
+    into = _namespace['_into_Session']
+    return [into(view, metadata_pb2.Session()) for view in views]
+
+
+'''Memory benchmark'''
+
+def benchmark_memory(n_sessions=1000, n_acquisitions=2, n_items=3):
+    """ Memory held by many loaded sessions as protobuf messages, MessageToDict dictionaries and views
+
+    Every representation is built from the same serialized sessions, which are not counted.
+
+    Parameters
+    ----------
+    n_sessions : int
+        Sessions loaded
+    n_acquisitions : int
+        Acquisitions per session
+    n_items : int
+        Neural probes, sensors and stimuli per acquisition
+
+    Returns
+    -------
+    dict
+        {representation: (MB held, seconds to build)}
+    """
+
+    payloads = []
+    for i in range(n_sessions):
+        sess = benchmark_session(n_acquisitions, n_items)
+        sess.sess_uid = 'CHRONIC-z_m10g8_20-2021-03-10-%06d' % i
+        payloads.append(sess.SerializeToString())
+
+    def messages():
+        sessions = []
+        for data in payloads:
+            sess = metadata_pb2.Session()
+            sess.ParseFromString(data)
+            sessions.append(sess)
+        return sessions
+
+    sessions = messages()
+    results = {}
+    for name, build in [('protobuf Session', messages),
+                        ('MessageToDict', lambda: [session_to_dict(s) for s in sessions]),
+                        ('SessionView', lambda: sessions_to_views(sessions))]:
+        _, size, seconds = measure(build)
+        results[name] = (size / 1e6, seconds)
+    return results
+
+
+if __name__ == '__main__':
+    for name, (mb, seconds) in benchmark_memory().items():
+        print('%-20s %8.1f MB %8.2f s' % (name, mb, seconds))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""Low-level helpers for the protobuf wire format of Birdsong Project metadata
+
+These functions walk serialized messages field by field without building message objects, so that
+callers can skip, slice or compare submessages directly on the bytes.
+"""
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+WIRETYPE_VARINT = 0
+WIRETYPE_FIXED64 = 1
+WIRETYPE_LENGTH_DELIMITED = 2
+WIRETYPE_FIXED32 = 5
+
+
+class WireError(ValueError):
+
+    """ Raised when serialized bytes do not follow the protobuf wire format """
+
+
+def decode_varint(data, pos):
+    """ Decode a base 128 varint
+
+    Parameters
+    ----------
+    data : bytes or memoryview
+        Serialized message
+    pos : int
+        Offset of the first byte of the varint
+
+    Returns
+    -------
+    (int, int)
+        The decoded value and the offset right after the varint
+    """
+
+    result = 0
+    shift = 0
+    end = len(data)
+    while True:
+        if pos >= end:
+            raise WireError('Truncated varint')
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise WireError('Varint too long')
+
+
+def encode_varint(value):
+    """ Encode a non-negative integer as a base 128 varint """
+
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_tag(field_number, wire_type):
+    """ Encode the key (tag) that precedes a field on the wire """
+
+    return encode_varint((field_number << 3) | wire_type)
+
+
+def iter_fields(data, start=0, end=None):
+    """ Iterate over the top-level fields of a serialized message
+
+    Parameters
+    ----------
+    data : bytes or memoryview
+        Serialized message
+    start : int
+        Offset where the message starts
+    end : int
+        Offset where the message ends (defaults to len(data))
+
+    Yields
+    ------
+    (int, int, int, int, int)
+        field_number, wire_type, offset of the tag, offset of the value and offset right after the field.
+        For length-delimited fields the value offset points past the length prefix, at the payload
+    """
+
+    pos = start
+    end = len(data) if end is None else end
+    while pos < end:
+        tag_pos = pos
+        key, pos = decode_varint(data, pos)
+        field_number, wire_type = key >> 3, key & 7
+        if field_number == 0:
+            raise WireError('Invalid field number 0 at offset %d' % tag_pos)
+        if wire_type == WIRETYPE_VARINT:
+            value_pos = pos
+            _, pos = decode_varint(data, pos)
+        elif wire_type == WIRETYPE_LENGTH_DELIMITED:
+            length, value_pos = decode_varint(data, pos)
+            pos = value_pos + length
+        elif wire_type == WIRETYPE_FIXED32:
+            value_pos = pos
+            pos += 4
+        elif wire_type == WIRETYPE_FIXED64:
+            value_pos = pos
+            pos += 8
+        else:
+            raise WireError('Unsupported wire type %d at offset %d' % (wire_type, tag_pos))
+        if pos > end:
+            raise WireError('Truncated field %d at offset %d' % (field_number, tag_pos))
+        yield field_number, wire_type, tag_pos, value_pos, pos
+
+
+def check_message(data, descriptor, start=0, end=None, allow_unknown=False):
+    """ Check that serialized bytes are a structurally valid encoding of a message type
+
+    Nested messages are checked recursively. Unlike ParseFromString, fields whose wire type does not match
+    the descriptor are reported instead of being kept as unknown fields.
+
+    Parameters
+    ----------
+    data : bytes or memoryview
+        Serialized message
+    descriptor : google.protobuf.descriptor.Descriptor
+        Expected message type, e.g. metadata_pb2.Session.DESCRIPTOR
+    start, end : int
+        Span of the message inside data
+    allow_unknown : bool
+        Accept (well-framed) fields that are not in the descriptor, e.g. fields added by a newer
+        metadata.proto
+
+    Raises
+    ------
+    WireError
+        Describing the first problem found
+    """
+
+    fields = descriptor.fields_by_number
+    for number, wire_type, tag_pos, value_pos, field_end in iter_fields(data, start, end):
+        field = fields.get(number)
+        if field is None:
+            if allow_unknown:
+                continue
+            raise WireError('Unknown field %d in %s at offset %d' % (number, descriptor.name, tag_pos))
+        if field.message_type is not None:
+            if wire_type != WIRETYPE_LENGTH_DELIMITED:
+                raise WireError('Wrong wire type for %s at offset %d' % (field.full_name, tag_pos))
+            check_message(data, field.message_type, value_pos, field_end, allow_unknown)
+        elif field.type in (field.TYPE_STRING, field.TYPE_BYTES):
+            if wire_type != WIRETYPE_LENGTH_DELIMITED:
+                raise WireError('Wrong wire type for %s at offset %d' % (field.full_name, tag_pos))
+            if field.type == field.TYPE_STRING:
+                try:
+                    bytes(data[value_pos:field_end]).decode('utf-8')
+                except UnicodeDecodeError:
+                    raise WireError('Invalid UTF-8 in %s at offset %d' % (field.full_name, tag_pos))
+        else:
+            # Numeric fields: the expected wire type, or length-delimited when a repeated field is packed
+            if field.type in (field.TYPE_FLOAT, field.TYPE_FIXED32, field.TYPE_SFIXED32):
+                expected = WIRETYPE_FIXED32
+            elif field.type in (field.TYPE_DOUBLE, field.TYPE_FIXED64, field.TYPE_SFIXED64):
+                expected = WIRETYPE_FIXED64
+            else:
+                expected = WIRETYPE_VARINT
+            packed = field.label == field.LABEL_REPEATED and wire_type == WIRETYPE_LENGTH_DELIMITED
+            if wire_type != expected and not packed:
+                raise WireError('Wrong wire type for %s at offset %d' % (field.full_name, tag_pos))
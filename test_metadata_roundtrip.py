@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+"""Round trips of random sessions through every export / import path (see metadata_roundtrip)
+
+Usage:
+    python -m pytest test_metadata_roundtrip.py
+"""
+
+from metadata_roundtrip import PATHS, random_sessions, run_roundtrips
+
+
+__author__ = "Pablo M. Tostado"
+__copyright__ = "Copyright 2021, Pablo Tostado"
+__credits__ = [""]
+__license__ = "Apache 2.0"
+__version__ = "1.0.0"
+__maintainer__ = "Pablo Tostado"
+__email__ = "patostad@eng.ucsd.edu"
+__status__ = "Production"
+
+
+N_SESSIONS = 30
+
+
+def test_random_sessions_carry_datafiles():
+    sessions = random_sessions(N_SESSIONS)
+    assert any(acquisition.datafiles for sess in sessions for acquisition in sess.acquisitions)
+
+
+def test_run_roundtrips():
+    results = run_roundtrips(n_sessions=N_SESSIONS)
+    assert set(PATHS) <= set(results)
+    failures = {name: result['failures'] for name, result in results.items() if result['failures']}
+    assert not failures
+
+
+def test_run_roundtrips_other_seed():
+    results = run_roundtrips(n_sessions=N_SESSIONS, seed=1)
+    failures = {name: result['failures'] for name, result in results.items() if result['failures']}
+    assert not failures